@@ -1,17 +1,76 @@
 from aws_cdk import (
+    aws_iam as iam,
     aws_s3 as s3,
     RemovalPolicy,
 )
 from constructs import Construct
+from typing import Dict
 
 class SystemTestsBucket(Construct):
 
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, transfer_acceleration: bool = False, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # Create S3 bucket for system tests
         self.bucket = s3.Bucket(
             self, "SystemTestsBucket",
             removal_policy=RemovalPolicy.DESTROY,
-            auto_delete_objects=True
-        )
\ No newline at end of file
+            auto_delete_objects=True,
+            # Lets runners in other regions read apps over the acceleration endpoints
+            transfer_acceleration=transfer_acceleration
+        )
+
+
+class SystemTestsDependenciesBucket(Construct):
+    """Split dependency archives that the test specs download node_modules/ from.
+
+    By default the bucket is private and runners pre-sign each archive. That URL
+    differs on every runner and expires with the runner's credentials, so specs
+    are not reused across runs and a run queued in Device Farm for longer than the
+    credentials last fails to fetch its dependencies.
+
+    With public_read, archives (named after their SHA-256) are fetched through a
+    plain object URL that only changes with the dependencies, so specs are reused
+    and never expire. The price is that anyone who learns a hash can download that
+    dependency tree, and the deployment fails in accounts that enforce account-level
+    Block Public Access. The bucket itself can never be listed.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, public_read: bool = False, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        self.public_read = public_read
+
+        self.bucket = s3.Bucket(
+            self, "SystemTestsDependenciesBucket",
+            removal_policy=RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+            # Public reads only ever come from the policy below, never from ACLs
+            block_public_access=s3.BlockPublicAccess(
+                block_public_acls=True,
+                ignore_public_acls=True,
+                block_public_policy=False,
+                restrict_public_buckets=False
+            ) if public_read else s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True
+        )
+        if public_read:
+            self.bucket.add_to_resource_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    principals=[iam.AnyPrincipal()],
+                    actions=["s3:GetObject"],
+                    resources=[self.bucket.arn_for_objects("*.zip")]
+                )
+            )
+
+
+def dependencies_environment(dependencies: SystemTestsDependenciesBucket) -> Dict[str, str]:
+    """Runner settings that stage dependency archives in the bucket.
+
+    Test specs point at the plain object URL when the bucket is public, and at a
+    pre-signed URL otherwise.
+    """
+    environment = {"DEPENDENCIES_BUCKET": dependencies.bucket.bucket_name}
+    if dependencies.public_read:
+        environment["DEPENDENCIES_BASE_URL"] = f"https://{dependencies.bucket.bucket_regional_domain_name}"
+    return environment
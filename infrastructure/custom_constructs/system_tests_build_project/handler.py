@@ -2,7 +2,10 @@ import json
 import os
 import logging
 import boto3
+import shutil
 import subprocess
+import sys
+import tempfile
 import time
 from datetime import datetime
 from typing import Dict, Any, Optional
@@ -14,6 +17,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Checked out test suite; shared modules such as the downloader and transfer layer are imported from it
+TEST_SUITE_DIR = "/tmp/codebuild-workspace/test-suite"
+
+def _import_from_test_suite():
+    """Make the test suite's modules importable"""
+    if TEST_SUITE_DIR not in sys.path:
+        sys.path.insert(0, TEST_SUITE_DIR)
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Main entry point for Device Farm test execution"""
     try:
@@ -63,6 +74,12 @@ class DeviceFarmTestRunner:
         
         if missing_vars:
             raise ValueError(f"Required environment variables not set: {', '.join(missing_vars)}")
+        
+        # Stream the test package from the packager straight into Device Farm
+        config['STREAM_TEST_PACKAGE'] = os.getenv('STREAM_TEST_PACKAGE', 'false')
+        # Ranged GETs used to fetch the app
+        config['DOWNLOAD_PART_SIZE_MB'] = os.getenv('DOWNLOAD_PART_SIZE_MB', '16')
+        config['DOWNLOAD_WORKERS'] = os.getenv('DOWNLOAD_WORKERS', '8')
             
         logger.info(f"Configuration loaded for app type: {config['APP_TYPE']}")
         return config
@@ -73,9 +90,11 @@ class DeviceFarmTestRunner:
         
         logger.info("Starting test execution workflow")
         
-        # 1. Build test suite
-        logger.info("Step 1: Building test suite")
-        test_package_path = self._build_test_suite()
+        # 1. Build test suite (deferred to step 4 when streaming it)
+        stream_package = self.config['STREAM_TEST_PACKAGE'].strip().lower() in ('1', 'true', 'yes', 'on')
+        if not stream_package:
+            logger.info("Step 1: Building test suite")
+            test_package_path = self._build_test_suite()
         
         # 2. Download app from S3
         logger.info("Step 2: Downloading app from S3")
@@ -86,11 +105,17 @@ class DeviceFarmTestRunner:
         
         # 4. Upload app to Device Farm
         logger.info("Step 3: Uploading app to Device Farm")
-        app_upload_arn = self._upload_to_device_farm(app_file_path, 'app', project_arn, timestamp)
+        try:
+            app_upload_arn = self._upload_to_device_farm(app_file_path, 'app', project_arn, timestamp)
+        finally:
+            shutil.rmtree(os.path.dirname(app_file_path), ignore_errors=True)
         
         # 5. Upload test package to Device Farm
         logger.info("Step 4: Uploading test package to Device Farm")
-        test_upload_arn = self._upload_to_device_farm(test_package_path, 'test', project_arn, timestamp)
+        if stream_package:
+            test_upload_arn = self._stream_test_suite_to_device_farm(project_arn, timestamp)
+        else:
+            test_upload_arn = self._upload_to_device_farm(test_package_path, 'test', project_arn, timestamp)
         
         # 6. Schedule test run
         logger.info("Step 5: Scheduling test run")
@@ -100,56 +125,98 @@ class DeviceFarmTestRunner:
         return run_result
     
     def _build_test_suite(self) -> str:
-        """Build test suite using existing build script"""
-        logger.info("Building test suite using build-and-zip.sh")
+        """Build test suite with the incremental, deterministic packager"""
+        logger.info("Building test suite using packager.py")
         
         # Change to test suite directory
-        test_suite_dir = "/tmp/codebuild-workspace/test-suite"
+        test_suite_dir = TEST_SUITE_DIR
+        if not os.path.exists(test_suite_dir):
+            raise FileNotFoundError(f"Test suite directory not found: {test_suite_dir}")
+        
+        # Run the packager; stages whose inputs are unchanged since the last build are skipped
+        self._run_packager(test_suite_dir, [])
+        
+        # Check if the zip file was created
+        zip_path = os.path.join(test_suite_dir, "system_tests.zip")
+        if not os.path.exists(zip_path):
+            raise FileNotFoundError("system_tests.zip not found after build")
+        
+        logger.info("Test suite built successfully")
+        return zip_path
+    
+    def _stream_test_suite_to_device_farm(self, project_arn: str, timestamp: str) -> str:
+        """Package the test suite straight into a Device Farm upload, without a zip on disk"""
+        test_suite_dir = TEST_SUITE_DIR
         if not os.path.exists(test_suite_dir):
             raise FileNotFoundError(f"Test suite directory not found: {test_suite_dir}")
         
-        # Run the build script
-        build_script = os.path.join(test_suite_dir, "scripts", "build-and-zip.sh")
-        if not os.path.exists(build_script):
-            raise FileNotFoundError(f"Build script not found: {build_script}")
+        try:
+            response = self.devicefarm_client.create_upload(
+                projectArn=project_arn,
+                name=f"tests-{timestamp}",
+                type="APPIUM_NODE_TEST_PACKAGE"
+            )
+            
+            upload_arn = response['upload']['arn']
+            logger.info(f"Created test upload with ARN: {upload_arn}")
+            
+            self._run_packager(test_suite_dir, ["--upload-url", response['upload']['url']])
+            logger.info("Test package streamed successfully")
+            
+            # Wait for upload to be processed
+            self._wait_for_upload_processing(upload_arn)
+            
+            return upload_arn
+            
+        except Exception as e:
+            logger.error(f"Failed to stream test package to Device Farm: {str(e)}")
+            raise
+    
+    def _run_packager(self, test_suite_dir: str, args: list):
+        """Run packager.py from the test suite directory"""
+        packager = os.path.join(test_suite_dir, "packager.py")
+        if not os.path.exists(packager):
+            raise FileNotFoundError(f"Packager not found: {packager}")
         
         result = subprocess.run(
-            ["bash", build_script],
+            [sys.executable, packager] + args,
             cwd=test_suite_dir,
             capture_output=True,
             text=True
         )
         
         if result.returncode != 0:
-            logger.error(f"Build script failed with return code {result.returncode}")
+            logger.error(f"Packager failed with return code {result.returncode}")
             logger.error(f"STDOUT: {result.stdout}")
             logger.error(f"STDERR: {result.stderr}")
             raise RuntimeError(f"Test suite build failed: {result.stderr}")
-        
-        # Check if the zip file was created
-        zip_path = os.path.join(test_suite_dir, "system_tests.zip")
-        if not os.path.exists(zip_path):
-            raise FileNotFoundError("system_tests.zip not found after build")
-        
-        logger.info("Test suite built successfully")
-        return zip_path
     
     def _download_app(self) -> str:
-        """Download app file from S3"""
+        """Download app file from S3 with parallel ranged GETs, verified against S3's checksum"""
         logger.info(f"Downloading app from s3://{self.config['S3_BUCKET']}/{self.config['APP_FILE_PATH']}")
         
-        local_app_path = "/tmp/app_file"
+        _import_from_test_suite()
+        from s3_download import RangedDownloader
+        
+        # A directory per run, so concurrent builds on one host never share the file
+        local_app_path = os.path.join(
+            tempfile.mkdtemp(prefix='devicefarm-app-'), os.path.basename(self.config['APP_FILE_PATH'])
+        )
         
         try:
-            self.s3_client.download_file(
-                self.config['S3_BUCKET'],
-                self.config['APP_FILE_PATH'],
-                local_app_path
+            download = RangedDownloader(
+                self.s3_client,
+                part_size=int(float(self.config['DOWNLOAD_PART_SIZE_MB']) * 1024 * 1024),
+                workers=int(self.config['DOWNLOAD_WORKERS'])
+            ).download(self.config['S3_BUCKET'], self.config['APP_FILE_PATH'], local_app_path)
+            logger.info(
+                f"App downloaded successfully to {local_app_path} "
+                f"({download['bytes'] / (1024*1024):.2f} MB at {download['throughput_mbps']} MB/s)"
             )
-            logger.info(f"App downloaded successfully to {local_app_path}")
             return local_app_path
         except Exception as e:
             logger.error(f"Failed to download app from S3: {str(e)}")
+            shutil.rmtree(os.path.dirname(local_app_path), ignore_errors=True)
             raise
     
     def _get_project_arn(self) -> str:
@@ -194,13 +261,15 @@ class DeviceFarmTestRunner:
             
             logger.info(f"Created {upload_type} upload with ARN: {upload_arn}")
             
-            # Upload file using pre-signed URL
-            with open(file_path, 'rb') as f:
-                import requests
-                response = requests.put(upload_url, data=f)
-                response.raise_for_status()
+            # Upload file using pre-signed URL, over a pooled session that retries transient failures
+            _import_from_test_suite()
+            from transfer import PresignedUploader, create_session
+            put = PresignedUploader(create_session()).put(upload_url, file_path, label=upload_name)
             
-            logger.info(f"{upload_type.capitalize()} uploaded successfully")
+            logger.info(
+                f"{upload_type.capitalize()} uploaded successfully "
+                f"({put['bytes'] / (1024*1024):.2f} MB at {put['throughput_mbps']} MB/s, {put['attempts']} attempt(s))"
+            )
             
             # Wait for upload to be processed
             self._wait_for_upload_processing(upload_arn)
@@ -2,18 +2,35 @@ import os
 from aws_cdk import (
     aws_codebuild as codebuild,
     aws_iam as iam,
+    Duration,
 )
 from constructs import Construct
+from typing import Dict, Optional
 
 class SystemTestsBuildProject(Construct):
 
-    def __init__(self, scope: Construct, construct_id: str, android_project_arn: str, ios_project_arn: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, android_project_arn: str, ios_project_arn: str,
+                 prestaged_uploads: Optional[str] = None,
+                 runner_settings: Optional[Dict[str, str]] = None, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # Uploads processed at deploy time, reused by runs whose package and spec match
+        prestaged_environment = {}
+        if prestaged_uploads:
+            prestaged_environment["PRESTAGED_UPLOADS"] = codebuild.BuildEnvironmentVariable(value=prestaged_uploads)
+
+        # Settings shared with the pre-staging, such as where dependency archives are staged
+        for name, value in (runner_settings or {}).items():
+            prestaged_environment[name] = codebuild.BuildEnvironmentVariable(value=value)
+
         # Create CodeBuild project with custom image
         self.project = codebuild.Project(
             self, "SystemTestsBuildProject",
             project_name="system-tests-build-project",
+            # Leave room for the runner to wait for the Device Farm run (RUN_TIMEOUT)
+            timeout=Duration.hours(3),
+            # Bounds how long the scheduler's slot lease must cover a build waiting to start
+            queued_timeout=Duration.hours(1),
             build_spec=codebuild.BuildSpec.from_object({
                 "version": "0.2",
                 "phases": {
@@ -25,8 +42,8 @@ class SystemTestsBuildProject(Construct):
                             "ls -la",
                             # Verify Python and dependencies
                             "python3 --version",
-                            "python3 -c 'import boto3; print(\"boto3 available\")'",
-                            "python3 -c 'import requests; print(\"requests available\")'",
+                            # One interpreter start instead of one per module
+                            "python3 -c 'import boto3, requests; print(\"boto3 and requests available\")'",
                             # Show environment for debugging
                             "echo 'Environment variables:'",
                             "echo 'ANDROID_PROJECT_ARN='$ANDROID_PROJECT_ARN",
@@ -60,6 +77,23 @@ class SystemTestsBuildProject(Construct):
                     "IOS_PROJECT_ARN": codebuild.BuildEnvironmentVariable(
                         value=ios_project_arn
                     ),
+                    # Overlap the S3 download, uploads and processing waits
+                    "CONCURRENT_EXECUTION": codebuild.BuildEnvironmentVariable(
+                        value="true"
+                    ),
+                    # Pipe the app from S3 into Device Farm without staging it in /tmp
+                    "STREAMING_TRANSFER": codebuild.BuildEnvironmentVariable(
+                        value="true"
+                    ),
+                    # Wait for the run so the build passes or fails on the test outcome
+                    "MONITOR_RUN": codebuild.BuildEnvironmentVariable(
+                        value="true"
+                    ),
+                    # Store artifacts and parsed JUnit results under results/ once the run finishes
+                    "INGEST_RESULTS": codebuild.BuildEnvironmentVariable(
+                        value="true"
+                    ),
+                    **prestaged_environment,
                     # Dynamic variables will be provided by the S3 Lambda trigger:
                     # - S3_BUCKET
                     # - APP_FILE_PATH  
@@ -77,14 +111,22 @@ class SystemTestsBuildProject(Construct):
                     "devicefarm:ListProjects",
                     "devicefarm:CreateUpload", 
                     "devicefarm:GetUpload",
+                    "devicefarm:ListUploads",
                     "devicefarm:ScheduleRun",
                     "devicefarm:GetRun",
                     "devicefarm:ListRuns",
+                    "devicefarm:ListJobs",
+                    "devicefarm:ListSuites",
+                    "devicefarm:ListTests",
+                    "devicefarm:ListArtifacts",
                     "devicefarm:ListDevicePools",
                     "devicefarm:GetDevicePool",
                     # S3 permissions for downloading app files
                     "s3:GetObject",
-                    "s3:ListBucket"
+                    "s3:ListBucket",
+                    # ...and for picking the bucket's region and acceleration endpoint
+                    "s3:GetBucketLocation",
+                    "s3:GetAccelerateConfiguration"
                 ],
                 resources=["*"]
             )
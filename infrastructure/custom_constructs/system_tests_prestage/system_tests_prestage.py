@@ -0,0 +1,80 @@
+import os
+from aws_cdk import (
+    aws_ecr_assets as ecr_assets,
+    aws_iam as iam,
+    aws_lambda as _lambda,
+    custom_resources as cr,
+    CustomResource,
+    Duration,
+    Stack,
+)
+from constructs import Construct
+from typing import Dict, Optional
+
+class SystemTestsPrestage(Construct):
+    """Uploads the test package and test specs to Device Farm once per deployment.
+
+    A custom resource runs prestage.py from the same test-suite image the runners
+    use, so the pre-staged package is byte-identical to the one they would upload.
+    The image asset hash is a resource property: any change to the test suite
+    re-runs the pre-staging and publishes new ARNs through `prestaged_uploads`.
+
+    runner_settings are the settings the runners are deployed with that shape the
+    test spec; the spec is rendered from them so the pre-staged one matches theirs.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, android_project_arn: str, ios_project_arn: str,
+                 runner_settings: Optional[Dict[str, str]] = None, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self.image = ecr_assets.DockerImageAsset(
+            self, "TestSuiteImage",
+            directory=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "test-suite")
+        )
+
+        self.function = _lambda.DockerImageFunction(
+            self, "PrestageFunction",
+            code=_lambda.DockerImageCode.from_ecr(
+                self.image.repository,
+                tag_or_digest=self.image.image_tag,
+                # The image is a plain Node.js/Python image, so run the Lambda runtime client explicitly
+                entrypoint=["python3", "-m", "awslambdaric"],
+                cmd=["prestage.on_event"],
+                working_directory="/workspace/test-suite"
+            ),
+            memory_size=1024,
+            # Waits for Device Farm to process the package
+            timeout=Duration.minutes(15)
+        )
+        self.function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "devicefarm:CreateUpload",
+                    "devicefarm:GetUpload",
+                    "devicefarm:ListUploads",
+                    # Stages the dependency archive through a client for its bucket's region
+                    "s3:GetBucketLocation"
+                ],
+                resources=["*"]
+            )
+        )
+
+        provider = cr.Provider(self, "PrestageProvider", on_event_handler=self.function)
+        self.resource = CustomResource(
+            self, "PrestagedUploads",
+            service_token=provider.service_token,
+            properties={
+                "Projects": Stack.of(self).to_json_string({
+                    "android": android_project_arn,
+                    "ios": ios_project_arn
+                }),
+                "TestSuiteHash": self.image.asset_hash,
+                "RunnerSettings": Stack.of(self).to_json_string(runner_settings or {})
+            }
+        )
+
+    @property
+    def prestaged_uploads(self) -> str:
+        """JSON list of pre-staged uploads, for the runner's PRESTAGED_UPLOADS"""
+        return self.resource.get_att_string("Uploads")
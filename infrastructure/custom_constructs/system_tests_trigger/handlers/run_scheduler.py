@@ -0,0 +1,429 @@
+"""
+Admission control between the trigger and the runners, by Device Farm device slots.
+
+Every run request is queued first. Runs are admitted while their platforms have
+free slots and the rest wait: the least recently served app goes next, taking
+its oldest request that fits, so one app's release-week burst cannot starve
+another's. An admitted run holds a lease on its slots until its build finishes,
+or until the lease expires if that event is lost.
+
+The queue and the slot limits are pluggable: DynamoDbRunStore and
+DeviceFarmSlotSource back the Lambda, InMemoryRunStore and StaticSlotSource
+stand in for them offline, as in the simulation below.
+
+Usage:
+    python3 run_scheduler.py [--apps 4] [--runs 24] [--slots IOS=2,ANDROID=3] [--run-minutes 20]
+                             [--arrival-minutes 1] [--seed 1]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+PLATFORMS = ('ANDROID', 'IOS')
+
+
+def new_request(app: str, platforms: Dict[str, int], payload: Dict[str, Any],
+                enqueued_at: Optional[float] = None) -> Dict[str, Any]:
+    """A queued run: which app it tests, the slots it needs per platform and what to dispatch"""
+    enqueued_at = time.time() if enqueued_at is None else enqueued_at
+    request_id = str(uuid.uuid4())
+    return {
+        'id': request_id,
+        'position': f"{enqueued_at:017.6f}#{request_id}",
+        'app': app,
+        'platforms': platforms,
+        'payload': payload,
+        'enqueued_at': enqueued_at
+    }
+
+
+def fits(request: Dict[str, Any], usage: Dict[str, int], limits: Dict[str, int]) -> bool:
+    return all(usage.get(platform, 0) + slots <= limits.get(platform, 0)
+               for platform, slots in request['platforms'].items())
+
+
+def next_admissible(pending: List[Dict[str, Any]], served: Dict[str, float],
+                    usage: Dict[str, int], limits: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    """The oldest fitting request of the least recently served app that has one"""
+    by_app: Dict[str, List[Dict[str, Any]]] = {}
+    for request in sorted(pending, key=lambda request: request['position']):
+        by_app.setdefault(request['app'], []).append(request)
+
+    # Apps never served go first, then round-robin; ties go to the longest waiting app
+    for app in sorted(by_app, key=lambda app: (served.get(app, 0.0), by_app[app][0]['position'])):
+        for request in by_app[app]:
+            if fits(request, usage, limits):
+                return request
+    return None
+
+
+class RunScheduler:
+    """Admits queued runs up to the slot limits and dispatches them.
+
+    dispatch(request, lease_id) starts the run; if it raises, the slots are
+    released and the request goes back to its place in the queue.
+    """
+
+    def __init__(self, store: Any, slots: Any, dispatch: Callable[[Dict[str, Any], str], Any],
+                 lease_seconds: float = 4 * 3600, clock: Callable[[], float] = time.time):
+        self.store = store
+        self.slots = slots
+        self.dispatch = dispatch
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+    def submit(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Queue a run request, then admit whatever now fits.
+
+        A run needing more slots than a platform has waits for all of them rather
+        than forever; Device Farm queues the devices it cannot start.
+        """
+        limits = self.slots.limits()
+        capped = {platform: min(slots, limits.get(platform, 0)) or slots
+                  for platform, slots in request['platforms'].items()}
+        if capped != request['platforms']:
+            print(f"{request['app']} run {request['id']} needs {request['platforms']}, "
+                  f"more than the limits {limits}; holding {capped}")
+            request = dict(request, platforms=capped)
+        self.store.put_pending(request)
+        print(f"Queued {request['app']} run {request['id']} needing {request['platforms']}")
+        return self.drain()
+
+    def release(self, lease_id: str) -> List[Dict[str, Any]]:
+        """Free the slots of a finished run, then admit whatever now fits"""
+        lease = self.store.release(lease_id)
+        if lease:
+            print(f"Released {lease['platforms']} held by {lease['app']} run {lease_id}")
+        return self.drain()
+
+    def reconcile(self) -> List[Dict[str, Any]]:
+        """Expire leases whose finish event never arrived, then admit whatever now fits"""
+        for lease in self.store.expired_leases(self.clock()):
+            if self.store.release(lease['id']):
+                print(f"Lease of {lease['app']} run {lease['id']} expired, releasing {lease['platforms']}")
+        return self.drain()
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Admit and dispatch queued runs until none fits the free slots"""
+        admitted = []
+        limits = self.slots.limits()
+        for _ in range(1000):
+            pending = self.store.list_pending()
+            if not pending:
+                break
+            usage = self.store.usage()
+            request = next_admissible(pending, self.store.served(), usage, limits)
+            if request is None:
+                print(f"{len(pending)} run(s) waiting for slots: in use {usage}, limits {limits}")
+                break
+            # Another invocation may have taken the slots or the request in between
+            if not self.store.admit(request, limits, self.clock(), self.clock() + self.lease_seconds):
+                continue
+
+            try:
+                self.dispatch(request, request['id'])
+            except Exception as e:
+                print(f"Failed to dispatch {request['app']} run {request['id']}, requeueing: {str(e)}")
+                self.store.release(request['id'])
+                self.store.put_pending(request)
+                break
+            print(f"Admitted {request['app']} run {request['id']} after "
+                  f"{self.clock() - request['enqueued_at']:.0f} s in the queue")
+            admitted.append(request)
+        return admitted
+
+
+class StaticSlotSource:
+    """Fixed slot limits per platform"""
+
+    def __init__(self, limits: Dict[str, int]):
+        self._limits = dict(limits)
+
+    def limits(self) -> Dict[str, int]:
+        return dict(self._limits)
+
+
+class DeviceFarmSlotSource:
+    """Slot limits from the account's Device Farm settings.
+
+    Platforms with purchased unmetered slots are limited to those; the others
+    fall back to the configured defaults, which stand for the metered
+    concurrency the account allows. The settings are cached for ttl_seconds.
+    """
+
+    def __init__(self, devicefarm_client: Any, defaults: Dict[str, int], ttl_seconds: float = 300):
+        self.devicefarm_client = devicefarm_client
+        self.defaults = dict(defaults)
+        self.ttl_seconds = ttl_seconds
+        self._cached: Optional[Dict[str, int]] = None
+        self._fetched_at = 0.0
+
+    def limits(self) -> Dict[str, int]:
+        if self._cached is None or time.monotonic() - self._fetched_at > self.ttl_seconds:
+            limits = dict(self.defaults)
+            try:
+                settings = self.devicefarm_client.get_account_settings()['accountSettings']
+                for platform, slots in (settings.get('unmeteredDevices') or {}).items():
+                    if slots:
+                        limits[platform] = slots
+            except Exception as e:
+                print(f"Could not read Device Farm account settings, using default slots: {str(e)}")
+            self._cached = limits
+            self._fetched_at = time.monotonic()
+        return dict(self._cached)
+
+
+class InMemoryRunStore:
+    """Queue, leases and slot usage in process memory, for offline use"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._leases: Dict[str, Dict[str, Any]] = {}
+        self._usage: Dict[str, int] = {}
+        self._served: Dict[str, float] = {}
+
+    def put_pending(self, request: Dict[str, Any]):
+        with self._lock:
+            self._pending[request['id']] = request
+
+    def list_pending(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._pending.values())
+
+    def usage(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._usage)
+
+    def served(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._served)
+
+    def admit(self, request: Dict[str, Any], limits: Dict[str, int], now: float, expires_at: float) -> bool:
+        with self._lock:
+            if request['id'] not in self._pending or not fits(request, self._usage, limits):
+                return False
+            del self._pending[request['id']]
+            for platform, slots in request['platforms'].items():
+                self._usage[platform] = self._usage.get(platform, 0) + slots
+            self._leases[request['id']] = dict(request, expires_at=expires_at)
+            self._served[request['app']] = now
+            return True
+
+    def release(self, lease_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+            if lease:
+                for platform, slots in lease['platforms'].items():
+                    self._usage[platform] -= slots
+            return lease
+
+    def expired_leases(self, now: float) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [lease for lease in self._leases.values() if lease['expires_at'] <= now]
+
+
+class DynamoDbRunStore:
+    """Queue, leases and slot usage in one DynamoDB table keyed by pk and sk.
+
+    pk 'pending' holds the queue ordered by position, 'lease' the admitted runs,
+    'usage' one slot counter per platform and 'served' when each app was last
+    admitted. Admission is a single transaction whose conditions only let the
+    counters grow up to the limits, so concurrent invocations cannot over-admit
+    or admit one request twice.
+    """
+
+    def __init__(self, dynamodb_client: Any, table_name: str):
+        self.dynamodb = dynamodb_client
+        self.table_name = table_name
+
+    def put_pending(self, request: Dict[str, Any]):
+        self.dynamodb.put_item(TableName=self.table_name, Item={
+            'pk': {'S': 'pending'},
+            'sk': {'S': request['position']},
+            'request': {'S': json.dumps(request)}
+        })
+
+    def list_pending(self) -> List[Dict[str, Any]]:
+        return [json.loads(item['request']['S']) for item in self._query('pending')]
+
+    def usage(self) -> Dict[str, int]:
+        return {item['sk']['S']: int(item['in_use']['N']) for item in self._query('usage')}
+
+    def served(self) -> Dict[str, float]:
+        return {item['sk']['S']: float(item['at']['N']) for item in self._query('served')}
+
+    def admit(self, request: Dict[str, Any], limits: Dict[str, int], now: float, expires_at: float) -> bool:
+        # The conditions below let a missing counter through, so a request larger than its limit stops here
+        if not fits(request, {}, limits):
+            return False
+        items = [
+            {
+                'Update': {
+                    'TableName': self.table_name,
+                    'Key': {'pk': {'S': 'usage'}, 'sk': {'S': platform}},
+                    'UpdateExpression': 'ADD in_use :slots',
+                    'ConditionExpression': 'attribute_not_exists(in_use) OR in_use <= :max',
+                    'ExpressionAttributeValues': {
+                        ':slots': {'N': str(slots)},
+                        ':max': {'N': str(limits.get(platform, 0) - slots)}
+                    }
+                }
+            }
+            for platform, slots in request['platforms'].items()
+        ]
+        items += [
+            {
+                'Delete': {
+                    'TableName': self.table_name,
+                    'Key': {'pk': {'S': 'pending'}, 'sk': {'S': request['position']}},
+                    'ConditionExpression': 'attribute_exists(pk)'
+                }
+            },
+            {
+                'Put': {
+                    'TableName': self.table_name,
+                    'Item': {
+                        'pk': {'S': 'lease'},
+                        'sk': {'S': request['id']},
+                        'request': {'S': json.dumps(dict(request, expires_at=expires_at))},
+                        'expires_at': {'N': str(int(expires_at))}
+                    }
+                }
+            },
+            {
+                'Put': {
+                    'TableName': self.table_name,
+                    'Item': {'pk': {'S': 'served'}, 'sk': {'S': request['app']}, 'at': {'N': str(now)}}
+                }
+            }
+        ]
+        try:
+            self.dynamodb.transact_write_items(TransactItems=items)
+            return True
+        except self.dynamodb.exceptions.TransactionCanceledException:
+            return False
+
+    def release(self, lease_id: str) -> Optional[Dict[str, Any]]:
+        item = self.dynamodb.get_item(
+            TableName=self.table_name,
+            Key={'pk': {'S': 'lease'}, 'sk': {'S': lease_id}},
+            ConsistentRead=True
+        ).get('Item')
+        if not item:
+            return None
+
+        lease = json.loads(item['request']['S'])
+        items = [
+            {
+                'Delete': {
+                    'TableName': self.table_name,
+                    'Key': {'pk': {'S': 'lease'}, 'sk': {'S': lease_id}},
+                    # Only one of concurrent releases of a lease gives its slots back
+                    'ConditionExpression': 'attribute_exists(pk)'
+                }
+            }
+        ]
+        items += [
+            {
+                'Update': {
+                    'TableName': self.table_name,
+                    'Key': {'pk': {'S': 'usage'}, 'sk': {'S': platform}},
+                    'UpdateExpression': 'ADD in_use :slots',
+                    'ExpressionAttributeValues': {':slots': {'N': str(-slots)}}
+                }
+            }
+            for platform, slots in lease['platforms'].items()
+        ]
+        try:
+            self.dynamodb.transact_write_items(TransactItems=items)
+            return lease
+        except self.dynamodb.exceptions.TransactionCanceledException:
+            return None
+
+    def expired_leases(self, now: float) -> List[Dict[str, Any]]:
+        return [
+            json.loads(item['request']['S']) for item in self._query('lease')
+            if float(item['expires_at']['N']) <= now
+        ]
+
+    def _query(self, pk: str) -> List[Dict[str, Any]]:
+        items = []
+        kwargs = {
+            'TableName': self.table_name,
+            'KeyConditionExpression': 'pk = :pk',
+            'ExpressionAttributeValues': {':pk': {'S': pk}},
+            'ConsistentRead': True
+        }
+        while True:
+            response = self.dynamodb.query(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def simulate(apps: int, runs: int, limits: Dict[str, int], run_minutes: float, arrival_minutes: float,
+             seed: int) -> Dict[str, Any]:
+    """Replay a burst of uploads against the in-memory stand-ins on a simulated clock"""
+    rng = random.Random(seed)
+    now = [0.0]
+    store = InMemoryRunStore()
+    finishing: List[tuple] = []
+    log: List[Dict[str, Any]] = []
+
+    def dispatch(request: Dict[str, Any], lease_id: str):
+        finishing.append((now[0] + run_minutes * 60 * rng.uniform(0.5, 1.5), lease_id))
+        log.append({'app': request['app'], 'wait_s': now[0] - request['enqueued_at']})
+
+    scheduler = RunScheduler(store, StaticSlotSource(limits), dispatch, clock=lambda: now[0])
+    # The first app uploads half of the burst, the rest share the other half
+    arrivals = sorted(
+        (rng.uniform(0, runs * arrival_minutes * 60),
+         'app-0' if index % 2 == 0 or apps < 2 else f"app-{1 + index // 2 % (apps - 1)}",
+         rng.choice(PLATFORMS))
+        for index in range(runs)
+    )
+    events = [(at, 'arrive', (app, platform)) for at, app, platform in arrivals]
+    while events or finishing:
+        events.sort(key=lambda event: event[0])
+        finishing.sort()
+        if finishing and (not events or finishing[0][0] <= events[0][0]):
+            now[0], lease_id = finishing.pop(0)
+            scheduler.release(lease_id)
+        else:
+            now[0], _, (app, platform) = events.pop(0)
+            scheduler.submit(new_request(app, {platform: 1}, {}, enqueued_at=now[0]))
+
+    waits: Dict[str, List[float]] = {}
+    for entry in log:
+        waits.setdefault(entry['app'], []).append(entry['wait_s'])
+    return {
+        'admitted': len(log),
+        'makespan_min': round(now[0] / 60, 1),
+        'mean_wait_min': {app: round(sum(values) / len(values) / 60, 1) for app, values in sorted(waits.items())}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', type=int, default=4, help='apps uploading builds')
+    parser.add_argument('--runs', type=int, default=24, help='run requests in the burst')
+    parser.add_argument('--slots', default='IOS=2,ANDROID=3', help='device slots per platform')
+    parser.add_argument('--run-minutes', type=float, default=20, help='mean run length')
+    parser.add_argument('--arrival-minutes', type=float, default=1, help='mean gap between uploads')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    limits = {name.strip().upper(): int(value) for name, value in
+              (pair.split('=') for pair in args.slots.split(',') if pair.strip())}
+    result = simulate(args.apps, args.runs, limits, args.run_minutes, args.arrival_minutes, args.seed)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,63 +1,417 @@
 import json
 import boto3
+import math
 import os
+import re
+import time
+import uuid
 from urllib.parse import unquote_plus
 
+from run_scheduler import DeviceFarmSlotSource, DynamoDbRunStore, RunScheduler, new_request
+
+VERSION_PATTERN = re.compile(r'\d+(?:\.\d+){1,3}')
+
+# SQS cannot delay a message for longer, so longer windows are closed in several hops
+MAX_FLUSH_DELAY_SECONDS = 900
+
+# How overdue a window must be before the sweep flushes it instead of its close message
+SWEEP_GRACE_SECONDS = 60
+
+# Clients live at module scope so warm invocations reuse them and their connections
+_clients = {}
+
+def get_client(service_name, region_name=None):
+    """Return a boto3 client that is created once per Lambda execution environment"""
+    if (service_name, region_name) not in _clients:
+        _clients[(service_name, region_name)] = boto3.client(service_name, region_name=region_name)
+    return _clients[(service_name, region_name)]
+
+# Slot limits are cached for a few minutes across warm invocations
+_slot_source = None
+
 def lambda_handler(event, context):
     """
-    Lambda handler that triggers CodeBuild when .ipa or .apk files are uploaded to S3
+    Lambda handler that triggers CodeBuild when .ipa or .apk files are uploaded to S3.
+
+    With WORKER_QUEUE_URL set, the run request goes to the worker service queue
+    instead of starting a CodeBuild build.
+
+    With COALESCE_WINDOW_SECONDS set, uploads are held for that window and grouped
+    by version or prefix, and the delayed SQS message that closes a window starts
+    one consolidated build for the whole group. A scheduled sweep flushes windows
+    whose close message never arrived.
+
+    Failures are raised, or reported per message for SQS batches, so that Lambda
+    retries the event instead of dropping it.
+
+    With SCHEDULER_TABLE_NAME set, builds are only started while Device Farm has
+    free device slots for their platforms; the rest wait in the scheduler's queue.
+    CodeBuild state-change events release the slots of finished builds, and a
+    scheduled event expires leases whose build never reported back.
     """
-    
-    codebuild = boto3.client('codebuild')
-    
+
+    codebuild = None if os.environ.get('WORKER_QUEUE_URL') else get_client('codebuild')
+
     try:
+        # Periodic sweep for coalescing windows that were never closed
+        if event.get('task') == 'flush_expired_groups':
+            flush_expired_groups(codebuild)
+            return {
+                'statusCode': 200,
+                'body': json.dumps('Successfully swept coalescing windows')
+            }
+
+        # A scheduled build finished, or the periodic reconcile is due
+        if event.get('source') == 'aws.codebuild':
+            return release_slots(codebuild, event)
+        if event.get('source') == 'aws.events':
+            get_scheduler(codebuild).reconcile()
+            return {
+                'statusCode': 200,
+                'body': json.dumps('Successfully reconciled scheduled runs')
+            }
+
+        records = event.get('Records', [])
+
+        # Delayed window-close messages from the coalescing queue
+        if records and records[0].get('eventSource') == 'aws:sqs':
+            failures = []
+            for record in records:
+                try:
+                    flush_group(codebuild, json.loads(record['body']))
+                except Exception as e:
+                    print(f"Failed to flush {record['body']}: {str(e)}")
+                    failures.append({'itemIdentifier': record['messageId']})
+
+            # Only the failed messages go back to the queue to be retried
+            return {'batchItemFailures': failures}
+
+        coalesce_window = int(os.environ.get('COALESCE_WINDOW_SECONDS', '0'))
+
         # Parse S3 event
-        for record in event['Records']:
+        for record in records:
             bucket = record['s3']['bucket']['name']
             key = unquote_plus(record['s3']['object']['key'])
-            
+
             print(f"File uploaded: {key} to bucket: {bucket}")
-            
+
             # Check if file is .ipa or .apk
             if key.lower().endswith(('.ipa', '.apk')):
                 print(f"Detected mobile app file: {key}")
-                
-                # Get CodeBuild project name from environment variable
-                project_name = os.environ['CODEBUILD_PROJECT_NAME']
-                
-                # Trigger CodeBuild
-                response = codebuild.start_build(
-                    projectName=project_name,
-                    environmentVariablesOverride=[
-                        {
-                            'name': 'S3_BUCKET',
-                            'value': bucket
-                        },
-                        {
-                            'name': 'APP_FILE_PATH',
-                            'value': key
-                        },
-                        {
-                            'name': 'APP_TYPE',
-                            'value': 'ios' if key.lower().endswith('.ipa') else 'android'
-                        }
-                    ]
-                )
-                
-                print(f"Started CodeBuild project: {project_name}")
-                print(f"Build ID: {response['build']['id']}")
-                
+
+                if coalesce_window > 0:
+                    hold_for_coalescing(bucket, key, coalesce_window)
+                else:
+                    dispatch_run(codebuild, bucket, [key])
+
             else:
                 print(f"Ignoring non-app file: {key}")
-                
+
         return {
             'statusCode': 200,
             'body': json.dumps('Successfully processed S3 event')
         }
-        
+
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps(f'Error processing event: {str(e)}')
-        }
\ No newline at end of file
+        # Lambda retries a failed asynchronous invocation, a returned error would be dropped
+        raise
+
+def app_type_for(key):
+    """Determine the app platform from the file extension"""
+    return 'ios' if key.lower().endswith('.ipa') else 'android'
+
+def group_key_for(key):
+    """Group uploads by the version in their key, or by their S3 prefix"""
+    prefix = os.path.dirname(key)
+
+    if os.environ.get('COALESCE_GROUP_BY', 'version') == 'version':
+        match = VERSION_PATTERN.search(os.path.basename(key)) or VERSION_PATTERN.search(key)
+        if match:
+            return f"version:{match.group(0)}"
+
+    return f"prefix:{prefix}"
+
+def app_name_for(key):
+    """The app a key belongs to: its file name without version or extension"""
+    name = os.path.splitext(os.path.basename(key))[0]
+    return VERSION_PATTERN.sub('', name).strip(' -_.v') or name
+
+def dispatch_run(codebuild, bucket, keys):
+    """Hand the apps in keys to the worker service if one is configured, else to CodeBuild"""
+    if os.environ.get('WORKER_QUEUE_URL'):
+        return enqueue_run(bucket, keys)
+    if os.environ.get('SCHEDULER_TABLE_NAME'):
+        return schedule_build(codebuild, bucket, keys)
+    return start_build(codebuild, bucket, keys)
+
+def get_scheduler(codebuild):
+    """Scheduler over the DynamoDB queue and the account's Device Farm slots"""
+    global _slot_source
+    if _slot_source is None:
+        _slot_source = DeviceFarmSlotSource(
+            # Device Farm only runs in us-west-2
+            get_client('devicefarm', 'us-west-2'),
+            json.loads(os.environ.get('SCHEDULER_DEFAULT_SLOTS', '{}'))
+        )
+
+    def dispatch(request, lease_id):
+        start_build(codebuild, request['payload']['bucket'], request['payload']['keys'], lease_id)
+
+    return RunScheduler(
+        DynamoDbRunStore(get_client('dynamodb'), os.environ['SCHEDULER_TABLE_NAME']),
+        _slot_source,
+        dispatch,
+        lease_seconds=int(os.environ.get('SCHEDULER_LEASE_SECONDS', '14400'))
+    )
+
+def schedule_build(codebuild, bucket, keys):
+    """Queue a build for the apps in keys, starting it now if their platforms have free slots.
+
+    Every app in the build runs on its own, so the build needs the devices of one
+    run (SCHEDULER_DEVICES_PER_RUN) per app of each platform.
+    """
+    devices_per_run = json.loads(os.environ.get('SCHEDULER_DEVICES_PER_RUN') or '{}')
+    platforms = {}
+    for key in keys:
+        platform = app_type_for(key).upper()
+        platforms[platform] = platforms.get(platform, 0) + devices_per_run.get(platform, 1)
+    app = '+'.join(sorted({app_name_for(key) for key in keys}))
+
+    return get_scheduler(codebuild).submit(
+        new_request(app, platforms, {'bucket': bucket, 'keys': keys})
+    )
+
+def release_slots(codebuild, event):
+    """Give back the slots of a finished build and start whatever now fits"""
+    detail = event.get('detail', {})
+    variables = detail.get('additional-information', {}).get('environment', {}).get('environment-variables', [])
+    lease_id = next((variable['value'] for variable in variables if variable['name'] == 'SCHEDULER_LEASE_ID'), None)
+
+    if lease_id is None:
+        print(f"Build {detail.get('build-id')} was not started by the scheduler")
+    else:
+        print(f"Build {detail.get('build-id')} finished with {detail.get('build-status')}")
+        get_scheduler(codebuild).release(lease_id)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps('Successfully released build slots')
+    }
+
+def app_files_for(keys):
+    """Per-app settings for every app in keys"""
+    return [{'APP_FILE_PATH': key, 'APP_TYPE': app_type_for(key)} for key in keys]
+
+def enqueue_run(bucket, keys):
+    """Send one run request that tests every app in keys to the worker queue"""
+    # Same settings a build would get, with the first app as the single-app configuration
+    message = {
+        'S3_BUCKET': bucket,
+        'APP_FILE_PATH': keys[0],
+        'APP_TYPE': app_type_for(keys[0])
+    }
+    if len(keys) > 1:
+        message['APP_FILES'] = app_files_for(keys)
+
+    response = get_client('sqs').send_message(
+        QueueUrl=os.environ['WORKER_QUEUE_URL'],
+        MessageBody=json.dumps(message)
+    )
+
+    print(f"Queued run request for {len(keys)} app file(s)")
+    print(f"Message ID: {response['MessageId']}")
+    return response
+
+def start_build(codebuild, bucket, keys, lease_id=None):
+    """Start one CodeBuild build that tests every app in keys"""
+    # Get CodeBuild project name from environment variable
+    project_name = os.environ['CODEBUILD_PROJECT_NAME']
+
+    # The first app doubles as the single-app configuration older runners expect
+    app_files = app_files_for(keys)
+    environment = [
+        {
+            'name': 'S3_BUCKET',
+            'value': bucket
+        },
+        {
+            'name': 'APP_FILE_PATH',
+            'value': keys[0]
+        },
+        {
+            'name': 'APP_TYPE',
+            'value': app_type_for(keys[0])
+        }
+    ]
+    if len(keys) > 1:
+        environment.append({
+            'name': 'APP_FILES',
+            'value': json.dumps(app_files)
+        })
+    if lease_id:
+        # Comes back in the build's state-change events so its slots can be released
+        environment.append({
+            'name': 'SCHEDULER_LEASE_ID',
+            'value': lease_id
+        })
+
+    # Trigger CodeBuild
+    response = codebuild.start_build(
+        projectName=project_name,
+        environmentVariablesOverride=environment
+    )
+
+    print(f"Started CodeBuild project: {project_name} for {len(keys)} app file(s)")
+    print(f"Build ID: {response['build']['id']}")
+    return response
+
+def hold_for_coalescing(bucket, key, window_seconds):
+    """Add an upload to its group, opening a new coalescing window if none is open"""
+    dynamodb = get_client('dynamodb')
+    table_name = os.environ['COALESCE_TABLE_NAME']
+    group_key = group_key_for(key)
+
+    for _ in range(5):
+        # Join the open window, if there is one...
+        try:
+            dynamodb.update_item(
+                TableName=table_name,
+                Key={'group_key': {'S': group_key}},
+                UpdateExpression='ADD app_files :files',
+                ConditionExpression='attribute_exists(window_id)',
+                ExpressionAttributeValues={':files': {'SS': [key]}}
+            )
+            print(f"Added {key} to open coalescing group {group_key}")
+            return
+        except dynamodb.exceptions.ConditionalCheckFailedException:
+            pass
+
+        # ...or open one; exactly one concurrent invocation creates it, the others join
+        window_id = str(uuid.uuid4())
+        try:
+            dynamodb.put_item(
+                TableName=table_name,
+                Item={
+                    'group_key': {'S': group_key},
+                    'app_files': {'SS': [key]},
+                    'bucket_name': {'S': bucket},
+                    'window_id': {'S': window_id},
+                    'flush_after': {'N': str(int(time.time()) + window_seconds)}
+                },
+                ConditionExpression='attribute_not_exists(group_key)'
+            )
+            break
+        except dynamodb.exceptions.ConditionalCheckFailedException:
+            continue
+    else:
+        raise RuntimeError(f"Could not join or open a coalescing window for {group_key}")
+
+    try:
+        schedule_flush(group_key, window_id, window_seconds)
+    except Exception:
+        # Take the window back so the retried event opens it again, unless others joined it meanwhile
+        try:
+            dynamodb.delete_item(
+                TableName=table_name,
+                Key={'group_key': {'S': group_key}},
+                ConditionExpression='window_id = :window_id AND size(app_files) = :one',
+                ExpressionAttributeValues={':window_id': {'S': window_id}, ':one': {'N': '1'}}
+            )
+        except dynamodb.exceptions.ConditionalCheckFailedException:
+            print(f"Could not schedule the close of coalescing group {group_key}, leaving it to the sweep")
+            return
+        raise
+    print(f"Opened coalescing group {group_key} for {window_seconds} seconds")
+
+def schedule_flush(group_key, window_id, delay_seconds):
+    """Send the delayed message that closes a coalescing window"""
+    get_client('sqs').send_message(
+        QueueUrl=os.environ['COALESCE_QUEUE_URL'],
+        MessageBody=json.dumps({'group_key': group_key, 'window_id': window_id}),
+        DelaySeconds=max(0, min(math.ceil(delay_seconds), MAX_FLUSH_DELAY_SECONDS))
+    )
+
+def flush_group(codebuild, message):
+    """Close a coalescing window and start one build for everything it collected"""
+    dynamodb = get_client('dynamodb')
+    table_name = os.environ['COALESCE_TABLE_NAME']
+    key = {'group_key': {'S': message['group_key']}}
+
+    try:
+        # Only the window this message opened may be flushed, and only once it is due;
+        # a redelivered message must not cut short a newer window for the same group
+        response = dynamodb.delete_item(
+            TableName=table_name,
+            Key=key,
+            ConditionExpression=(
+                'window_id = :window_id AND (attribute_not_exists(flush_after) OR flush_after <= :now)'
+            ),
+            ExpressionAttributeValues={
+                ':window_id': {'S': message['window_id']},
+                ':now': {'N': str(int(time.time()))}
+            },
+            ReturnValues='ALL_OLD'
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        item = dynamodb.get_item(TableName=table_name, Key=key, ConsistentRead=True).get('Item')
+        if item and item['window_id']['S'] == message['window_id']:
+            remaining = float(item['flush_after']['N']) - time.time()
+            schedule_flush(message['group_key'], message['window_id'], remaining)
+            print(f"Coalescing window for {message['group_key']} stays open for another {remaining:.0f} seconds")
+        else:
+            print(f"Coalescing window for {message['group_key']} was already flushed")
+        return
+
+    item = response['Attributes']
+    bucket = item['bucket_name']['S']
+    keys = sorted(item['app_files']['SS'])
+    print(f"Flushing coalescing group {message['group_key']} with {len(keys)} app file(s)")
+
+    try:
+        dispatch_run(codebuild, bucket, keys)
+    except Exception as e:
+        # Put the window back, already due, so the retried message or the sweep flushes it again
+        print(f"Failed to start build for {message['group_key']}, restoring its window: {str(e)}")
+        restore_group(item)
+        raise
+
+def restore_group(item):
+    """Put a flushed window back, or fold its files into a window opened since"""
+    dynamodb = get_client('dynamodb')
+    try:
+        dynamodb.put_item(
+            TableName=os.environ['COALESCE_TABLE_NAME'],
+            Item=item,
+            ConditionExpression='attribute_not_exists(group_key)'
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        dynamodb.update_item(
+            TableName=os.environ['COALESCE_TABLE_NAME'],
+            Key={'group_key': item['group_key']},
+            UpdateExpression='ADD app_files :files',
+            ExpressionAttributeValues={':files': item['app_files']}
+        )
+
+def flush_expired_groups(codebuild):
+    """Flush every window that is overdue because its close message was lost or failed"""
+    dynamodb = get_client('dynamodb')
+    cutoff = int(time.time()) - SWEEP_GRACE_SECONDS
+    failures = 0
+
+    for page in dynamodb.get_paginator('scan').paginate(
+        TableName=os.environ['COALESCE_TABLE_NAME'],
+        FilterExpression='attribute_not_exists(flush_after) OR flush_after < :cutoff',
+        ExpressionAttributeValues={':cutoff': {'N': str(cutoff)}},
+        ConsistentRead=True
+    ):
+        for item in page.get('Items', []):
+            print(f"Coalescing window for {item['group_key']['S']} is overdue, flushing it")
+            try:
+                flush_group(codebuild, {'group_key': item['group_key']['S'], 'window_id': item['window_id']['S']})
+            except Exception as e:
+                print(f"Failed to flush {item['group_key']['S']}: {str(e)}")
+                failures += 1
+
+    if failures:
+        raise RuntimeError(f"{failures} overdue coalescing window(s) could not be flushed")
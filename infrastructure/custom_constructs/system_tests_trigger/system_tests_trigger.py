@@ -1,45 +1,72 @@
 from aws_cdk import (
     aws_lambda as _lambda,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_s3 as s3,
     aws_s3_notifications as s3n,
     aws_iam as iam,
     aws_codebuild as codebuild,
+    aws_dynamodb as dynamodb,
+    aws_sqs as sqs,
+    aws_events as events,
+    aws_events_targets as targets,
     Duration,
+    RemovalPolicy,
 )
 from constructs import Construct
+from typing import Dict, Optional
+import json
 import os
 
 class SystemTestsTrigger(Construct):
 
-    def __init__(self, scope: Construct, construct_id: str, bucket: s3.Bucket, codebuild_project: codebuild.Project, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, bucket: s3.Bucket,
+                 codebuild_project: Optional[codebuild.Project] = None, worker_queue: Optional[sqs.Queue] = None,
+                 coalesce_window_seconds: int = 0, coalesce_group_by: str = "version",
+                 scheduler_slots: Optional[Dict[str, int]] = None, devices_per_run: Optional[Dict[str, int]] = None,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # Create Lambda function
         self.lambda_function = _lambda.Function(
             self, "SystemTestsTriggerFunction",
-            runtime=_lambda.Runtime.PYTHON_3_9,
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            architecture=_lambda.Architecture.ARM_64,
+            # More memory also means more CPU for the boto3 import during init
+            memory_size=256,
             handler="system_tests_trigger_handler.lambda_handler",
             code=_lambda.Code.from_asset(
                 os.path.join(os.path.dirname(__file__), "handlers")
             ),
-            timeout=Duration.minutes(5),
-            environment={
-                'CODEBUILD_PROJECT_NAME': codebuild_project.project_name
-            }
+            timeout=Duration.minutes(5)
         )
 
-        # Grant Lambda permission to start CodeBuild builds
-        self.lambda_function.add_to_role_policy(
-            iam.PolicyStatement(
-                effect=iam.Effect.ALLOW,
-                actions=["codebuild:StartBuild"],
-                resources=[codebuild_project.project_arn]
+        if worker_queue is not None:
+            # Send run requests to the worker service instead of starting builds
+            self.lambda_function.add_environment("WORKER_QUEUE_URL", worker_queue.queue_url)
+            worker_queue.grant_send_messages(self.lambda_function)
+        else:
+            self.lambda_function.add_environment("CODEBUILD_PROJECT_NAME", codebuild_project.project_name)
+
+            # Grant Lambda permission to start CodeBuild builds
+            self.lambda_function.add_to_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["codebuild:StartBuild"],
+                    resources=[codebuild_project.project_arn]
+                )
             )
-        )
+
+            # Only start builds while Device Farm has device slots for them
+            if scheduler_slots:
+                self._add_scheduler(codebuild_project, scheduler_slots, devices_per_run or {})
 
         # Grant Lambda permission to read from S3 bucket
         bucket.grant_read(self.lambda_function)
 
+        # Hold related uploads for a short window and start one build per group
+        if coalesce_window_seconds > 0:
+            self._add_coalescing(coalesce_window_seconds, coalesce_group_by)
+
         # Add S3 event notification for .ipa and .apk files
         bucket.add_event_notification(
             s3.EventType.OBJECT_CREATED,
@@ -51,4 +78,96 @@ class SystemTestsTrigger(Construct):
             s3.EventType.OBJECT_CREATED,
             s3n.LambdaDestination(self.lambda_function),
             s3.NotificationKeyFilter(suffix=".apk")
-        )
\ No newline at end of file
+        )
+
+    def _add_coalescing(self, window_seconds: int, group_by: str) -> None:
+        # Open coalescing windows, keyed by version or prefix
+        self.coalesce_table = dynamodb.Table(
+            self, "CoalesceTable",
+            partition_key=dynamodb.Attribute(name="group_key", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # Delayed messages that close each window
+        self.coalesce_queue = sqs.Queue(
+            self, "CoalesceQueue",
+            visibility_timeout=Duration.minutes(6)
+        )
+
+        self.lambda_function.add_environment("COALESCE_WINDOW_SECONDS", str(window_seconds))
+        self.lambda_function.add_environment("COALESCE_GROUP_BY", group_by)
+        self.lambda_function.add_environment("COALESCE_TABLE_NAME", self.coalesce_table.table_name)
+        self.lambda_function.add_environment("COALESCE_QUEUE_URL", self.coalesce_queue.queue_url)
+
+        self.coalesce_table.grant_read_write_data(self.lambda_function)
+        self.coalesce_queue.grant_send_messages(self.lambda_function)
+
+        # Failed flushes return to the queue one message at a time, not as a whole batch
+        self.lambda_function.add_event_source(
+            lambda_event_sources.SqsEventSource(
+                self.coalesce_queue,
+                batch_size=10,
+                report_batch_item_failures=True
+            )
+        )
+
+        # Flush windows whose close message was lost instead of leaving their apps untested
+        events.Rule(
+            self, "CoalesceSweep",
+            schedule=events.Schedule.rate(Duration.minutes(5)),
+            targets=[
+                targets.LambdaFunction(
+                    self.lambda_function,
+                    event=events.RuleTargetInput.from_object({"task": "flush_expired_groups"})
+                )
+            ]
+        )
+
+    def _add_scheduler(self, codebuild_project: codebuild.Project, default_slots: Dict[str, int],
+                       devices_per_run: Dict[str, int]) -> None:
+        # Queued runs, slot leases and per-platform usage, see handlers/run_scheduler.py
+        self.scheduler_table = dynamodb.Table(
+            self, "SchedulerTable",
+            partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="sk", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # A lease outlives the longest build it can belong to, from queueing to timing out
+        project = codebuild_project.node.default_child
+        build_timeout = project.timeout_in_minutes or 60
+        # CodeBuild's default queued timeout is 8 hours
+        queued_timeout = project.queued_timeout_in_minutes or 480
+        lease_seconds = (int(queued_timeout) + int(build_timeout) + 10) * 60
+
+        self.lambda_function.add_environment("SCHEDULER_TABLE_NAME", self.scheduler_table.table_name)
+        self.lambda_function.add_environment("SCHEDULER_DEFAULT_SLOTS", json.dumps(default_slots))
+        self.lambda_function.add_environment("SCHEDULER_DEVICES_PER_RUN", json.dumps(devices_per_run))
+        self.lambda_function.add_environment("SCHEDULER_LEASE_SECONDS", str(lease_seconds))
+
+        self.scheduler_table.grant_read_write_data(self.lambda_function)
+        self.lambda_function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["devicefarm:GetAccountSettings"],
+                resources=["*"]
+            )
+        )
+
+        # Finished builds give their slots back
+        codebuild_project.on_state_change(
+            "SchedulerBuildFinished",
+            event_pattern=events.EventPattern(
+                detail={"build-status": ["SUCCEEDED", "FAILED", "FAULT", "STOPPED", "TIMED_OUT"]}
+            ),
+            target=targets.LambdaFunction(self.lambda_function)
+        )
+
+        # Expire leases whose state-change event was lost
+        events.Rule(
+            self, "SchedulerReconcile",
+            schedule=events.Schedule.rate(Duration.minutes(5)),
+            targets=[targets.LambdaFunction(self.lambda_function)]
+        )
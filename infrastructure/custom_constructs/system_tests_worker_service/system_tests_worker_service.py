@@ -0,0 +1,129 @@
+import os
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_ecs as ecs,
+    aws_iam as iam,
+    aws_logs as logs,
+    aws_s3 as s3,
+    aws_sqs as sqs,
+    Duration,
+)
+from constructs import Construct
+from typing import Dict, Optional
+
+class SystemTestsWorkerService(Construct):
+    """Long-lived alternative to SystemTestsBuildProject.
+
+    A Fargate service runs worker.py, which takes run requests from an SQS queue
+    and keeps its clients, connection pools and caches warm across runs.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, android_project_arn: str, ios_project_arn: str,
+                 bucket: s3.Bucket, desired_count: int = 1, concurrency: int = 4,
+                 prestaged_uploads: Optional[str] = None,
+                 runner_settings: Optional[Dict[str, str]] = None, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        # Failed run requests are retried twice, then kept for inspection
+        self.dead_letter_queue = sqs.Queue(
+            self, "RunRequestDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        self.queue = sqs.Queue(
+            self, "RunRequestQueue",
+            # The worker extends visibility while a run is in flight
+            visibility_timeout=Duration.minutes(5),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=self.dead_letter_queue)
+        )
+
+        # Public subnets only: the worker just needs outbound access to AWS APIs
+        self.vpc = ec2.Vpc(
+            self, "WorkerVpc",
+            max_azs=2,
+            nat_gateways=0,
+            subnet_configuration=[
+                ec2.SubnetConfiguration(name="public", subnet_type=ec2.SubnetType.PUBLIC)
+            ]
+        )
+        self.cluster = ecs.Cluster(self, "WorkerCluster", vpc=self.vpc)
+
+        self.task_definition = ecs.FargateTaskDefinition(
+            self, "WorkerTaskDefinition",
+            cpu=1024,
+            memory_limit_mib=2048
+        )
+        self.task_definition.add_container(
+            "Worker",
+            image=ecs.ContainerImage.from_asset(
+                # Same image as the CodeBuild project
+                os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "test-suite")
+            ),
+            command=["python3", "worker.py"],
+            # Fargate kills the task at most two minutes after SIGTERM, long before a run ends.
+            # The worker stops taking requests, and runs it leaves behind are resumed (not
+            # scheduled again) by whichever worker receives the redelivered message
+            stop_timeout=Duration.minutes(2),
+            working_directory="/workspace/test-suite",
+            logging=ecs.LogDrivers.aws_logs(
+                stream_prefix="system-tests-worker",
+                log_retention=logs.RetentionDays.ONE_MONTH
+            ),
+            environment={
+                "ANDROID_PROJECT_ARN": android_project_arn,
+                "IOS_PROJECT_ARN": ios_project_arn,
+                "WORKER_QUEUE_URL": self.queue.queue_url,
+                "WORKER_CONCURRENCY": str(concurrency),
+                "CONCURRENT_EXECUTION": "true",
+                "STREAMING_TRANSFER": "true",
+                "MONITOR_RUN": "true",
+                "INGEST_RESULTS": "true",
+                **({"PRESTAGED_UPLOADS": prestaged_uploads} if prestaged_uploads else {}),
+                **(runner_settings or {}),
+            }
+        )
+
+        # Same Device Farm permissions as the CodeBuild project
+        self.task_definition.add_to_task_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "devicefarm:ListProjects",
+                    "devicefarm:CreateUpload",
+                    "devicefarm:GetUpload",
+                    "devicefarm:ListUploads",
+                    "devicefarm:ScheduleRun",
+                    "devicefarm:GetRun",
+                    "devicefarm:ListRuns",
+                    "devicefarm:ListJobs",
+                    "devicefarm:ListSuites",
+                    "devicefarm:ListTests",
+                    "devicefarm:ListArtifacts",
+                    "devicefarm:ListDevicePools",
+                    "devicefarm:GetDevicePool"
+                ],
+                resources=["*"]
+            )
+        )
+        # The runner picks the bucket's region and acceleration endpoint itself
+        self.task_definition.add_to_task_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:GetBucketLocation", "s3:GetAccelerateConfiguration"],
+                resources=[bucket.bucket_arn]
+            )
+        )
+        bucket.grant_read(self.task_definition.task_role)
+        bucket.grant_read_write(self.task_definition.task_role, "devicefarm-cache/*")
+        bucket.grant_write(self.task_definition.task_role, "results/*")
+        self.queue.grant_consume_messages(self.task_definition.task_role)
+
+        self.service = ecs.FargateService(
+            self, "WorkerService",
+            cluster=self.cluster,
+            task_definition=self.task_definition,
+            desired_count=desired_count,
+            assign_public_ip=True,
+            # Keep the full worker count while a deployment starts the replacement tasks
+            min_healthy_percent=100,
+            max_healthy_percent=200
+        )
@@ -4,6 +4,9 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+# Devices each pool runs on at most; the scheduler charges a run for this many slots
+DEVICE_POOL_MAX_DEVICES = {"ANDROID": 2, "IOS": 2}
+
 class DeviceFarmStack(Stack):
 
    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
@@ -29,6 +32,7 @@ class DeviceFarmStack(Stack):
            self, "AndroidDevicePool",
            name=f"android-device-pool-{stack_suffix}",
            project_arn=android_project.attr_arn,
+           max_devices=DEVICE_POOL_MAX_DEVICES["ANDROID"],
            rules=[
                devicefarm.CfnDevicePool.RuleProperty(
                    attribute="OS_VERSION",
@@ -48,6 +52,7 @@ class DeviceFarmStack(Stack):
            self, "IOSDevicePool",
            name=f"ios-device-pool-{stack_suffix}",
            project_arn=ios_project.attr_arn,
+           max_devices=DEVICE_POOL_MAX_DEVICES["IOS"],
            rules=[
                devicefarm.CfnDevicePool.RuleProperty(
                    attribute="OS_VERSION",
@@ -1,35 +1,115 @@
 from aws_cdk import Stack
 from constructs import Construct
 
-from custom_constructs.system_tests_bucket import SystemTestsBucket
+from custom_constructs.system_tests_bucket import (
+    SystemTestsBucket, SystemTestsDependenciesBucket, dependencies_environment
+)
 from custom_constructs.system_tests_trigger.system_tests_trigger import SystemTestsTrigger
 from custom_constructs.system_tests_build_project.system_tests_build_project import SystemTestsBuildProject
+from custom_constructs.system_tests_prestage.system_tests_prestage import SystemTestsPrestage
+from custom_constructs.system_tests_worker_service.system_tests_worker_service import SystemTestsWorkerService
+from stacks.device_farm_stack import DEVICE_POOL_MAX_DEVICES
 class SystemsTestStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, android_project_arn: str, ios_project_arn: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, android_project_arn: str, ios_project_arn: str,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # Store the project ARNs for use in systems tests
         self.android_project_arn = android_project_arn
         self.ios_project_arn = ios_project_arn
 
+        # How runners reach apps in this bucket from another region, selected with
+        # `cdk deploy -c artifact_staging=...`: "regional" (the default) only routes
+        # requests to the bucket's region and "accelerate" turns on Transfer
+        # Acceleration, which the runner detects from the bucket.
+        artifact_staging = self.node.try_get_context("artifact_staging") or "regional"
+        if artifact_staging not in ("regional", "accelerate"):
+            raise ValueError(f"artifact_staging must be regional or accelerate, got: {artifact_staging}")
+
          # Add S3 bucket for system tests
         self.system_tests_bucket = SystemTestsBucket(
-            self, "SystemTestsBucket"
+            self, "SystemTestsBucket",
+            transfer_acceleration=artifact_staging == "accelerate"
+        )
+
+        # node_modules/ archives that the test specs download. They are pre-signed per run
+        # unless `cdk deploy -c public_dependencies=true` makes them publicly readable
+        # under a stable URL; see SystemTestsDependenciesBucket for the trade-off
+        public_dependencies = str(self.node.try_get_context("public_dependencies") or "false").lower() == "true"
+        self.dependencies_bucket = SystemTestsDependenciesBucket(
+            self, "SystemTestsDependenciesBucket",
+            public_read=public_dependencies
         )
 
-        # Add CodeBuild project for test suite building
-        self.codebuild_project = SystemTestsBuildProject(
-            self, "SystemTestsBuildProject",
+        # Runner settings the test spec is rendered from, given to the runners and the
+        # pre-staging alike so a pre-staged spec matches the one a run would upload
+        runner_settings = dependencies_environment(self.dependencies_bucket)
+
+        # Upload the test package and specs to Device Farm once per deployment, so a
+        # run only has to upload its app. Kept in this stack rather than next to the
+        # projects in DeviceFarmStack: the ARNs change with every package change, which
+        # a cross-region reference cannot carry, and it shares the runners' image.
+        self.prestage = SystemTestsPrestage(
+            self, "SystemTestsPrestage",
             android_project_arn=android_project_arn,
-            ios_project_arn=ios_project_arn
+            ios_project_arn=ios_project_arn,
+            runner_settings=runner_settings
         )
+        self.dependencies_bucket.bucket.grant_read_write(self.prestage.function)
+
+        # Runs execute in one CodeBuild build per request ("codebuild", the default)
+        # or in a long-lived worker service fed from a queue ("worker"),
+        # selected with `cdk deploy -c runner_mode=worker`
+        runner_mode = self.node.try_get_context("runner_mode") or "codebuild"
 
-        # Grant the CodeBuild project read access to the S3 bucket
-        self.system_tests_bucket.bucket.grant_read(self.codebuild_project.project)
+        if runner_mode == "worker":
+            self.worker_service = SystemTestsWorkerService(
+                self, "SystemTestsWorkerService",
+                android_project_arn=android_project_arn,
+                ios_project_arn=ios_project_arn,
+                bucket=self.system_tests_bucket.bucket,
+                prestaged_uploads=self.prestage.prestaged_uploads,
+                runner_settings=runner_settings
+            )
+            self.dependencies_bucket.bucket.grant_read_write(self.worker_service.task_definition.task_role)
+            runner_target = {'worker_queue': self.worker_service.queue}
+        else:
+            # Add CodeBuild project for test suite building
+            self.codebuild_project = SystemTestsBuildProject(
+                self, "SystemTestsBuildProject",
+                android_project_arn=android_project_arn,
+                ios_project_arn=ios_project_arn,
+                prestaged_uploads=self.prestage.prestaged_uploads,
+                runner_settings=runner_settings
+            )
+
+            # Grant the CodeBuild project read access to the S3 bucket
+            self.system_tests_bucket.bucket.grant_read(self.codebuild_project.project)
+            self.dependencies_bucket.bucket.grant_read_write(self.codebuild_project.project)
+
+            # Allow the runner to persist its Device Farm upload cache in the bucket
+            self.system_tests_bucket.bucket.grant_read_write(self.codebuild_project.project, "devicefarm-cache/*")
+
+            # ...and to store the ingested artifacts and results of each run
+            self.system_tests_bucket.bucket.grant_write(self.codebuild_project.project, "results/*")
+            runner_target = {
+                'codebuild_project': self.codebuild_project.project,
+                # Concurrent devices Device Farm allows per platform when the account
+                # has no unmetered slots of its own
+                'scheduler_slots': {"ANDROID": 5, "IOS": 5},
+                # Each project has one capped pool, so an app's build takes at most
+                # the pool's devices once per shard
+                'devices_per_run': {
+                    platform: devices * int(runner_settings.get("SHARD_COUNT", "1"))
+                    for platform, devices in DEVICE_POOL_MAX_DEVICES.items()
+                }
+            }
 
         # Add Lambda trigger for app file uploads
         self.system_tests_trigger = SystemTestsTrigger(
             self, "SystemTestsTrigger",
             bucket=self.system_tests_bucket.bucket,
-            codebuild_project=self.codebuild_project.project
-        )
\ No newline at end of file
+            # Coalesce iOS/Android builds of the same version uploaded close together
+            coalesce_window_seconds=30,
+            **runner_target
+        )
@@ -0,0 +1,143 @@
+"""
+Cold-start benchmark for the two entry points on the app-upload latency path:
+the S3 trigger Lambda and the Device Farm test runner.
+
+Every sample is a fresh interpreter, so module imports and client creation are
+paid again just like in a new Lambda execution environment or CodeBuild container.
+The working tree is compared against a baseline git ref extracted to a temp dir.
+
+No AWS calls are made: client creation needs no credentials and the trigger is
+invoked with a non-app key.
+
+Usage:
+    python3 benchmarks/cold_start.py [--baseline-ref HEAD] [--iterations 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+RUNNER_DIR = 'test-suite'
+TRIGGER_DIR = 'infrastructure/custom_constructs/system_tests_trigger/handlers'
+
+TRIGGER_PROBE = '''
+import contextlib, io, json, time
+start = time.perf_counter()
+import system_tests_trigger_handler as handler
+imported = time.perf_counter()
+event = {'Records': [{'s3': {'bucket': {'name': 'bench'}, 'object': {'key': 'notes.txt'}}}]}
+with contextlib.redirect_stdout(io.StringIO()):
+    handler.lambda_handler(event, None)
+    first = time.perf_counter()
+    for _ in range(20):
+        handler.lambda_handler(event, None)
+    warm = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_invoke_ms': (first - imported) * 1000,
+    'warm_invoke_ms': (warm - first) * 1000 / 20,
+}))
+'''
+
+RUNNER_PROBE = '''
+import json, logging, time
+start = time.perf_counter()
+import handler
+imported = time.perf_counter()
+logging.disable(logging.CRITICAL)
+handler.DeviceFarmTestRunner()
+constructed = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'construct_ms': (constructed - imported) * 1000,
+}))
+'''
+
+PROBE_ENV = {
+    'AWS_DEFAULT_REGION': 'us-west-2',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'CODEBUILD_PROJECT_NAME': 'benchmark',
+    'ANDROID_PROJECT_ARN': 'arn:aws:devicefarm:us-west-2:000000000000:project:android',
+    'IOS_PROJECT_ARN': 'arn:aws:devicefarm:us-west-2:000000000000:project:ios',
+    'S3_BUCKET': 'benchmark',
+    'APP_FILE_PATH': 'apps/benchmark.ipa',
+    'APP_TYPE': 'ios',
+}
+
+
+def extract_ref(ref: str, destination: str):
+    """Extract the entry point directories of a git ref into destination"""
+    archive_path = os.path.join(destination, 'ref.tar')
+    subprocess.run(
+        ['git', 'archive', '--format=tar', '-o', archive_path, ref, RUNNER_DIR, TRIGGER_DIR],
+        cwd=REPO_ROOT, check=True
+    )
+    with tarfile.open(archive_path) as archive:
+        archive.extractall(destination)
+
+
+def sample(probe: str, cwd: str) -> Dict[str, float]:
+    """Run one probe in a fresh interpreter and return its timings"""
+    env = dict(os.environ, **PROBE_ENV)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', probe], cwd=cwd, env=env,
+        capture_output=True, text=True, check=True
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process_ms'] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for metric in samples[0]:
+        values = sorted(s[metric] for s in samples)
+        summary[metric] = {
+            'median': statistics.median(values),
+            'p90': values[min(len(values) - 1, int(len(values) * 0.9))],
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline-ref', default='HEAD', help='git ref to compare the working tree against')
+    parser.add_argument('--iterations', type=int, default=15, help='fresh interpreters per entry point')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as baseline_root:
+        extract_ref(args.baseline_ref, baseline_root)
+
+        trees = {args.baseline_ref: baseline_root, 'working tree': REPO_ROOT}
+        entry_points = {'trigger': (TRIGGER_DIR, TRIGGER_PROBE), 'runner': (RUNNER_DIR, RUNNER_PROBE)}
+
+        for name, (directory, probe) in entry_points.items():
+            print(f"\n{name} ({args.iterations} fresh interpreters)")
+            print(f"{'metric':<18}" + ''.join(f"{tree:>28}" for tree in trees))
+
+            results = {}
+            for tree, root in trees.items():
+                cwd = os.path.join(root, directory)
+                sample(probe, cwd)  # Warm the OS file cache before measuring
+                results[tree] = summarize([sample(probe, cwd) for _ in range(args.iterations)])
+
+            for metric in results['working tree']:
+                row = f"{metric:<18}"
+                for tree in trees:
+                    stats = results[tree].get(metric)
+                    cell = f"{stats['median']:.1f} ms (p90 {stats['p90']:.1f})" if stats else 'n/a'
+                    row += f"{cell:>28}"
+                print(row)
+
+
+if __name__ == '__main__':
+    main()
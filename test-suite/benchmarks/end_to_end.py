@@ -0,0 +1,236 @@
+"""
+End-to-end benchmark of DeviceFarmTestRunner against local AWS stand-ins.
+
+The real runner executes the whole workflow (app transfer, test package and spec
+uploads, processing waits, pool lookup, scheduling and run monitoring) against
+FakeDeviceFarm, FakeS3 and a local pre-signed PUT server from fake_aws.py, so no
+AWS account or device minutes are involved. Every app size is measured at every
+concurrency level, with that many runners started together per iteration.
+
+Per configuration it reports end-to-end latency percentiles, transfer throughput,
+runs per minute, failures and API calls per run. --output saves the results and
+--baseline compares against an earlier file, exiting non-zero when a median
+latency regressed by more than --max-regression.
+
+Usage:
+    python3 benchmarks/end_to_end.py [--sizes 1,50,200] [--concurrency 1,4] [--iterations 3]
+                                     [--processing-delay 0.5] [--run-duration 1] [--api-latency 0.02]
+                                     [--upload-failure-rate 0] [--put-failure-rate 0] [--run-failure-rate 0]
+                                     [--set STREAMING_TRANSFER=false ...] [--verbose]
+                                     [--output results.json] [--baseline results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import handler  # noqa: E402
+from fake_aws import FakeDeviceFarm, FakeS3, PresignedPutServer, REGION, ACCOUNT, api_calls  # noqa: E402
+
+RUNNER_ENV = {
+    'ANDROID_PROJECT_ARN': f"arn:aws:devicefarm:{REGION}:{ACCOUNT}:project:android",
+    'IOS_PROJECT_ARN': f"arn:aws:devicefarm:{REGION}:{ACCOUNT}:project:ios",
+    'S3_BUCKET': 'benchmark',
+}
+
+# Production settings, with polling scaled down to the simulated timings
+RUNNER_CONFIG = {
+    'CONCURRENT_EXECUTION': 'true',
+    'STREAMING_TRANSFER': 'true',
+    'MONITOR_RUN': 'true',
+    'UPLOAD_CACHE_ENABLED': 'false',
+    'POLL_INITIAL_INTERVAL': '0.1',
+    'POLL_MAX_INTERVAL': '0.5',
+    'RUN_POLL_INITIAL_INTERVAL': '0.1',
+    'RUN_POLL_MAX_INTERVAL': '0.5',
+    'CATALOG_CACHE_S3_KEY': '',
+    'RUN_HISTORY_ENABLED': 'false',
+    'TELEMETRY_ENABLED': 'false',
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    return values[min(len(values) - 1, max(0, int(round(len(values) * fraction + 0.5)) - 1))]
+
+
+def write_test_package(directory: str, size: int) -> str:
+    """A stand-in system_tests.zip of roughly `size` bytes where the runner looks for it"""
+    path = os.path.join(directory, 'system_tests.zip')
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as package:
+        package.writestr('package.json', '{"name": "system-tests"}')
+        package.writestr('dist/src/tests/benchmark.test.js', '// benchmark')
+        package.writestr('node_modules/payload.bin', os.urandom(size))
+    return path
+
+
+def run_configuration(args: argparse.Namespace, work_dir: str, size_mb: float, concurrency: int) -> Dict[str, Any]:
+    """Run `iterations` rounds of `concurrency` simultaneous runners for one app size"""
+    app_size = int(size_mb * 1024 * 1024)
+    with PresignedPutServer(failure_rate=args.put_failure_rate, seed=args.seed) as put_server:
+        devicefarm = FakeDeviceFarm(
+            put_server,
+            api_latency=args.api_latency,
+            processing_delay=args.processing_delay,
+            run_queue_delay=args.run_queue,
+            run_duration=args.run_duration,
+            upload_failure_rate=args.upload_failure_rate,
+            run_failure_rate=args.run_failure_rate,
+            seed=args.seed
+        )
+        s3 = FakeS3(app_size, api_latency=args.api_latency)
+        handler.set_aws_client('devicefarm', devicefarm)
+        for region in (REGION, 'us-east-1'):
+            handler.set_aws_client('s3', s3, region_name=region)
+
+        config = dict(RUNNER_CONFIG, CATALOG_CACHE_PATH=os.path.join(work_dir, 'catalog.json'))
+        config.update(args.overrides)
+        latencies: List[float] = []
+        failures: List[str] = []
+        lock = threading.Lock()
+
+        def run_one(index: int):
+            # Runners of one round use distinct apps; later rounds reuse the same keys
+            overrides = dict(config, APP_FILE_PATH=f"apps/benchmark-{index % concurrency}.ipa", APP_TYPE='ios')
+            started = time.perf_counter()
+            try:
+                handler.DeviceFarmTestRunner(overrides).execute()
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                with lock:
+                    failures.append(f"{type(e).__name__}: {e}")
+
+        wall_started = time.perf_counter()
+        for iteration in range(args.iterations):
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bench') as executor:
+                list(executor.map(run_one, range(iteration * concurrency, (iteration + 1) * concurrency)))
+        wall = time.perf_counter() - wall_started
+
+    runs = args.iterations * concurrency
+    latencies.sort()
+    return {
+        'size_mb': size_mb,
+        'concurrency': concurrency,
+        'runs': runs,
+        'failed': len(failures),
+        'p50_s': round(percentile(latencies, 0.5), 3) if latencies else None,
+        'p90_s': round(percentile(latencies, 0.9), 3) if latencies else None,
+        'p99_s': round(percentile(latencies, 0.99), 3) if latencies else None,
+        'mean_s': round(statistics.mean(latencies), 3) if latencies else None,
+        'throughput_mbps': round(put_server.bytes_received / (1024 * 1024) / wall, 2),
+        'runs_per_minute': round(len(latencies) * 60 / wall, 1),
+        'api_calls_per_run': round(sum(devicefarm.calls.values()) / runs, 1),
+        'api_calls': api_calls(devicefarm, s3),
+        'errors': sorted(set(failures))[:5]
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> List[str]:
+    """Configurations whose median latency regressed beyond max_regression"""
+    with open(baseline_path, 'r') as f:
+        baseline = {(row['size_mb'], row['concurrency']): row for row in json.load(f)['results']}
+
+    regressions = []
+    for row in results:
+        before = baseline.get((row['size_mb'], row['concurrency']))
+        if not before or not before['p50_s'] or not row['p50_s']:
+            continue
+        change = row['p50_s'] / before['p50_s'] - 1
+        print(f"  {row['size_mb']:>7g} MB x{row['concurrency']:<3} p50 {before['p50_s']:.3f} s -> "
+              f"{row['p50_s']:.3f} s ({change:+.1%})")
+        if change > max_regression:
+            regressions.append(f"{row['size_mb']:g} MB x{row['concurrency']}: {change:+.1%}")
+    return regressions
+
+
+def parse_list(value: str, cast) -> List[Any]:
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def parse_override(value: str) -> Tuple[str, str]:
+    name, separator, setting = value.partition('=')
+    if not separator:
+        raise argparse.ArgumentTypeError(f"expected VAR=value, got: {value}")
+    return name, setting
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,50,200', help='app sizes in MB, comma-separated')
+    parser.add_argument('--concurrency', default='1,4', help='simultaneous runners, comma-separated')
+    parser.add_argument('--iterations', type=int, default=3, help='rounds per configuration')
+    parser.add_argument('--package-mb', type=float, default=5, help='size of the stand-in test package')
+    parser.add_argument('--processing-delay', type=float, default=0.5, help='seconds until an upload is processed')
+    parser.add_argument('--run-queue', type=float, default=0.5, help='seconds a run waits for a device')
+    parser.add_argument('--run-duration', type=float, default=1.0, help='seconds a run executes')
+    parser.add_argument('--api-latency', type=float, default=0.02, help='seconds added to every API call')
+    parser.add_argument('--upload-failure-rate', type=float, default=0.0)
+    parser.add_argument('--put-failure-rate', type=float, default=0.0)
+    parser.add_argument('--run-failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, help='seed for the simulated failures')
+    parser.add_argument('--set', dest='overrides', type=parse_override, action='append', default=[],
+                        help='runner configuration override VAR=value (repeatable)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='earlier --output file to compare median latencies against')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='tolerated median slowdown')
+    parser.add_argument('--verbose', action='store_true', help="show the runner's logs")
+    args = parser.parse_args()
+    args.overrides = dict(args.overrides)
+    # The runner is run from a scratch directory, so resolve paths first
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    # Failures are summarized per configuration; --verbose shows the runner's own logs
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    os.environ.update(RUNNER_ENV)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='df-benchmark-') as work_dir:
+        write_test_package(work_dir, int(args.package_mb * 1024 * 1024))
+        # The runner falls back to ./system_tests.zip when the image path does not exist
+        os.chdir(work_dir)
+
+        print(f"{'size':>10} {'runners':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'MB/s':>8} "
+              f"{'runs/min':>9} {'failed':>7} {'calls/run':>10}")
+        for size_mb in parse_list(args.sizes, float):
+            for concurrency in parse_list(args.concurrency, int):
+                row = run_configuration(args, work_dir, size_mb, concurrency)
+                results.append(row)
+                latencies = [
+                    f"{row[key]:.2f}s" if row[key] is not None else 'n/a' for key in ('p50_s', 'p90_s', 'p99_s')
+                ]
+                print(f"{size_mb:>8g}MB {concurrency:>8} {latencies[0]:>8} {latencies[1]:>8} {latencies[2]:>8} "
+                      f"{row['throughput_mbps']:>8.1f} {row['runs_per_minute']:>9.1f} "
+                      f"{row['failed']:>4}/{row['runs']:<2} {row['api_calls_per_run']:>10.1f}")
+                for error in row['errors']:
+                    print(f"{'':>10} {error}")
+
+    document = {'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+                'results': results}
+    if output:
+        with open(output, 'w') as f:
+            json.dump(document, f, indent=2)
+
+    if baseline:
+        print(f"\nCompared with {baseline}:")
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"Median latency regressed beyond {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
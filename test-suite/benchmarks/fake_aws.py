@@ -0,0 +1,346 @@
+"""
+Local stand-ins for the AWS services DeviceFarmTestRunner talks to.
+
+FakeDeviceFarm implements the Device Farm calls the runner makes with the same
+request and response shapes as boto3. Uploads hand out pre-signed URLs on a
+local PresignedPutServer and finish processing after a configurable delay, runs
+progress through SCHEDULING, RUNNING and COMPLETED, and uploads, PUTs and runs
+fail at configurable rates. FakeS3 serves generated app files of a given size
+and keeps whatever the runner writes (caches, history, results) in memory.
+
+Every fake call sleeps for api_latency first, standing in for the network round
+trip, and is counted so a benchmark can report API calls per run.
+"""
+import io
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+CHUNK_SIZE = 1024 * 1024
+REGION = 'us-west-2'
+ACCOUNT = '000000000000'
+
+
+class ClientError(Exception):
+    """Raised where boto3 would raise botocore.exceptions.ClientError"""
+
+
+class PresignedPutServer:
+    """Threaded HTTP server accepting pre-signed PUTs, optionally failing some with 503"""
+
+    def __init__(self, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.failure_rate = failure_rate
+        self.bytes_received = 0
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-put-server', daemon=True)
+
+    def __enter__(self) -> 'PresignedPutServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_PUT(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+
+                with server._lock:
+                    server.requests += 1
+                    failed = server._random.random() < server.failure_rate
+                    if not failed:
+                        server.bytes_received += length - remaining
+                self.send_response(503 if failed else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class FakeDeviceFarm:
+    """In-memory Device Farm API with configurable latency, processing time and failure rates"""
+
+    def __init__(self, put_server: PresignedPutServer, api_latency: float = 0.0, processing_delay: float = 1.0,
+                 run_queue_delay: float = 1.0, run_duration: float = 5.0, upload_failure_rate: float = 0.0,
+                 run_failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.put_server = put_server
+        self.api_latency = api_latency
+        self.processing_delay = processing_delay
+        self.run_queue_delay = run_queue_delay
+        self.run_duration = run_duration
+        self.upload_failure_rate = upload_failure_rate
+        self.run_failure_rate = run_failure_rate
+        self.calls: Counter = Counter()
+        self.projects = {
+            f"arn:aws:devicefarm:{REGION}:{ACCOUNT}:project:{platform}": f"{platform}-test-project-{REGION}"
+            for platform in ('android', 'ios')
+        }
+        self._uploads: Dict[str, Dict[str, Any]] = {}
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    # Projects and device pools
+
+    def list_projects(self, **kwargs) -> Dict[str, Any]:
+        self._call('list_projects')
+        return {'projects': [{'arn': arn, 'name': name} for arn, name in sorted(self.projects.items())]}
+
+    def list_device_pools(self, arn: str, type: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self._call('list_device_pools')
+        platform = self.projects[arn].split('-', 1)[0]
+        pools = [
+            {'arn': f"{arn}/curated", 'name': 'Top Devices', 'type': 'CURATED'},
+            {'arn': f"{arn}/private", 'name': f"{platform}-device-pool-{REGION}", 'type': 'PRIVATE'}
+        ]
+        return {'devicePools': [pool for pool in pools if type in (None, pool['type'])]}
+
+    # Uploads
+
+    def create_upload(self, projectArn: str, name: str, type: str, **kwargs) -> Dict[str, Any]:
+        self._call('create_upload')
+        upload_id = str(uuid.uuid4())
+        arn = f"arn:aws:devicefarm:{REGION}:{ACCOUNT}:upload:{projectArn.rsplit(':', 1)[-1]}/{upload_id}"
+        with self._lock:
+            failed = self._random.random() < self.upload_failure_rate
+            self._uploads[arn] = {
+                'arn': arn, 'name': name, 'type': type, 'project_arn': projectArn,
+                'created': time.monotonic(), 'failed': failed
+            }
+        return {'upload': dict(self._upload_view(arn), url=f"{self.put_server.base_url}/uploads/{upload_id}")}
+
+    def get_upload(self, arn: str) -> Dict[str, Any]:
+        self._call('get_upload')
+        if arn not in self._uploads:
+            raise ClientError(f"NotFoundException: upload {arn}")
+        return {'upload': self._upload_view(arn)}
+
+    def list_uploads(self, arn: str, type: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self._call('list_uploads')
+        with self._lock:
+            arns = [
+                upload_arn for upload_arn, upload in self._uploads.items()
+                if upload['project_arn'] == arn and type in (None, upload['type'])
+            ]
+        return {'uploads': [self._upload_view(upload_arn) for upload_arn in reversed(arns)]}
+
+    def _upload_view(self, arn: str) -> Dict[str, Any]:
+        upload = self._uploads[arn]
+        status = 'PROCESSING'
+        if time.monotonic() - upload['created'] >= self.processing_delay:
+            status = 'FAILED' if upload['failed'] else 'SUCCEEDED'
+        view = {'arn': arn, 'name': upload['name'], 'type': upload['type'], 'status': status}
+        if status == 'FAILED':
+            view['message'] = 'Simulated processing failure'
+        return view
+
+    # Runs
+
+    def schedule_run(self, projectArn: str, appArn: str, devicePoolArn: str, name: str, test: Dict[str, Any],
+                     **kwargs) -> Dict[str, Any]:
+        self._call('schedule_run')
+        for upload_arn in (appArn, test.get('testPackageArn'), test.get('testSpecArn')):
+            if upload_arn and self._upload_view(upload_arn)['status'] != 'SUCCEEDED':
+                raise ClientError(f"ArgumentException: upload {upload_arn} is not ready")
+
+        run_id = str(uuid.uuid4())
+        arn = f"arn:aws:devicefarm:{REGION}:{ACCOUNT}:run:{projectArn.rsplit(':', 1)[-1]}/{run_id}"
+        with self._lock:
+            self._runs[arn] = {
+                'arn': arn, 'name': name, 'project_arn': projectArn, 'created': datetime.now(timezone.utc),
+                'created_at': time.monotonic(), 'failed': self._random.random() < self.run_failure_rate
+            }
+        return {'run': self._run_view(arn)}
+
+    def get_run(self, arn: str) -> Dict[str, Any]:
+        self._call('get_run')
+        return {'run': self._run_view(arn)}
+
+    def list_runs(self, arn: str, **kwargs) -> Dict[str, Any]:
+        self._call('list_runs')
+        with self._lock:
+            arns = [run_arn for run_arn, run in self._runs.items() if run['project_arn'] == arn]
+        return {'runs': [self._run_view(run_arn) for run_arn in reversed(arns)]}
+
+    def list_jobs(self, arn: str, **kwargs) -> Dict[str, Any]:
+        self._call('list_jobs')
+        run = self._run_view(arn)
+        platform = 'IOS' if ':ios/' in arn else 'ANDROID'
+        job = dict(run, arn=f"{arn.replace(':run:', ':job:')}/00000",
+                   device={'name': 'Benchmark Device', 'platform': platform, 'os': '17.0'})
+        return {'jobs': [job]}
+
+    def list_suites(self, arn: str, **kwargs) -> Dict[str, Any]:
+        self._call('list_suites')
+        job = self._run_view(arn.replace(':job:', ':run:').rsplit('/', 1)[0])
+        return {'suites': [dict(job, arn=f"{arn.replace(':job:', ':suite:')}/00000", name='Tests Suite')]}
+
+    def list_tests(self, arn: str, **kwargs) -> Dict[str, Any]:
+        self._call('list_tests')
+        suite = self._run_view(arn.replace(':suite:', ':run:').rsplit('/', 2)[0])
+        return {'tests': [dict(suite, arn=f"{arn.replace(':suite:', ':test:')}/00000", name='Tests')]}
+
+    def list_artifacts(self, arn: str, type: str, **kwargs) -> Dict[str, Any]:
+        self._call('list_artifacts')
+        return {'artifacts': []}
+
+    def _run_view(self, arn: str) -> Dict[str, Any]:
+        run = self._runs[arn]
+        age = time.monotonic() - run['created_at']
+        view = {'arn': arn, 'name': run['name'], 'created': run['created'], 'counters': {}}
+        if age < self.run_queue_delay:
+            return dict(view, status='SCHEDULING')
+
+        view['started'] = run['created'] + timedelta(seconds=self.run_queue_delay)
+        if age < self.run_queue_delay + self.run_duration:
+            return dict(view, status='RUNNING')
+
+        result = 'FAILED' if run['failed'] else 'PASSED'
+        return dict(
+            view,
+            status='COMPLETED',
+            result=result,
+            stopped=view['started'] + timedelta(seconds=self.run_duration),
+            counters={'total': 1, 'passed': int(result == 'PASSED'), 'failed': int(result == 'FAILED')},
+            deviceMinutes={'total': round(self.run_duration / 60, 2)}
+        )
+
+
+class _GeneratedBody(io.RawIOBase):
+    """Readable stream of `size` bytes produced on the fly"""
+
+    def __init__(self, size: int):
+        self.remaining = size
+        self._block = os.urandom(CHUNK_SIZE)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        chunks = []
+        produced = 0
+        while produced < size:
+            piece = self._block[:min(CHUNK_SIZE, size - produced)]
+            chunks.append(piece)
+            produced += len(piece)
+        self.remaining -= size
+        return b''.join(chunks)
+
+
+class FakeS3:
+    """S3 stand-in: apps/ keys are generated files of app_size bytes, everything else is kept in memory"""
+
+    def __init__(self, app_size: int, api_latency: float = 0.0):
+        self.app_size = app_size
+        self.api_latency = api_latency
+        self.calls: Counter = Counter()
+        self.objects: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def _call(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    def _is_app(self, key: str) -> bool:
+        return key.startswith('apps/')
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        self._call('head_object')
+        if self._is_app(Key):
+            return {'ContentLength': self.app_size, 'ETag': f'"{uuid.uuid5(uuid.NAMESPACE_URL, Key).hex}-1"'}
+        if Key not in self.objects:
+            raise ClientError(f"404 Not Found: {Key}")
+        return {'ContentLength': len(self.objects[Key]), 'ETag': '"stored-1"'}
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self._call('get_object')
+        if self._is_app(Key):
+            if not Range:
+                return {'Body': _GeneratedBody(self.app_size), 'ContentLength': self.app_size}
+            start, end = (int(bound) for bound in Range[len('bytes='):].split('-'))
+            end = min(end, self.app_size - 1)
+            return {
+                'Body': _GeneratedBody(end - start + 1),
+                'ContentLength': end - start + 1,
+                'ContentRange': f"bytes {start}-{end}/{self.app_size}"
+            }
+        with self._lock:
+            if Key not in self.objects:
+                raise ClientError(f"NoSuchKey: {Key}")
+            data = self.objects[Key]
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def download_file(self, Bucket: str, Key: str, Filename: str, **kwargs):
+        self._call('download_file')
+        body = _GeneratedBody(self.app_size)
+        with open(Filename, 'wb') as f:
+            for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+                f.write(chunk)
+
+    def put_object(self, Bucket: str, Key: str, Body: Any, **kwargs) -> Dict[str, Any]:
+        self._call('put_object')
+        data = Body.read() if hasattr(Body, 'read') else Body
+        with self._lock:
+            self.objects[Key] = data.encode('utf-8') if isinstance(data, str) else bytes(data)
+        return {}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, **kwargs):
+        self._call('upload_file')
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket, Key, f)
+
+    def get_bucket_location(self, Bucket: str) -> Dict[str, Any]:
+        self._call('get_bucket_location')
+        return {'LocationConstraint': REGION}
+
+    def generate_presigned_url(self, ClientMethod: str, Params: Dict[str, Any], ExpiresIn: int = 3600) -> str:
+        return f"https://{Params['Bucket']}.s3.{REGION}.amazonaws.com/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+def api_calls(*fakes: Any) -> List[str]:
+    """Call counts of the given fakes, most frequent first"""
+    total: Counter = Counter()
+    for fake in fakes:
+        total.update(fake.calls)
+    return [f"{name}={count}" for name, count in total.most_common()]
@@ -0,0 +1,121 @@
+"""
+Compare how long the runner takes to fetch an app over each S3 route.
+
+Downloads one object with the runner's own ranged downloader, several times per
+route, from wherever this script runs (run it where the runners run, such as a
+CodeBuild build or a worker task, for numbers that apply to them):
+
+  default      the runner's former client, pinned to us-west-2 whatever the
+               bucket's region, so S3 answers with redirects
+  regional     a client for the bucket's own region
+  accelerated  the bucket's Transfer Acceleration endpoint (skipped unless
+               acceleration is enabled on the bucket)
+
+Unlike benchmarks/end_to_end.py this talks to real S3 and needs credentials.
+
+Usage:
+    python3 benchmarks/s3_routes.py --bucket BUCKET --key apps/MyApp.ipa [--iterations 3]
+                                    [--part-mb 16] [--workers 8] [--output results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from handler import get_aws_client  # noqa: E402
+from s3_download import RangedDownloader  # noqa: E402
+from s3_routing import acceleration_enabled, bucket_region, local_region  # noqa: E402
+
+FORMER_REGION = 'us-west-2'
+
+
+def routes(bucket: str) -> List[Dict[str, Any]]:
+    """Every route that applies to the bucket, with the client and bucket it reads through"""
+    lookup = get_aws_client('s3', region_name=FORMER_REGION)
+    region = bucket_region(lookup, bucket) or FORMER_REGION
+    candidates = [
+        {'route': 'default', 'bucket': bucket, 'region': FORMER_REGION, 'accelerate': False},
+        {'route': 'regional', 'bucket': bucket, 'region': region, 'accelerate': False}
+    ]
+    if acceleration_enabled(get_aws_client('s3', region_name=region), bucket):
+        candidates.append({'route': 'accelerated', 'bucket': bucket, 'region': region, 'accelerate': True})
+    else:
+        print(f"Transfer Acceleration is not enabled on {bucket}, skipping the accelerated route")
+
+    for candidate in candidates:
+        candidate['client'] = get_aws_client('s3', region_name=candidate['region'], accelerate=candidate['accelerate'])
+    return candidates
+
+
+def measure(route: Dict[str, Any], key: str, iterations: int, part_size: int, workers: int) -> Dict[str, Any]:
+    """Download the object `iterations` times over one route"""
+    downloader = RangedDownloader(route['client'], part_size=part_size, workers=workers)
+    seconds: List[float] = []
+    size = 0
+    with tempfile.TemporaryDirectory(prefix='s3-routes-') as directory:
+        for iteration in range(iterations):
+            started = time.perf_counter()
+            result = downloader.download(route['bucket'], key, os.path.join(directory, f"app-{iteration}"))
+            seconds.append(time.perf_counter() - started)
+            size = result['bytes']
+            os.unlink(result['path'])
+
+    median = statistics.median(seconds)
+    return {
+        'route': route['route'],
+        'bucket': route['bucket'],
+        'region': route['region'],
+        'bytes': size,
+        'median_s': round(median, 3),
+        'min_s': round(min(seconds), 3),
+        'max_s': round(max(seconds), 3),
+        'throughput_mbps': round(size / (1024 * 1024) / max(median, 0.001), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', required=True, help='bucket the apps are uploaded to')
+    parser.add_argument('--key', required=True, help='app object to download')
+    parser.add_argument('--iterations', type=int, default=3, help='downloads per route')
+    parser.add_argument('--part-mb', type=float, default=16, help='ranged GET size in MB')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent ranged GETs')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    print(f"Runner region: {local_region() or 'unknown (set AWS_REGION)'}")
+    results = []
+    print(f"{'route':>12} {'region':>15} {'median':>8} {'min':>8} {'max':>8} {'MB/s':>8}")
+    for route in routes(args.bucket):
+        try:
+            row = measure(route, args.key, args.iterations, int(args.part_mb * 1024 * 1024), args.workers)
+        except Exception as e:
+            print(f"{route['route']:>12} {route['region']:>15} failed: {str(e)}")
+            continue
+        results.append(row)
+        print(f"{row['route']:>12} {row['region']:>15} {row['median_s']:>7.2f}s {row['min_s']:>7.2f}s "
+              f"{row['max_s']:>7.2f}s {row['throughput_mbps']:>8.1f}")
+
+    if results:
+        fastest = min(results, key=lambda row: row['median_s'])
+        baseline = next((row for row in results if row['route'] == 'default'), None)
+        if baseline and fastest is not baseline:
+            print(f"\nFastest: {fastest['route']}, {1 - fastest['median_s'] / baseline['median_s']:.0%} "
+                  "less time than the default client")
+        else:
+            print(f"\nFastest: {fastest['route']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'runner_region': local_region(), 'key': args.key, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
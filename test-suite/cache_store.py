@@ -0,0 +1,94 @@
+import json
+import os
+import logging
+import threading
+from typing import Dict, Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCacheStore:
+    """JSON document persisted to a local file and optionally mirrored to S3"""
+
+    def __init__(self, local_path: str, s3_client: Any = None, s3_bucket: Optional[str] = None,
+                 s3_key: Optional[str] = None):
+        self.local_path = local_path
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_key = s3_key
+        self._lock = threading.Lock()
+
+    @property
+    def uses_s3(self) -> bool:
+        return bool(self.s3_client and self.s3_bucket and self.s3_key)
+
+    def load(self) -> Dict[str, Any]:
+        """Load the document, preferring the local copy over S3"""
+        with self._lock:
+            document = self._read_local()
+            if document is None and self.uses_s3:
+                document = self._read_s3()
+                if document is not None:
+                    self._write_local(document)
+            return document or {}
+
+    def save(self, document: Dict[str, Any], merge_key: Optional[str] = None,
+             deleted_keys: Iterable[str] = ()):
+        """Persist the document locally and to S3.
+
+        When merge_key is given, entries under that key which another build wrote
+        to S3 in the meantime are kept unless this document overrides them or they
+        are listed in deleted_keys.
+        """
+        with self._lock:
+            if merge_key and self.uses_s3:
+                remote = self._read_s3() or {}
+                merged = dict(remote.get(merge_key, {}))
+                merged.update(document.get(merge_key, {}))
+                for key in deleted_keys:
+                    merged.pop(key, None)
+                document = dict(document, **{merge_key: merged})
+
+            self._write_local(document)
+            if self.uses_s3:
+                self._write_s3(document)
+            return document
+
+    def _read_local(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.local_path):
+            return None
+        try:
+            with open(self.local_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {self.local_path}: {str(e)}")
+            return None
+
+    def _write_local(self, document: Dict[str, Any]):
+        directory = os.path.dirname(self.local_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.local_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.local_path)
+
+    def _read_s3(self) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=self.s3_key)
+            return json.loads(response['Body'].read())
+        except Exception as e:
+            # A missing or unreadable remote cache only costs a cache miss
+            logger.info(f"No cache found at s3://{self.s3_bucket}/{self.s3_key}: {str(e)}")
+            return None
+
+    def _write_s3(self, document: Dict[str, Any]):
+        try:
+            self.s3_client.put_object(
+                Bucket=self.s3_bucket,
+                Key=self.s3_key,
+                Body=json.dumps(document, indent=2, sort_keys=True).encode('utf-8'),
+                ContentType='application/json'
+            )
+        except Exception as e:
+            logger.warning(f"Failed to write cache to s3://{self.s3_bucket}/{self.s3_key}: {str(e)}")
@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import re
+from collections import deque
+from typing import Dict, Any, Deque, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bare specifiers in compiled CommonJS (tsc emits require() for every import)
+REQUIRE_PATTERN = re.compile(r'''\brequire\(\s*['"]([^'"./][^'"]*)['"]\s*\)''')
+STRING_LITERAL = re.compile(r'''['"]([a-z][a-z0-9-]*)['"]''')
+
+# How WebdriverIO resolves the short names used for runners, frameworks, reporters and services
+WDIO_PLUGIN_PATTERNS = [
+    '@wdio/{}-runner', '@wdio/{}-framework', '@wdio/{}-reporter', '@wdio/{}-service',
+    'wdio-{}-reporter', 'wdio-{}-service'
+]
+
+# Provided by the Device Farm host (avm) or only needed to compile; never followed
+# through optional or peer dependencies
+HOST_PROVIDED = {'appium', 'appium-xcuitest-driver', 'appium-uiautomator2-driver'}
+TOOLING_ONLY = {'typescript', 'ts-node'}
+
+
+def is_tooling(name: str) -> bool:
+    return name in HOST_PROVIDED or name in TOOLING_ONLY or name.startswith('@types/')
+
+
+def _read_manifest(package_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(package_dir, 'package.json'), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def package_name(specifier: str) -> str:
+    """'@wdio/cli/build/x' -> '@wdio/cli', 'lodash/fp' -> 'lodash'"""
+    parts = specifier.split('/')
+    return '/'.join(parts[:2]) if specifier.startswith('@') else parts[0]
+
+
+def _js_files(directory: str) -> Iterator[str]:
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != 'node_modules')
+        for name in sorted(files):
+            if name.endswith('.js'):
+                yield os.path.join(root, name)
+
+
+def runtime_roots(dist_dir: str, config_dir: str, declared: Iterable[str]) -> Set[str]:
+    """Declared dependencies the compiled suite loads, directly or as a WebdriverIO plugin"""
+    declared = set(declared)
+    roots = set()
+    for path in _js_files(dist_dir):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            source = f.read()
+        roots.update(package_name(specifier) for specifier in REQUIRE_PATTERN.findall(source))
+
+        # Configs name plugins by short string ('local', 'mocha', 'spec', ...)
+        if os.path.abspath(path).startswith(os.path.abspath(config_dir) + os.sep):
+            for word in set(STRING_LITERAL.findall(source)):
+                roots.update(
+                    candidate for candidate in (pattern.format(word) for pattern in WDIO_PLUGIN_PATTERNS)
+                    if candidate in declared
+                )
+
+    # Node built-ins and anything not declared are not ours to ship
+    return {name for name in roots if name in declared}
+
+
+def resolve_package(name: str, from_dir: str, stop_dir: str) -> Optional[str]:
+    """Real directory of `name` as Node would resolve it from from_dir, or None if not installed"""
+    directory = from_dir
+    stop_dir = os.path.dirname(os.path.abspath(stop_dir))
+    while True:
+        if os.path.basename(directory) != 'node_modules':
+            candidate = os.path.join(directory, 'node_modules', *name.split('/'))
+            if os.path.isfile(os.path.join(candidate, 'package.json')):
+                return os.path.realpath(candidate)
+        parent = os.path.dirname(directory)
+        if parent == directory or directory == stop_dir:
+            return None
+        directory = parent
+
+
+class DependencyClosure:
+    """Runtime dependency closure of the suite, laid out as a flat npm-style node_modules.
+
+    Starting from the declared packages the compiled suite actually loads, dependencies
+    are followed through each package's manifest and resolved the way Node resolves
+    them, so pnpm's symlinked store works as well as a hoisted npm tree. Each resolved
+    package directory is shipped once at node_modules/<name>, and nested under its
+    dependent only when another version already holds that name.
+    """
+
+    def __init__(self, suite_dir: str, keep: Iterable[str] = ()):
+        self.suite_dir = os.path.abspath(suite_dir)
+        self.manifest = _read_manifest(self.suite_dir)
+        self.declared = dict(self.manifest.get('dependencies', {}))
+        self.keep = set(keep)
+        self.roots: Set[str] = set()
+        # placement ('node_modules/a/node_modules/b') -> real package directory
+        self.placements: Dict[str, str] = {}
+        self.missing: Set[str] = set()
+
+    def compute(self, dist_dir: str, config_dir: str) -> 'DependencyClosure':
+        self.roots = runtime_roots(dist_dir, config_dir, self.declared) | (self.keep & set(self.declared))
+        queue: Deque[Tuple[str, str]] = deque()
+
+        for name in sorted(self.roots):
+            real = resolve_package(name, self.suite_dir, self.suite_dir)
+            if real is None:
+                self.missing.add(name)
+                continue
+            placement = f"node_modules/{name}"
+            self.placements[placement] = real
+            queue.append((placement, real))
+
+        while queue:
+            placement, real = queue.popleft()
+            for name, required in self._dependencies(real):
+                dep_real = resolve_package(name, real, self.suite_dir)
+                if dep_real is None:
+                    if required:
+                        self.missing.add(name)
+                    continue
+
+                existing = self._lookup(placement, name)
+                if existing is not None and self.placements[existing] == dep_real:
+                    continue
+                # Hoist to the top unless another version already holds the name on this path
+                dep_placement = f"{placement}/node_modules/{name}" if existing else f"node_modules/{name}"
+                self.placements[dep_placement] = dep_real
+                queue.append((dep_placement, dep_real))
+
+        if self.missing:
+            logger.warning(f"Dependencies not installed, not shipped: {', '.join(sorted(self.missing))}")
+        return self
+
+    def pruned_manifest(self) -> Dict[str, Any]:
+        """package.json declaring only the runtime roots, for the npm install on the device host"""
+        manifest = dict(self.manifest)
+        manifest['dependencies'] = {
+            name: version for name, version in sorted(self.declared.items()) if name in self.roots
+        }
+        manifest.pop('devDependencies', None)
+        return manifest
+
+    def package_lock(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """npm package-lock.json (lockfileVersion 3) for the shipped node_modules layout.
+
+        Derived from the installed packages alone rather than resolved against the
+        registry, so identical installs always give an identical lock.
+        """
+        root = {field: manifest[field] for field in ('name', 'version') if field in manifest}
+        packages = {'': dict(root, **{
+            field: dict(sorted(manifest[field].items()))
+            for field in ('dependencies', 'devDependencies') if manifest.get(field)
+        })}
+        for placement, real in sorted(self.placements.items()):
+            package = _read_manifest(real)
+            entry = {'version': package['version']} if 'version' in package else {}
+            for field in ('dependencies', 'optionalDependencies', 'peerDependencies'):
+                if package.get(field):
+                    entry[field] = dict(sorted(package[field].items()))
+            packages[placement] = entry
+        return dict(root, lockfileVersion=3, requires=True, packages=packages)
+
+    def entries(self) -> List[Tuple[str, str]]:
+        """(archive name, source path) for every shipped file"""
+        entries = []
+        for placement, real in sorted(self.placements.items()):
+            entries.extend((f"{placement}/{relative}", path) for relative, path in package_files(real))
+        return entries
+
+    def size_report(self) -> Dict[str, Any]:
+        """Shipped packages by size, plus the declared dependencies left out"""
+        sizes: Dict[str, int] = {}
+        packages: Dict[str, Dict[str, Any]] = {}
+        for placement, real in self.placements.items():
+            if real not in sizes:
+                sizes[real] = sum(os.path.getsize(path) for _, path in package_files(real))
+            manifest = _read_manifest(real)
+            key = f"{manifest.get('name', placement)}@{manifest.get('version', '?')}"
+            package = packages.setdefault(key, {'package': key, 'copies': 0, 'bytes': 0})
+            package['copies'] += 1
+            package['bytes'] += sizes[real]
+
+        dropped = []
+        for name in sorted(set(self.declared) - self.roots):
+            real = resolve_package(name, self.suite_dir, self.suite_dir)
+            dropped.append({
+                'package': name,
+                'bytes': sum(os.path.getsize(path) for _, path in package_files(real)) if real else 0
+            })
+
+        shipped = sorted(packages.values(), key=lambda package: (-package['bytes'], package['package']))
+        return {
+            'roots': sorted(self.roots),
+            'packages': shipped,
+            'total_bytes': sum(package['bytes'] for package in shipped),
+            'dropped': dropped
+        }
+
+    def _lookup(self, placement: str, name: str) -> Optional[str]:
+        """The placement Node would find for `name` when requiring it from placement"""
+        directory = placement
+        while directory:
+            candidate = f"{directory}/node_modules/{name}"
+            if candidate in self.placements:
+                return candidate
+            index = directory.rfind('/node_modules/')
+            directory = directory[:index] if index >= 0 else ''
+        top = f"node_modules/{name}"
+        return top if top in self.placements else None
+
+    def _dependencies(self, package_dir: str) -> List[Tuple[str, bool]]:
+        """(name, required) for a package's dependencies; optional and peer ones only if installed"""
+        manifest = _read_manifest(package_dir)
+        optional = set(manifest.get('optionalDependencies', {}))
+        dependencies = [(name, name not in optional) for name in manifest.get('dependencies', {})]
+        dependencies.extend(
+            (name, False) for name in sorted(optional | set(manifest.get('peerDependencies', {})))
+            if name not in manifest.get('dependencies', {}) and not is_tooling(name)
+        )
+        return sorted(dependencies)
+
+
+def package_files(package_dir: str) -> Iterator[Tuple[str, str]]:
+    """(relative path, absolute path) for a package's own files, without nested node_modules or dot-files"""
+    visited = set()
+    for root, dirs, files in os.walk(package_dir, followlinks=True):
+        # Symlinked directories are followed, but never back into one already walked
+        real = os.path.realpath(root)
+        if real in visited:
+            dirs[:] = []
+            continue
+        visited.add(real)
+        if root == package_dir:
+            dirs[:] = [d for d in dirs if d != 'node_modules']
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            if os.path.isfile(path):
+                yield os.path.relpath(path, package_dir).replace(os.sep, '/'), path
+
+
+def format_size_report(report: Dict[str, Any], limit: int = 25) -> str:
+    lines = [f"{'package':<60} {'copies':>6} {'size':>10}"]
+    for package in report['packages'][:limit]:
+        lines.append(f"{package['package']:<60} {package['copies']:>6} {package['bytes'] / 1024:>8.0f}KB")
+    if len(report['packages']) > limit:
+        rest = report['packages'][limit:]
+        lines.append(
+            f"{f'... {len(rest)} more':<60} {'':>6} {sum(p['bytes'] for p in rest) / 1024:>8.0f}KB"
+        )
+    lines.append(f"{'total (' + str(len(report['packages'])) + ' packages)':<60} {'':>6} "
+                 f"{report['total_bytes'] / (1024*1024):>8.2f}MB")
+    if report['dropped']:
+        lines.append("Dropped (not loaded at runtime): " + ', '.join(
+            f"{package['package']} ({package['bytes'] / (1024*1024):.1f}MB)" for package in report['dropped']
+        ))
+    return '\n'.join(lines)
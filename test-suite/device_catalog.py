@@ -0,0 +1,115 @@
+import fnmatch
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from cache_store import JsonCacheStore
+from pagination import paginate
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceCatalog:
+    """TTL-cached catalog of Device Farm projects and their private device pools.
+
+    Listings are fully paginated and kept in a JsonCacheStore, so once the cache
+    is warm a build resolves its project and pool without any catalog calls.
+    """
+
+    ENTRIES_KEY = 'entries'
+
+    def __init__(self, devicefarm_client: Any, store: JsonCacheStore, ttl_seconds: float = 3600):
+        self.devicefarm_client = devicefarm_client
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.RLock()
+
+    def projects(self) -> List[Dict[str, Any]]:
+        """All Device Farm projects in the account"""
+        return self._cached('projects', lambda: [
+            {'arn': project['arn'], 'name': project.get('name')}
+            for project in paginate(self.devicefarm_client.list_projects, 'projects')
+        ])
+
+    def device_pools(self, project_arn: str) -> List[Dict[str, Any]]:
+        """Private (user-created) device pools of a project"""
+        return self._cached(f"pools|{project_arn}", lambda: [
+            {'arn': pool['arn'], 'name': pool.get('name'), 'rules': pool.get('rules', [])}
+            for pool in paginate(
+                self.devicefarm_client.list_device_pools, 'devicePools', arn=project_arn, type='PRIVATE'
+            )
+        ])
+
+    def project(self, project_arn: str) -> Dict[str, Any]:
+        """Look up a project by ARN, failing if it does not exist"""
+        for project in self.projects():
+            if project['arn'] == project_arn:
+                return project
+
+        # A project created after the catalog was cached forces one refresh
+        self.invalidate('projects')
+        for project in self.projects():
+            if project['arn'] == project_arn:
+                return project
+        raise RuntimeError(f"Device Farm project not found: {project_arn}")
+
+    def resolve_pool(self, project_arn: str, pool_name: Optional[str] = None,
+                     pool_pattern: Optional[str] = None) -> Dict[str, Any]:
+        """Pick a private device pool by exact name or shell-style name pattern"""
+        pools = self.device_pools(project_arn)
+
+        if pool_name:
+            matches = [pool for pool in pools if pool['name'] == pool_name]
+            wanted = f"named '{pool_name}'"
+        else:
+            matches = [pool for pool in pools if fnmatch.fnmatchcase(pool['name'] or '', pool_pattern or '*')]
+            wanted = f"matching '{pool_pattern}'"
+
+        if not matches:
+            available = ', '.join(pool['name'] for pool in pools) or 'none'
+            raise RuntimeError(f"No private device pool {wanted} in project (available: {available})")
+
+        matches.sort(key=lambda pool: pool['name'])
+        if len(matches) > 1:
+            logger.warning(
+                f"{len(matches)} device pools {wanted}, using '{matches[0]['name']}' "
+                f"(others: {', '.join(pool['name'] for pool in matches[1:])})"
+            )
+        return matches[0]
+
+    def match_pools(self, project_arn: str, patterns: List[str]) -> List[Dict[str, Any]]:
+        """Every private device pool whose name equals or matches one of the shell-style patterns"""
+        return sorted(
+            (pool for pool in self.device_pools(project_arn)
+             if any(fnmatch.fnmatchcase(pool['name'] or '', pattern) for pattern in patterns)),
+            key=lambda pool: pool['name']
+        )
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._load().pop(key, None)
+            self._entries = dict(self.store.save(
+                {self.ENTRIES_KEY: self._load()}, merge_key=self.ENTRIES_KEY, deleted_keys=[key]
+            ).get(self.ENTRIES_KEY, {}))
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = dict(self.store.load().get(self.ENTRIES_KEY, {}))
+        return self._entries
+
+    def _cached(self, key: str, fetch) -> List[Dict[str, Any]]:
+        with self._lock:
+            entry = self._load().get(key)
+            if entry and time.time() - entry['fetched_at'] < self.ttl_seconds:
+                logger.info(f"Device catalog cache hit for {key.split('|')[0]}")
+                return entry['items']
+
+            logger.info(f"Refreshing device catalog entry for {key.split('|')[0]}")
+            items = fetch()
+            self._entries[key] = {'fetched_at': int(time.time()), 'items': items}
+            self._entries = dict(self.store.save(
+                {self.ENTRIES_KEY: self._entries}, merge_key=self.ENTRIES_KEY
+            ).get(self.ENTRIES_KEY, {}))
+            return items
@@ -1,26 +1,152 @@
 import json
 import os
 import logging
-import boto3
-import subprocess
+import sys
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, List, Optional
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from cache_store import JsonCacheStore
+from device_catalog import DeviceCatalog
+from run_monitor import COUNTER_FIELDS, RunMonitor
+from packager import dependencies_paths
+from result_ingest import VIDEO_POLICIES, ResultIngestor
+from run_history import RunHistory
+from s3_download import RangedDownloader
+from s3_routing import ACCELERATE_MODES, ArtifactRouter, LazyClient, bucket_region
+from s3_stream import VerifyingStream, s3_content_md5, s3_content_sha256
+from sharding import (
+    SpecDurations, expected_durations, list_spec_files, render_shard_test_spec, spec_key, split_shards
 )
+from status_poller import StatusPoller
+from telemetry import DEFAULT_NAMESPACE, ProcessProfiler, Tracer
+from test_specs import (
+    TEST_SPEC_VARIANTS, dependency_archive_url, stage_dependency_archive, write_install_free_test_spec
+)
+from transfer import PresignedUploader, create_session
+from upload_cache import UploadCache, sha256_file
+
 logger = logging.getLogger(__name__)
 
+# Optional runner settings and their defaults
+OPTIONAL_SETTINGS = {
+    'UPLOAD_CACHE_ENABLED': 'true',
+    'UPLOAD_CACHE_PATH': '/tmp/devicefarm-cache/uploads.json',
+    'UPLOAD_CACHE_S3_KEY': 'devicefarm-cache/uploads.json',
+    'CONCURRENT_EXECUTION': 'false',
+    'STREAMING_TRANSFER': 'false',
+    'DOWNLOAD_PART_SIZE_MB': '16',
+    'DOWNLOAD_WORKERS': '8',
+    'S3_ACCELERATE': 'auto',
+    'UPLOAD_PROCESSING_TIMEOUT': '300',
+    'UPLOAD_PUT_ATTEMPTS': '4',
+    'POLL_INITIAL_INTERVAL': '1',
+    'POLL_MAX_INTERVAL': '15',
+    'MONITOR_RUN': 'false',
+    'RUN_TIMEOUT': '7200',
+    'RUN_POLL_INITIAL_INTERVAL': '10',
+    'RUN_POLL_MAX_INTERVAL': '60',
+    'RUN_PASSING_RESULTS': 'PASSED',
+    'RUN_REQUEST_ID': '',
+    'RUN_RESUME': 'false',
+    'DEVICE_POOL_NAME': '',
+    'DEVICE_POOL_PATTERN': '',
+    'CATALOG_CACHE_PATH': '/tmp/devicefarm-cache/catalog.json',
+    'CATALOG_CACHE_S3_KEY': 'devicefarm-cache/catalog.json',
+    'CATALOG_TTL_SECONDS': '3600',
+    'FANOUT_EXECUTION': 'false',
+    'FANOUT_DEVICE_POOLS': '',
+    'APP_FILES': '',
+    'SHARD_COUNT': '1',
+    'SHARD_DURATIONS_PATH': '/tmp/devicefarm-cache/spec-durations.json',
+    'SHARD_DURATIONS_S3_KEY': 'devicefarm-cache/spec-durations.json',
+    'TEST_SPEC_VARIANT': 'install-free',
+    'APPIUM_READY_INTERVAL': '0.25',
+    'APPIUM_READY_TIMEOUT': '30',
+    'PRESTAGED_UPLOADS': '',
+    'DEPENDENCIES_BUCKET': '',
+    'DEPENDENCIES_BASE_URL': '',
+    'DEPENDENCIES_S3_PREFIX': 'devicefarm-cache/dependencies/',
+    'DEPENDENCIES_URL_EXPIRY': '43200',
+    'INGEST_RESULTS': 'false',
+    'RESULTS_S3_PREFIX': 'results/',
+    'INGEST_WORKERS': '8',
+    'SUMMARY_WORKERS': '8',
+    'INGEST_VIDEO_POLICY': 'link',
+    'INGEST_MAX_ARTIFACT_MB': '200',
+    'RUN_HISTORY_ENABLED': 'true',
+    'RUN_HISTORY_PATH': '/tmp/devicefarm-cache/run-history.sqlite3',
+    'RUN_HISTORY_S3_PREFIX': 'devicefarm-cache/run-history/',
+    'TELEMETRY_ENABLED': 'true',
+    'METRICS_NAMESPACE': DEFAULT_NAMESPACE
+}
+
+# AWS clients and the HTTP session are created once per process and shared by every
+# runner; boto3 and requests are only imported when the first runner needs them
+_shared_lock = threading.Lock()
+_aws_clients: Dict[str, Any] = {}
+_http_session = None
+
+def configure_logging():
+    """Configure logging for the entry points; importing this module leaves logging alone"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+def get_aws_client(service_name: str, region_name: str = 'us-west-2', accelerate: bool = False) -> Any:
+    """Return a process-wide boto3 client, creating it on first use.
+    
+    accelerate=True gives an S3 client that uses the Transfer Acceleration endpoints.
+    """
+    key = f"{service_name}:{region_name}" + (':accelerate' if accelerate else '')
+    with _shared_lock:
+        if key not in _aws_clients:
+            import boto3
+            from botocore.config import Config
+            config = Config(s3={'use_accelerate_endpoint': True}) if accelerate else None
+            _aws_clients[key] = boto3.client(service_name, region_name=region_name, config=config)
+        return _aws_clients[key]
+
+def set_aws_client(service_name: str, client: Any, region_name: str = 'us-west-2', accelerate: bool = False):
+    """Install the process-wide client for a service, such as a local stand-in for benchmarks"""
+    with _shared_lock:
+        _aws_clients[f"{service_name}:{region_name}" + (':accelerate' if accelerate else '')] = client
+
+def get_http_session() -> Any:
+    """Return the process-wide pooled requests session used for pre-signed uploads and artifacts"""
+    global _http_session
+    with _shared_lock:
+        if _http_session is None:
+            _http_session = create_session()
+        return _http_session
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Main entry point for Device Farm test execution"""
+    configure_logging()
+    
+    # PROFILE_OUTPUT opts into a cProfile dump of the whole run, every thread included
+    profile_output = os.getenv('PROFILE_OUTPUT')
+    if profile_output:
+        with ProcessProfiler(profile_output).profiling():
+            return _handle(event, context)
+    return _handle(event, context)
+
+def _handle(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
         logger.info("Starting Device Farm test execution")
         
-        runner = DeviceFarmTestRunner()
-        result = runner.execute()
+        # Coalesced triggers hand over several apps to test in one build; in fan-out
+        # mode a single runner handles them so shared artifacts are uploaded once
+        app_files = json.loads(os.getenv('APP_FILES') or '[]')
+        if len(app_files) > 1 and not fanout_enabled():
+            result = execute_app_group(app_files)
+        else:
+            runner = DeviceFarmTestRunner()
+            result = runner.execute()
         
         logger.info("Test execution completed successfully")
         return {
@@ -34,15 +160,128 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)})
         }
 
+def optional_settings(overrides: Dict[str, str]) -> Dict[str, str]:
+    """Optional settings from overrides, then the environment, then their defaults"""
+    return {var: overrides.get(var, os.getenv(var, default)) for var, default in OPTIONAL_SETTINGS.items()}
+
+def dependency_archive_key(config: Dict[str, str], info: Dict[str, Any]) -> str:
+    """S3 key of a split dependency archive, named after its content hash"""
+    return f"{config['DEPENDENCIES_S3_PREFIX']}{info['sha256']}.zip"
+
+def find_test_spec(config: Dict[str, str], platform: str, dependencies_url: Optional[str] = None) -> str:
+    """The test spec for a platform: generated install-free, or the legacy one shipped next to handler.py.
+
+    Runners and the deploy-time pre-staging both render it here, so the same
+    settings always produce the same spec.
+    """
+    platform = platform.lower()
+    if config['TEST_SPEC_VARIANT'] == 'install-free':
+        return write_install_free_test_spec(
+            platform,
+            ready_interval=float(config['APPIUM_READY_INTERVAL']),
+            ready_timeout=int(config['APPIUM_READY_TIMEOUT']),
+            dependencies_url=dependencies_url
+        )
+    
+    # Test spec file is at the same level as handler.py
+    test_spec_filename = "appium-ios-test.yml"
+    test_spec_path = os.path.join(os.path.dirname(__file__), test_spec_filename)
+    
+    # Fallback to current directory if __file__ approach doesn't work
+    if not os.path.exists(test_spec_path):
+        test_spec_path = test_spec_filename
+    
+    if not os.path.exists(test_spec_path):
+        raise FileNotFoundError(f"Test spec file '{test_spec_filename}' not found at: {test_spec_path}")
+    
+    logger.info(f"Found test spec file at: {test_spec_path}")
+    return test_spec_path
+
+def fanout_enabled() -> bool:
+    """Whether FANOUT_EXECUTION asks one runner to schedule every app and pool itself"""
+    return os.getenv('FANOUT_EXECUTION', '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def execute_app_group(app_files: List[Dict[str, str]],
+                      runner_factory: Optional[Callable[[Dict[str, str]], Any]] = None) -> Dict[str, Any]:
+    """Run the workflow for every app of a coalesced group in parallel"""
+    runner_factory = runner_factory or DeviceFarmTestRunner
+    logger.info(f"Executing test workflow for {len(app_files)} apps")
+    
+    runs = []
+    errors = {}
+    
+    with ThreadPoolExecutor(max_workers=len(app_files), thread_name_prefix='df-app') as executor:
+        futures = {
+            app['APP_FILE_PATH']: executor.submit(lambda overrides: runner_factory(overrides).execute(), app)
+            for app in app_files
+        }
+        
+        for app_file_path, future in futures.items():
+            try:
+                runs.append(dict(future.result(), app_file_path=app_file_path))
+            except Exception as e:
+                logger.error(f"Test execution failed for {app_file_path}: {str(e)}")
+                errors[app_file_path] = str(e)
+    
+    return {
+        'runs': runs,
+        'errors': errors,
+        'passed': not errors and all(run.get('passed', True) for run in runs)
+    }
+
 class DeviceFarmTestRunner:
-    def __init__(self):
-        """Initialize the test runner with AWS clients and configuration"""
-        self.config = self._load_config()
-        self.s3_client = boto3.client('s3', region_name='us-west-2')
-        self.devicefarm_client = boto3.client('devicefarm', region_name='us-west-2')
-        
-    def _load_config(self) -> Dict[str, str]:
-        """Load configuration from environment variables"""
+    def __init__(self, config_overrides: Optional[Dict[str, str]] = None,
+                 status_poller: Optional[StatusPoller] = None,
+                 upload_cache: Optional[UploadCache] = None,
+                 device_catalog: Optional[DeviceCatalog] = None,
+                 tracer: Optional[Tracer] = None):
+        """Initialize the test runner with AWS clients and configuration.
+        
+        Long-lived callers such as the worker pass in a shared poller, upload cache
+        and device catalog so their warm state survives across runs. Fan-out runners
+        share their parent's tracer so one breakdown covers every run.
+        """
+        self.config_overrides = config_overrides or {}
+        self.config = self._load_config(self.config_overrides)
+        self.tracer = tracer or Tracer(
+            namespace=self.config['METRICS_NAMESPACE'],
+            enabled=self._is_enabled('TELEMETRY_ENABLED')
+        )
+        # The app may be read over acceleration; everything else goes to the bucket
+        # through a client for its own region, so S3 never redirects
+        self.app_router = ArtifactRouter(
+            lambda region_name, accelerate: get_aws_client('s3', region_name=region_name, accelerate=accelerate),
+            self.config['S3_BUCKET'],
+            accelerate=self.config['S3_ACCELERATE']
+        )
+        # The bucket's region is looked up on the first S3 call, so creating a runner makes none
+        self.s3_client = LazyClient(self.app_router.source_client)
+        self._app_route: Optional[Dict[str, Any]] = None
+        self.uploader = PresignedUploader(get_http_session(), attempts=int(self.config['UPLOAD_PUT_ATTEMPTS']))
+        self.devicefarm_client = get_aws_client('devicefarm')
+        self.upload_cache = upload_cache or self._create_upload_cache()
+        self.device_catalog = device_catalog or DeviceCatalog(
+            self.devicefarm_client,
+            JsonCacheStore(
+                self.config['CATALOG_CACHE_PATH'],
+                s3_client=self.s3_client,
+                s3_bucket=self.config['S3_BUCKET'],
+                s3_key=self.config['CATALOG_CACHE_S3_KEY'] or None
+            ),
+            ttl_seconds=float(self.config['CATALOG_TTL_SECONDS'])
+        )
+        self.status_poller = status_poller or StatusPoller(
+            self.devicefarm_client,
+            initial_interval=float(self.config['POLL_INITIAL_INTERVAL']),
+            max_interval=float(self.config['POLL_MAX_INTERVAL'])
+        )
+        self._dependencies_url: Optional[str] = None
+        self._dependencies_lock = threading.Lock()
+        # Phase timings of each run are measured from when its runner was created
+        self._started = time.monotonic()
+        
+    def _load_config(self, overrides: Dict[str, str]) -> Dict[str, str]:
+        """Load configuration from environment variables, with per-run overrides taking precedence"""
         required_vars = [
             'ANDROID_PROJECT_ARN',
             'IOS_PROJECT_ARN', 
@@ -55,7 +294,7 @@ class DeviceFarmTestRunner:
         missing_vars = []
         
         for var in required_vars:
-            value = os.getenv(var)
+            value = overrides.get(var) or os.getenv(var)
             if not value:
                 missing_vars.append(var)
             else:
@@ -63,13 +302,112 @@ class DeviceFarmTestRunner:
         
         if missing_vars:
             raise ValueError(f"Required environment variables not set: {', '.join(missing_vars)}")
+        
+        config.update(optional_settings(overrides))
+        
+        if config['INGEST_VIDEO_POLICY'] not in VIDEO_POLICIES:
+            raise ValueError(
+                f"INGEST_VIDEO_POLICY must be one of {', '.join(VIDEO_POLICIES)}, got: {config['INGEST_VIDEO_POLICY']}"
+            )
+        
+        config['S3_ACCELERATE'] = config['S3_ACCELERATE'].strip().lower()
+        if config['S3_ACCELERATE'] not in ACCELERATE_MODES:
+            raise ValueError(
+                f"S3_ACCELERATE must be one of {', '.join(ACCELERATE_MODES)}, got: {config['S3_ACCELERATE']}"
+            )
+        
+        if config['TEST_SPEC_VARIANT'] not in TEST_SPEC_VARIANTS:
+            raise ValueError(
+                f"TEST_SPEC_VARIANT must be one of {', '.join(TEST_SPEC_VARIANTS)}, got: {config['TEST_SPEC_VARIANT']}"
+            )
             
         logger.info(f"Configuration loaded for app type: {config['APP_TYPE']}")
         return config
     
+    def _is_enabled(self, var: str) -> bool:
+        """Interpret an optional configuration value as a boolean flag"""
+        return self.config.get(var, '').strip().lower() in ('1', 'true', 'yes', 'on')
+    
+    def _create_upload_cache(self) -> Optional[UploadCache]:
+        """Create the content-addressed upload cache if it is enabled"""
+        if not self._is_enabled('UPLOAD_CACHE_ENABLED'):
+            logger.info("Device Farm upload cache disabled")
+            return None
+        
+        store = JsonCacheStore(
+            self.config['UPLOAD_CACHE_PATH'],
+            s3_client=self.s3_client,
+            s3_bucket=self.config['S3_BUCKET'],
+            s3_key=self.config['UPLOAD_CACHE_S3_KEY'] or None
+        )
+        return UploadCache(self.devicefarm_client, store)
+    
+    def _lookup_cached_upload(self, file_path: str, df_upload_type: str, project_arn: str):
+        """Hash a file and look it up in the pre-staged uploads and the upload cache,
+        returning (content_hash, upload_arn)"""
+        prestaged = self._prestaged_uploads()
+        if not self.upload_cache and not prestaged:
+            return None, None
+        
+        with self.tracer.span('hash_file', upload_type=df_upload_type, bytes=os.path.getsize(file_path)):
+            content_hash = sha256_file(file_path)
+        for upload in prestaged:
+            if (upload['project_arn'], upload['type']) != (project_arn, df_upload_type):
+                continue
+            if upload['sha256'] != content_hash:
+                logger.info(
+                    f"Skipping pre-staged {df_upload_type} upload {upload['arn']}: its content "
+                    f"({upload['sha256'][:12]}) differs from this run's ({content_hash[:12]})"
+                )
+                continue
+            if self._upload_succeeded(upload['arn']):
+                logger.info(f"Using pre-staged {df_upload_type} upload: {upload['arn']}")
+                return content_hash, upload['arn']
+        
+        if not self.upload_cache:
+            return content_hash, None
+        return content_hash, self.upload_cache.lookup(content_hash, project_arn, df_upload_type)
+    
+    def _prestaged_uploads(self) -> List[Dict[str, str]]:
+        """Uploads processed at deploy time (PRESTAGED_UPLOADS), each matched by content hash"""
+        prestaged = self.config['PRESTAGED_UPLOADS']
+        if isinstance(prestaged, str):
+            try:
+                prestaged = json.loads(prestaged or '[]')
+            except ValueError:
+                logger.warning("Ignoring PRESTAGED_UPLOADS, it is not valid JSON")
+                prestaged = []
+        return prestaged
+    
+    def _upload_succeeded(self, upload_arn: str) -> bool:
+        """Whether Device Farm still has an upload and it was processed successfully"""
+        try:
+            status = self.devicefarm_client.get_upload(arn=upload_arn)['upload']['status']
+        except Exception as e:
+            logger.info(f"Pre-staged upload {upload_arn} is no longer available: {str(e)}")
+            return False
+        if status != 'SUCCEEDED':
+            logger.info(f"Skipping pre-staged upload {upload_arn} (status: {status})")
+        return status == 'SUCCEEDED'
+    
     def execute(self) -> Dict[str, Any]:
-        """Execute the complete test workflow"""
-        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        """Execute the complete test workflow and log where its time went"""
+        # A queued request names its runs after its message, so a redelivery can find them again
+        timestamp = self.config['RUN_REQUEST_ID'] or datetime.now().strftime('%Y%m%d-%H%M%S')
+        try:
+            with self.tracer.span('execute', app_type=self.config['APP_TYPE']):
+                return self._execute(timestamp)
+        finally:
+            logger.info("Time spent per phase:")
+            self.tracer.log_breakdown()
+    
+    def _execute(self, timestamp: str) -> Dict[str, Any]:
+        # Sharded runs go through the fan-out path, one run per shard
+        if self._is_enabled('FANOUT_EXECUTION') or int(self.config['SHARD_COUNT']) > 1:
+            return self._execute_fanout(timestamp)
+        
+        if self._is_enabled('CONCURRENT_EXECUTION'):
+            return self._execute_concurrently(timestamp)
         
         logger.info("Starting test execution workflow")
         
@@ -77,16 +415,24 @@ class DeviceFarmTestRunner:
         logger.info("Step 1: Using pre-built test suite")
         test_package_path = self._get_prebuilt_test_suite()
         
-        # 2. Download app from S3
-        logger.info("Step 2: Downloading app from S3")
-        app_file_path = self._download_app()
+        # 2. Download app from S3 (skipped when streaming straight to Device Farm)
+        streaming = self._is_enabled('STREAMING_TRANSFER')
+        if not streaming:
+            logger.info("Step 2: Downloading app from S3")
+            app_file_path = self._download_app()
         
         # 3. Determine Device Farm project based on app type
         project_arn = self._get_project_arn()
         
         # 4. Upload app to Device Farm
         logger.info("Step 3: Uploading app to Device Farm")
-        app_upload_arn = self._upload_to_device_farm(app_file_path, 'app', project_arn, timestamp)
+        if streaming:
+            app_upload_arn = self._stream_app_to_device_farm(project_arn, timestamp)
+        else:
+            try:
+                app_upload_arn = self._upload_to_device_farm(app_file_path, 'app', project_arn, timestamp)
+            finally:
+                self._remove_downloaded_app(app_file_path)
         
         # 5. Upload test package to Device Farm
         logger.info("Step 4: Uploading test package to Device Farm")
@@ -96,9 +442,335 @@ class DeviceFarmTestRunner:
         logger.info("Step 5: Scheduling test run")
         run_result = self._schedule_test_run(project_arn, app_upload_arn, test_upload_arn, timestamp)
         
+        # 7. Optionally wait for the run and collect its results
+        if self._is_enabled('MONITOR_RUN'):
+            logger.info("Step 6: Monitoring test run")
+            run_result = self._monitor_test_run(run_result)
+        
+        logger.info("Test execution workflow completed successfully")
+        return run_result
+    
+    def _execute_concurrently(self, timestamp: str) -> Dict[str, Any]:
+        """Execute the workflow with independent steps overlapped on a thread pool"""
+        logger.info("Starting concurrent test execution workflow")
+        
+        project_arn = self._get_project_arn()
+        
+        # Each chain only depends on its own inputs; the run is scheduled once all have finished
+        steps = {
+            'app': lambda: self._transfer_app(project_arn, timestamp),
+            'test_package': lambda: self._upload_to_device_farm(
+                self._get_prebuilt_test_suite(), 'test', project_arn, timestamp
+            ),
+            'test_spec': lambda: self._upload_existing_test_spec(project_arn, timestamp),
+            'device_pool': lambda: self._get_device_pool_arn(project_arn)
+        }
+        results = self._run_steps_concurrently(steps)
+        
+        logger.info("All concurrent steps completed, scheduling test run")
+        run_result = self._schedule_test_run(
+            project_arn,
+            results['app'],
+            results['test_package'],
+            timestamp,
+            test_spec_arn=results['test_spec'],
+            device_pool_arn=results['device_pool']
+        )
+        
+        if self._is_enabled('MONITOR_RUN'):
+            run_result = self._monitor_test_run(run_result)
+        
         logger.info("Test execution workflow completed successfully")
         return run_result
     
+    def _execute_fanout(self, timestamp: str) -> Dict[str, Any]:
+        """Schedule runs for every app on every selected device pool and aggregate the results"""
+        app_runners = [self._app_runner(app) for app in self._fanout_apps()]
+        project_platforms = {runner._get_project_arn(): runner.config['APP_TYPE'].lower() for runner in app_runners}
+        project_arns = sorted(project_platforms)
+        shards = self._plan_shards(timestamp, sorted(set(project_platforms.values())))
+        logger.info(
+            f"Starting fan-out test execution for {len(app_runners)} app(s) across {len(project_arns)} project(s)"
+        )
+        
+        # Artifacts shared by every run in a project are uploaded once per project
+        steps = {}
+        for project_arn in project_arns:
+            steps[f"test_package|{project_arn}"] = lambda project_arn=project_arn: self._upload_to_device_farm(
+                self._get_prebuilt_test_suite(), 'test', project_arn, timestamp
+            )
+            for shard in shards:
+                platform = project_platforms[project_arn]
+                steps[f"test_spec|{project_arn}|{shard['shard']}"] = (
+                    lambda project_arn=project_arn, shard=shard, platform=platform: self._upload_test_spec(
+                        shard['test_spec_paths'][platform], shard['upload_names'][platform], project_arn
+                    )
+                )
+        for index, runner in enumerate(app_runners):
+            project_arn = runner._get_project_arn()
+            steps[f"app|{index}"] = lambda runner=runner, project_arn=project_arn: runner._transfer_app(
+                project_arn, timestamp
+            )
+            steps[f"device_pools|{index}"] = lambda runner=runner, project_arn=project_arn: runner._get_device_pools(
+                project_arn
+            )
+        results = self._run_steps_concurrently(steps)
+        
+        # One run per app, pool and shard, each scheduled and monitored on its own thread
+        runs = {}
+        for index, runner in enumerate(app_runners):
+            project_arn = runner._get_project_arn()
+            for device_pool in results[f"device_pools|{index}"]:
+                for shard in shards:
+                    label = f"{runner.config['APP_FILE_PATH']} on {device_pool['name']}{shard['label']}"
+                    runs[label] = lambda runner=runner, project_arn=project_arn, index=index, \
+                            device_pool=device_pool, shard=shard: runner._run_on_pool(
+                        project_arn,
+                        results[f"app|{index}"],
+                        results[f"test_package|{project_arn}"],
+                        results[f"test_spec|{project_arn}|{shard['shard']}"],
+                        device_pool,
+                        timestamp,
+                        shard=shard
+                    )
+        logger.info(f"Scheduling {len(runs)} test run(s)")
+        
+        report = {'timestamp': timestamp, 'runs': [], 'errors': {}}
+        with ThreadPoolExecutor(max_workers=len(runs), thread_name_prefix='df-run') as executor:
+            futures = {label: executor.submit(run) for label, run in runs.items()}
+            for label, future in futures.items():
+                try:
+                    report['runs'].append(future.result())
+                except Exception as e:
+                    logger.error(f"Test run {label} failed: {str(e)}")
+                    report['errors'][label] = str(e)
+        
+        report.update(self._aggregate_runs(report['runs']))
+        if len(shards) > 1:
+            self._record_shard_durations(report['runs'])
+        report['passed'] = not report['errors'] and all(run.get('passed', True) for run in report['runs'])
+        
+        logger.info(
+            f"Fan-out finished: {len(report['runs'])} run(s) scheduled, {len(report['errors'])} failed"
+            + (f", overall {'passed' if report['passed'] else 'failed'}" if self._is_enabled('MONITOR_RUN') else '')
+        )
+        return report
+    
+    def _plan_shards(self, timestamp: str, platforms: List[str]) -> List[Dict[str, Any]]:
+        """Split the specs into duration-balanced shards and write a test spec for each, per platform"""
+        test_spec_paths = {platform: self._find_test_spec(platform) for platform in platforms}
+        shard_count = int(self.config['SHARD_COUNT'])
+        if shard_count <= 1:
+            return [{
+                'shard': 1, 'label': '', 'specs': None, 'test_spec_paths': test_spec_paths,
+                'upload_names': {
+                    platform: f"appium-{platform}-test-spec-{timestamp}.yml" for platform in platforms
+                }
+            }]
+        
+        specs = list_spec_files(self._get_prebuilt_test_suite())
+        if not specs:
+            raise RuntimeError("No spec files found in the test package to shard")
+        
+        durations = self._spec_durations().load()
+        expected = expected_durations(specs, durations)
+        spec_shards = split_shards(specs, shard_count, durations)
+        recorded = {spec_key(spec) for spec in durations}
+        logger.info(
+            f"Split {len(specs)} spec(s) into {len(spec_shards)} shard(s) "
+            f"using {len([spec for spec in specs if spec_key(spec) in recorded])} recorded duration(s)"
+        )
+        
+        test_specs = {}
+        for platform, test_spec_path in test_spec_paths.items():
+            with open(test_spec_path, 'r') as f:
+                test_specs[platform] = f.read()
+        shard_dir = tempfile.mkdtemp(prefix='devicefarm-shards-')
+        
+        shards = []
+        for index, specs_in_shard in enumerate(spec_shards):
+            label = f" shard {index + 1}/{len(spec_shards)}"
+            shard_spec_paths = {}
+            for platform, test_spec in test_specs.items():
+                shard_spec_paths[platform] = os.path.join(shard_dir, f"appium-{platform}-test-shard-{index + 1}.yml")
+                with open(shard_spec_paths[platform], 'w') as f:
+                    f.write(render_shard_test_spec(test_spec, specs_in_shard))
+            shards.append({
+                'shard': index + 1,
+                'shard_count': len(spec_shards),
+                'label': label,
+                'specs': specs_in_shard,
+                'expected_seconds': round(sum(expected[spec] for spec in specs_in_shard), 1),
+                'test_spec_paths': shard_spec_paths,
+                'upload_names': {
+                    platform: f"appium-{platform}-test-spec-{timestamp}-shard-{index + 1}.yml"
+                    for platform in test_specs
+                }
+            })
+        return shards
+    
+    def _spec_durations(self) -> SpecDurations:
+        """Recorded per-spec durations used to balance shards"""
+        return SpecDurations(JsonCacheStore(
+            self.config['SHARD_DURATIONS_PATH'],
+            s3_client=self.s3_client,
+            s3_bucket=self.config['S3_BUCKET'],
+            s3_key=self.config['SHARD_DURATIONS_S3_KEY'] or None
+        ))
+    
+    def _record_shard_durations(self, runs: List[Dict[str, Any]]):
+        """Refine per-spec durations from how long each monitored shard actually took"""
+        spec_durations = self._spec_durations()
+        recorded = spec_durations.load()
+        durations = {}
+        for run in runs:
+            # Ingested JUnit reports time each spec directly
+            measured = (run.get('results') or {}).get('spec_durations')
+            if measured:
+                for spec, seconds in measured.items():
+                    durations[spec] = max(durations.get(spec, 0), seconds)
+                continue
+            
+            seconds = (run.get('summary') or {}).get('duration_seconds')
+            if not seconds or not run.get('specs'):
+                continue
+            
+            # Scale the expected durations of the shard's specs to its measured time
+            expected = expected_durations(run['specs'], recorded)
+            scale = seconds / max(sum(expected.values()), 0.001)
+            for spec in run['specs']:
+                durations[spec] = max(durations.get(spec, 0), expected[spec] * scale)
+        
+        if durations:
+            spec_durations.record(durations)
+    
+    def _fanout_apps(self) -> List[Dict[str, str]]:
+        """The apps to fan out over: the coalesced APP_FILES group, or just this runner's app"""
+        app_files = self.config['APP_FILES']
+        if isinstance(app_files, str):
+            app_files = json.loads(app_files or '[]')
+        return app_files or [{'APP_FILE_PATH': self.config['APP_FILE_PATH'], 'APP_TYPE': self.config['APP_TYPE']}]
+    
+    def _app_runner(self, app: Dict[str, str]) -> 'DeviceFarmTestRunner':
+        """A runner for one app of the fan-out that shares this runner's poller, cache and catalog"""
+        return DeviceFarmTestRunner(
+            dict(self.config_overrides, **app),
+            status_poller=self.status_poller,
+            upload_cache=self.upload_cache,
+            device_catalog=self.device_catalog,
+            tracer=self.tracer
+        )
+    
+    def _get_device_pools(self, project_arn: str) -> List[Dict[str, Any]]:
+        """The device pools to fan out over, or the single configured pool"""
+        patterns = [pattern.strip() for pattern in self.config['FANOUT_DEVICE_POOLS'].split(',') if pattern.strip()]
+        if not patterns:
+            return [self._resolve_device_pool(project_arn)]
+        
+        with self.tracer.span('device_pool_lookup', patterns=len(patterns)):
+            device_pools = self.device_catalog.match_pools(project_arn, patterns)
+        if not device_pools:
+            raise RuntimeError(
+                f"No private device pool in project matches any of: {', '.join(patterns)}"
+            )
+        
+        logger.info(
+            f"Fanning out {self.config['APP_TYPE']} runs to {len(device_pools)} device pool(s): "
+            f"{', '.join(pool['name'] for pool in device_pools)}"
+        )
+        return device_pools
+    
+    def _run_on_pool(self, project_arn: str, app_arn: str, test_arn: str, test_spec_arn: str,
+                     device_pool: Dict[str, Any], timestamp: str,
+                     shard: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Schedule this runner's app on one device pool and optionally wait for the result"""
+        run_name = f"SystemTest-{timestamp}-{device_pool['name']}"
+        if shard and shard['specs']:
+            run_name += f"-shard-{shard['shard']}-of-{shard['shard_count']}"
+        
+        run_result = self._schedule_test_run(
+            project_arn,
+            app_arn,
+            test_arn,
+            timestamp,
+            test_spec_arn=test_spec_arn,
+            device_pool_arn=device_pool['arn'],
+            run_name=run_name
+        )
+        run_result.update(
+            app_file_path=self.config['APP_FILE_PATH'],
+            app_type=self.config['APP_TYPE'],
+            device_pool_name=device_pool['name']
+        )
+        if shard and shard['specs']:
+            run_result.update(
+                shard=shard['shard'],
+                shard_count=shard['shard_count'],
+                specs=shard['specs'],
+                expected_seconds=shard['expected_seconds']
+            )
+        
+        if self._is_enabled('MONITOR_RUN'):
+            run_result = self._monitor_test_run(run_result)
+        return run_result
+    
+    def _aggregate_runs(self, runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Sum the test counters and device minutes of every monitored run"""
+        summaries = [run['summary'] for run in runs if 'summary' in run]
+        if not summaries:
+            return {}
+        
+        counters = {field: sum(summary['counters'][field] for summary in summaries) for field in COUNTER_FIELDS}
+        device_minutes = [summary['device_minutes'] for summary in summaries if summary['device_minutes'] is not None]
+        run_seconds = [summary['total_seconds'] for summary in summaries if summary['total_seconds'] is not None]
+        return {
+            'counters': counters,
+            'device_minutes': round(sum(device_minutes), 2) if device_minutes else None,
+            # Parallel runs finish with the slowest one
+            'longest_run_seconds': max(run_seconds) if run_seconds else None,
+            'results': {
+                f"{run['app_file_path']} on {run['device_pool_name']}"
+                + (f" shard {run['shard']}/{run['shard_count']}" if 'shard' in run else ''): run['summary']['result']
+                for run in runs if 'summary' in run
+            }
+        }
+    
+    def _transfer_app(self, project_arn: str, timestamp: str) -> str:
+        """Move the app from S3 to Device Farm, streaming it when enabled"""
+        if self._is_enabled('STREAMING_TRANSFER'):
+            return self._stream_app_to_device_farm(project_arn, timestamp)
+        
+        app_file_path = self._download_app()
+        try:
+            return self._upload_to_device_farm(app_file_path, 'app', project_arn, timestamp)
+        finally:
+            self._remove_downloaded_app(app_file_path)
+    
+    def _run_steps_concurrently(self, steps: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """Run named steps in parallel and fail with a summary of every step that raised"""
+        start_time = time.time()
+        results = {}
+        failures = {}
+        
+        with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix='df-step') as executor:
+            futures = {name: executor.submit(step) for name, step in steps.items()}
+            
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                    logger.info(f"Step '{name}' completed")
+                except Exception as e:
+                    logger.error(f"Step '{name}' failed: {str(e)}")
+                    failures[name] = e
+        
+        logger.info(f"Concurrent steps finished in {time.time() - start_time:.1f} seconds")
+        
+        if failures:
+            details = '; '.join(f"{name}: {str(error)}" for name, error in failures.items())
+            raise RuntimeError(f"{len(failures)} of {len(steps)} steps failed: {details}")
+        
+        return results
+    
     def _get_prebuilt_test_suite(self) -> str:
         """Get the pre-built test suite zip file that was created during Docker build"""
         logger.info("Using pre-built test suite from Docker image")
@@ -128,37 +800,54 @@ class DeviceFarmTestRunner:
         return zip_path
     
     def _download_app(self) -> str:
-        """Download app file from S3"""
+        """Download the app from S3 with parallel ranged GETs, verified against S3's checksum"""
         logger.info(f"Downloading app from s3://{self.config['S3_BUCKET']}/{self.config['APP_FILE_PATH']}")
         
-        # Preserve the original filename and extension
-        import os.path
+        # Preserve the original filename and extension, in a directory of this run's own so
+        # concurrent runners in one process or host never write to the same file
         filename = os.path.basename(self.config['APP_FILE_PATH'])
-        local_app_path = f"/tmp/{filename}"
+        local_app_path = os.path.join(tempfile.mkdtemp(prefix='devicefarm-app-'), filename)
         
         try:
-            self.s3_client.download_file(
-                self.config['S3_BUCKET'],
-                self.config['APP_FILE_PATH'],
-                local_app_path
-            )
-            
-            # Basic validation without file size check
-            file_size = os.path.getsize(local_app_path)
+            with self.tracer.span('download_app') as span:
+                route = self._resolve_app_route()
+                downloader = RangedDownloader(
+                    route['client'],
+                    part_size=int(float(self.config['DOWNLOAD_PART_SIZE_MB']) * 1024 * 1024),
+                    workers=int(self.config['DOWNLOAD_WORKERS'])
+                )
+                download = downloader.download(route['bucket'], self.config['APP_FILE_PATH'], local_app_path)
+                span.set(bytes=download['bytes'], parts=download['parts'], verified=download['verified'],
+                         route=route['route'])
             logger.info(f"App downloaded successfully to {local_app_path}")
-            logger.info(f"File size: {file_size} bytes ({file_size / (1024*1024):.2f} MB)")
+            logger.info(f"File size: {download['bytes']} bytes ({download['bytes'] / (1024*1024):.2f} MB)")
             
             # Basic file validation
-            if file_size == 0:
+            if download['bytes'] == 0:
                 raise ValueError("Downloaded file is empty")
             
-            logger.info(f"Downloaded file: {filename}")
             return local_app_path
             
         except Exception as e:
             logger.error(f"Failed to download app from S3: {str(e)}")
+            self._remove_downloaded_app(local_app_path)
             raise
     
+    def _resolve_app_route(self) -> Dict[str, Any]:
+        """Bucket and S3 client to read the app through: acceleration or the bucket's region"""
+        if self._app_route is None:
+            self._app_route = self.app_router.route(self.config['APP_FILE_PATH'])
+        return self._app_route
+    
+    def _remove_downloaded_app(self, local_app_path: str):
+        """Delete a downloaded app and its per-run directory once Device Farm has it"""
+        try:
+            if os.path.exists(local_app_path):
+                os.remove(local_app_path)
+            os.rmdir(os.path.dirname(local_app_path))
+        except OSError as e:
+            logger.warning(f"Failed to remove downloaded app {local_app_path}: {str(e)}")
+    
     def _get_project_arn(self) -> str:
         """Determine Device Farm project based on app type"""
         app_type = self.config['APP_TYPE'].lower()
@@ -189,6 +878,11 @@ class DeviceFarmTestRunner:
         else:
             raise ValueError(f"Unknown upload type: {upload_type}")
         
+        content_hash, cached_arn = self._lookup_cached_upload(file_path, df_upload_type, project_arn)
+        if cached_arn:
+            logger.info(f"Reusing cached {upload_type} upload, skipping transfer and processing")
+            return cached_arn
+        
         try:
             # Create upload
             response = self.devicefarm_client.create_upload(
@@ -203,8 +897,6 @@ class DeviceFarmTestRunner:
             logger.info(f"Created {upload_type} upload with ARN: {upload_arn}")
             
             # Upload file using pre-signed URL with proper headers
-            import requests
-            
             # Extract filename for Content-Disposition header
             filename = os.path.basename(file_path)
             
@@ -212,14 +904,17 @@ class DeviceFarmTestRunner:
                 'Content-Disposition': f'attachment; filename="{filename}"'
             }
             
-            with open(file_path, 'rb') as f:
-                response = requests.put(upload_url, data=f, headers=headers)
-                response.raise_for_status()
+            with self.tracer.span('upload_put', upload_type=df_upload_type, bytes=os.path.getsize(file_path)) as span:
+                put = self.uploader.put(upload_url, file_path, headers=headers, label=upload_name)
+                span.set(attempts=put['attempts'])
             
             logger.info(f"{upload_type.capitalize()} uploaded successfully")
             
             # Wait for upload to be processed
-            self._wait_for_upload_processing(upload_arn)
+            self._wait_for_upload_processing(upload_arn, project_arn, df_upload_type)
+            
+            if content_hash and self.upload_cache:
+                self.upload_cache.store_upload(content_hash, project_arn, df_upload_type, upload_arn)
             
             return upload_arn
             
@@ -227,64 +922,179 @@ class DeviceFarmTestRunner:
             logger.error(f"Failed to upload {upload_type} to Device Farm: {str(e)}")
             raise
     
-    def _wait_for_upload_processing(self, upload_arn: str, max_wait_time: int = 300):
+    def _stream_app_to_device_farm(self, project_arn: str, timestamp: str) -> str:
+        """Pipe the app from S3 GetObject straight into the Device Farm pre-signed PUT"""
+        route = self._resolve_app_route()
+        s3_client = route['client']
+        bucket = route['bucket']
+        key = self.config['APP_FILE_PATH']
+        df_upload_type = f"{self.config['APP_TYPE'].upper()}_APP"
+        upload_name = os.path.basename(key)
+        
+        logger.info(f"Streaming app from s3://{bucket}/{key} to Device Farm")
+        
+        try:
+            head = s3_client.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+            file_size = head['ContentLength']
+            if file_size == 0:
+                raise ValueError("App file in S3 is empty")
+            
+            logger.info(f"App size: {file_size} bytes ({file_size / (1024*1024):.2f} MB)")
+            
+            # A full-object S3 checksum lets us consult the upload cache before moving any bytes
+            expected_sha256 = s3_content_sha256(head)
+            if expected_sha256 and self.upload_cache:
+                cached_arn = self.upload_cache.lookup(expected_sha256, project_arn, df_upload_type)
+                if cached_arn:
+                    logger.info("Reusing cached app upload, skipping transfer and processing")
+                    return cached_arn
+            
+            response = self.devicefarm_client.create_upload(
+                projectArn=project_arn,
+                name=upload_name,
+                type=df_upload_type
+            )
+            
+            upload_arn = response['upload']['arn']
+            upload_url = response['upload']['url']
+            
+            logger.info(f"Created app upload with ARN: {upload_arn}")
+            
+            # Every attempt opens a fresh stream of the object version we inspected, pinned
+            # by its ETag so the checks below stay meaningful
+            streams: List[VerifyingStream] = []
+            
+            def open_stream() -> VerifyingStream:
+                s3_object = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=head['ETag'])
+                streams.append(VerifyingStream(
+                    s3_object['Body'],
+                    expected_size=file_size,
+                    expected_md5=s3_content_md5(head),
+                    expected_sha256=expected_sha256
+                ))
+                return streams[-1]
+            
+            headers = {
+                'Content-Disposition': f'attachment; filename="{upload_name}"'
+            }
+            
+            with self.tracer.span('upload_put', upload_type=df_upload_type, bytes=file_size, streamed=True,
+                                  route=route['route']) as span:
+                put = self.uploader.put(upload_url, open_stream, size=file_size, headers=headers, label=upload_name)
+                span.set(attempts=put['attempts'])
+                stream = streams[-1]
+                stream.verify()
+            
+            logger.info(
+                f"App streamed successfully in {put['seconds']:.1f} seconds ({put['throughput_mbps']} MB/s)"
+            )
+            
+            # Wait for upload to be processed
+            self._wait_for_upload_processing(upload_arn, project_arn, df_upload_type)
+            
+            if self.upload_cache:
+                self.upload_cache.store_upload(stream.sha256, project_arn, df_upload_type, upload_arn)
+            
+            return upload_arn
+            
+        except Exception as e:
+            logger.error(f"Failed to stream app to Device Farm: {str(e)}")
+            raise
+    
+    def _wait_for_upload_processing(self, upload_arn: str, project_arn: Optional[str] = None,
+                                    upload_type: Optional[str] = None,
+                                    max_wait_time: Optional[float] = None):
         """Wait for upload to be processed by Device Farm"""
         logger.info("Waiting for upload to be processed...")
         
-        start_time = time.time()
-        while time.time() - start_time < max_wait_time:
-            try:
-                response = self.devicefarm_client.get_upload(arn=upload_arn)
-                upload_info = response['upload']
-                status = upload_info['status']
-                
-                logger.info(f"Upload status: {status}")
-                
-                # Log additional details for debugging
-                if 'message' in upload_info:
-                    logger.info(f"Upload message: {upload_info['message']}")
-                if 'metadata' in upload_info:
-                    logger.info(f"Upload metadata: {upload_info['metadata']}")
-                
-                if status == 'SUCCEEDED':
-                    logger.info("Upload processed successfully")
-                    return
-                elif status == 'FAILED':
-                    error_msg = f"Upload processing failed. Status: {status}"
-                    if 'message' in upload_info:
-                        error_msg += f". Message: {upload_info['message']}"
-                    raise RuntimeError(error_msg)
-                
-                time.sleep(10)  # Wait 10 seconds before checking again
-                
-            except Exception as e:
-                logger.error(f"Error checking upload status: {str(e)}")
-                raise
+        if max_wait_time is None:
+            max_wait_time = float(self.config['UPLOAD_PROCESSING_TIMEOUT'])
         
-        raise TimeoutError(f"Upload processing timed out after {max_wait_time} seconds")
-    
-    def _upload_existing_test_spec(self, project_arn: str, timestamp: str) -> str:
-        """Upload existing test spec file from test suite to Device Farm"""
-        logger.info("Uploading existing test spec to Device Farm")
+        try:
+            with self.tracer.span('upload_processing', upload_type=upload_type):
+                upload_info = self.status_poller.wait_for_upload(
+                    upload_arn,
+                    timeout=max_wait_time,
+                    project_arn=project_arn,
+                    upload_type=upload_type
+                )
+        except Exception as e:
+            logger.error(f"Error waiting for upload processing: {str(e)}")
+            raise
         
-        # Test spec file is at the same level as handler.py
-        test_spec_filename = "appium-ios-test.yml"
-        test_spec_path = os.path.join(os.path.dirname(__file__), test_spec_filename)
+        if 'metadata' in upload_info:
+            logger.info(f"Upload metadata: {upload_info['metadata']}")
+        return upload_info
+    
+    def _find_test_spec(self, platform: Optional[str] = None) -> str:
+        """The test spec for a platform, see find_test_spec"""
+        install_free = self.config['TEST_SPEC_VARIANT'] == 'install-free'
+        return find_test_spec(
+            self.config, platform or self.config['APP_TYPE'], self._get_dependencies_url() if install_free else None
+        )
+    
+    def _get_dependencies_url(self) -> Optional[str]:
+        """URL the test spec downloads the split dependency archive from, or None if node_modules/ is in the package"""
+        with self._dependencies_lock:
+            if self._dependencies_url is None:
+                self._dependencies_url = self._stage_dependencies()
+            return self._dependencies_url or None
+    
+    def _stage_dependencies(self) -> str:
+        """Upload the split dependency archive once per content hash and return its URL"""
+        info_path = dependencies_paths(self._get_prebuilt_test_suite())[1]
+        if not os.path.exists(info_path):
+            return ''
         
-        # Fallback to current directory if __file__ approach doesn't work
-        if not os.path.exists(test_spec_path):
-            test_spec_path = test_spec_filename
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+        archive_path = os.path.join(os.path.dirname(info_path), info['archive'])
+        key = dependency_archive_key(self.config, info)
         
-        if not os.path.exists(test_spec_path):
-            raise FileNotFoundError(f"Test spec file '{test_spec_filename}' not found at: {test_spec_path}")
+        bucket = self.config['DEPENDENCIES_BUCKET']
+        s3_client = self.s3_client
+        if bucket:
+            # Pre-signed URLs must be signed for the bucket's own region
+            s3_client = get_aws_client('s3', region_name=bucket_region(self.s3_client, bucket) or 'us-west-2')
+        else:
+            bucket = self.config['S3_BUCKET']
+        with self.tracer.span('stage_dependencies', bytes=info['size']):
+            stage_dependency_archive(s3_client, bucket, key, archive_path)
+        if self.config['DEPENDENCIES_BUCKET'] and self.config['DEPENDENCIES_BASE_URL']:
+            return dependency_archive_url(self.config['DEPENDENCIES_BASE_URL'], key)
         
-        logger.info(f"Found test spec file at: {test_spec_path}")
+        # Without a public base URL the archive is pre-signed, so the spec differs on
+        # every runner and its URL only lasts as long as this runner's credentials
+        logger.warning(
+            "DEPENDENCIES_BASE_URL is not set; pre-signing the dependency archive, "
+            "so this run's test spec cannot be reused"
+        )
+        return s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket, 'Key': key},
+            ExpiresIn=int(self.config['DEPENDENCIES_URL_EXPIRY'])
+        )
+    
+    def _upload_existing_test_spec(self, project_arn: str, timestamp: str) -> str:
+        """Upload the test spec for this runner's platform to Device Farm"""
+        platform = self.config['APP_TYPE'].lower()
+        logger.info(f"Uploading {self.config['TEST_SPEC_VARIANT']} {platform} test spec to Device Farm")
+        return self._upload_test_spec(
+            self._find_test_spec(platform), f"appium-{platform}-test-spec-{timestamp}.yml", project_arn
+        )
+    
+    def _upload_test_spec(self, test_spec_path: str, upload_name: str, project_arn: str) -> str:
+        """Upload a test spec file to Device Farm, reusing an identical earlier upload"""
+        content_hash, cached_arn = self._lookup_cached_upload(test_spec_path, "APPIUM_NODE_TEST_SPEC", project_arn)
+        if cached_arn:
+            logger.info("Reusing cached test spec upload, skipping transfer and processing")
+            return cached_arn
         
         try:
             # Create upload for test spec
             response = self.devicefarm_client.create_upload(
                 projectArn=project_arn,
-                name=f"appium-ios-test-spec-{timestamp}.yml",
+                name=upload_name,
                 type="APPIUM_NODE_TEST_SPEC"
             )
             
@@ -294,61 +1104,90 @@ class DeviceFarmTestRunner:
             logger.info(f"Created test spec upload with ARN: {upload_arn}")
             
             # Upload test spec file
-            import requests
             filename = os.path.basename(test_spec_path)
             headers = {
                 'Content-Disposition': f'attachment; filename="{filename}"'
             }
             
-            with open(test_spec_path, 'rb') as f:
-                response = requests.put(upload_url, data=f, headers=headers)
-                response.raise_for_status()
+            with self.tracer.span('upload_put', upload_type="APPIUM_NODE_TEST_SPEC",
+                                  bytes=os.path.getsize(test_spec_path)) as span:
+                put = self.uploader.put(upload_url, test_spec_path, headers=headers, label=upload_name)
+                span.set(attempts=put['attempts'])
             
-            logger.info("Existing test spec uploaded successfully")
+            logger.info("Test spec uploaded successfully")
             
             # Wait for upload to be processed
-            self._wait_for_upload_processing(upload_arn)
+            self._wait_for_upload_processing(upload_arn, project_arn, "APPIUM_NODE_TEST_SPEC")
+            
+            if content_hash and self.upload_cache:
+                self.upload_cache.store_upload(content_hash, project_arn, "APPIUM_NODE_TEST_SPEC", upload_arn)
             
             return upload_arn
             
         except Exception as e:
-            logger.error(f"Failed to upload existing test spec to Device Farm: {str(e)}")
+            logger.error(f"Failed to upload test spec to Device Farm: {str(e)}")
             raise
     
-    def _schedule_test_run(self, project_arn: str, app_arn: str, test_arn: str, timestamp: str) -> Dict[str, Any]:
+    def _get_device_pool_arn(self, project_arn: str) -> str:
+        """Resolve the private device pool for the project by name or name pattern"""
+        return self._resolve_device_pool(project_arn)['arn']
+    
+    def _resolve_device_pool(self, project_arn: str) -> Dict[str, Any]:
+        """Look up the configured private device pool in the catalog"""
+        project = self.device_catalog.project(project_arn)
+        logger.info(f"Using Device Farm project: {project['name']}")
+        
+        # Default to the pools DeviceFarmStack creates, never Device Farm's curated pools
+        pool_pattern = self.config['DEVICE_POOL_PATTERN'] or f"{self.config['APP_TYPE'].lower()}-device-pool-*"
+        with self.tracer.span('device_pool_lookup'):
+            device_pool = self.device_catalog.resolve_pool(
+                project_arn,
+                pool_name=self.config['DEVICE_POOL_NAME'] or None,
+                pool_pattern=pool_pattern
+            )
+        
+        logger.info(f"Using device pool: {device_pool['name']} ({device_pool['arn']})")
+        return device_pool
+    
+    def _schedule_test_run(self, project_arn: str, app_arn: str, test_arn: str, timestamp: str,
+                           test_spec_arn: Optional[str] = None,
+                           device_pool_arn: Optional[str] = None,
+                           run_name: Optional[str] = None) -> Dict[str, Any]:
         """Schedule the Device Farm test run"""
         logger.info("Scheduling Device Farm test run")
         
         try:
-            # Get the default device pool
-            device_pools_response = self.devicefarm_client.list_device_pools(arn=project_arn)
-            device_pools = device_pools_response.get('devicePools', [])
+            if not device_pool_arn:
+                device_pool_arn = self._get_device_pool_arn(project_arn)
             
-            if not device_pools:
-                raise RuntimeError("No device pools found for the project")
-            
-            device_pool_arn = device_pools[0]['arn']
-            logger.info(f"Using device pool: {device_pool_arn}")
-            
-            # Upload the existing test spec file
-            test_spec_arn = self._upload_existing_test_spec(project_arn, timestamp)
+            # Upload the existing test spec file unless it was uploaded already
+            if not test_spec_arn:
+                test_spec_arn = self._upload_existing_test_spec(project_arn, timestamp)
             
             # Schedule the run using custom environment mode
-            run_name = f"SystemTest-{timestamp}"
-            response = self.devicefarm_client.schedule_run(
-                projectArn=project_arn,
-                appArn=app_arn,
-                devicePoolArn=device_pool_arn,
-                name=run_name,
-                test={
-                    'type': 'APPIUM_NODE',
-                    'testPackageArn': test_arn,
-                    'testSpecArn': test_spec_arn  # Required for custom environment mode
-                }
-            )
+            run_name = run_name or f"SystemTest-{timestamp}"
+            schedule_started = time.monotonic()
+            
+            # A redelivered request picks up the run its earlier delivery scheduled
+            run = self._find_run(project_arn, run_name) if self._is_enabled('RUN_RESUME') else None
+            if run:
+                logger.info(f"Resuming run {run_name} scheduled by an earlier delivery (status: {run['status']})")
+            else:
+                with self.tracer.span('schedule_run'):
+                    run = self.devicefarm_client.schedule_run(
+                        projectArn=project_arn,
+                        appArn=app_arn,
+                        devicePoolArn=device_pool_arn,
+                        name=run_name,
+                        test={
+                            'type': 'APPIUM_NODE',
+                            'testPackageArn': test_arn,
+                            'testSpecArn': test_spec_arn  # Required for custom environment mode
+                        }
+                    )['run']
             
-            run_arn = response['run']['arn']
-            run_name = response['run']['name']
+            run_arn = run['arn']
+            run_name = run['name']
             
             result = {
                 'run_arn': run_arn,
@@ -356,10 +1195,14 @@ class DeviceFarmTestRunner:
                 'project_arn': project_arn,
                 'device_pool_arn': device_pool_arn,
                 'test_spec_arn': test_spec_arn,
-                'timestamp': timestamp
+                'timestamp': timestamp,
+                'phases': {
+                    'prepare': round(schedule_started - self._started, 1),
+                    'schedule': round(time.monotonic() - schedule_started, 1)
+                }
             }
             
-            logger.info(f"Test run scheduled successfully:")
+            logger.info("Test run scheduled successfully:")
             logger.info(f"  Name: {run_name}")
             logger.info(f"  ARN: {run_arn}")
             logger.info("Monitor progress in AWS Device Farm console")
@@ -370,7 +1213,105 @@ class DeviceFarmTestRunner:
             logger.error(f"Failed to schedule test run: {str(e)}")
             raise
 
+    def _find_run(self, project_arn: str, run_name: str) -> Optional[Dict[str, Any]]:
+        """The newest run in the project with this name, if there is one"""
+        runs = []
+        for page in self.devicefarm_client.get_paginator('list_runs').paginate(arn=project_arn):
+            runs.extend(run for run in page['runs'] if run['name'] == run_name)
+        return max(runs, key=lambda run: run['created'], default=None)
+    
+    def _monitor_test_run(self, run_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Wait for the scheduled run to finish and attach its result summary"""
+        monitor = RunMonitor(
+            self.devicefarm_client,
+            self.status_poller,
+            initial_interval=float(self.config['RUN_POLL_INITIAL_INTERVAL']),
+            max_interval=float(self.config['RUN_POLL_MAX_INTERVAL']),
+            workers=int(self.config['SUMMARY_WORKERS'])
+        )
+        passing_results = [
+            result.strip().upper() for result in self.config['RUN_PASSING_RESULTS'].split(',') if result.strip()
+        ]
+        
+        monitor_started = time.monotonic()
+        try:
+            with self.tracer.span('run_wait', run_name=run_result['run_name']) as span:
+                summary = monitor.wait_and_summarize(
+                    run_result['run_arn'],
+                    run_result['project_arn'],
+                    timeout=float(self.config['RUN_TIMEOUT']),
+                    passing_results=passing_results
+                )
+                span.set(result=summary['result'], queue_seconds=summary['queue_seconds'],
+                         execution_seconds=summary['duration_seconds'])
+        except Exception as e:
+            logger.error(f"Failed to monitor test run: {str(e)}")
+            raise
+        
+        phases = dict(
+            run_result.get('phases', {}),
+            queue=summary['queue_seconds'],
+            execution=summary['duration_seconds'],
+            monitor=round(time.monotonic() - monitor_started, 1)
+        )
+        run_result = dict(run_result, passed=summary['passed'], summary=summary, phases=phases)
+        if self._is_enabled('INGEST_RESULTS'):
+            run_result['results'] = self._ingest_results(run_result)
+            if run_result['results']:
+                phases['ingest'] = run_result['results']['seconds']
+        if self._is_enabled('RUN_HISTORY_ENABLED'):
+            self._record_run_history(run_result)
+        return run_result
+    
+    def _record_run_history(self, run_result: Dict[str, Any]):
+        """Append the monitored run to the local SQLite run history and its shard in the bucket"""
+        history = RunHistory(
+            self.config['RUN_HISTORY_PATH'],
+            s3_client=self.s3_client,
+            s3_bucket=self.config['S3_BUCKET'],
+            s3_prefix=self.config['RUN_HISTORY_S3_PREFIX'] or None
+        )
+        try:
+            history.record(dict(
+                run_result,
+                app_type=run_result.get('app_type', self.config['APP_TYPE']),
+                app_file_path=run_result.get('app_file_path', self.config['APP_FILE_PATH'])
+            ))
+        except Exception as e:
+            logger.warning(f"Failed to record run history: {str(e)}")
+    
+    def _ingest_results(self, run_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Store the finished run's artifacts and parsed test results under a per-run S3 prefix.
+        
+        Ingestion is best effort: the run's outcome is already known, so a failure here
+        is logged and leaves the result without an ingestion report.
+        """
+        run_id = run_result['run_arn'].rsplit('/', 1)[-1]
+        max_mb = float(self.config['INGEST_MAX_ARTIFACT_MB'])
+        ingestor = ResultIngestor(
+            self.devicefarm_client,
+            self.s3_client,
+            get_http_session(),
+            self.config['S3_BUCKET'],
+            f"{self.config['RESULTS_S3_PREFIX']}{run_result['run_name']}/{run_id}/",
+            workers=int(self.config['INGEST_WORKERS']),
+            video_policy=self.config['INGEST_VIDEO_POLICY'],
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb > 0 else None
+        )
+        try:
+            with self.tracer.span('ingest_results', run_name=run_result['run_name']) as span:
+                report = ingestor.ingest(run_result['summary'])
+                span.set(bytes=report['bytes'], artifacts=report['stored'])
+            return report
+        except Exception as e:
+            logger.warning(f"Failed to ingest test results: {str(e)}")
+            return None
+
 # Allow running as script
 if __name__ == "__main__":
     result = lambda_handler({}, None)
-    print(json.dumps(result, indent=2))
\ No newline at end of file
+    print(json.dumps(result, indent=2))
+    
+    # Fail the build when execution failed or a monitored run did not pass
+    body = json.loads(result['body'])
+    sys.exit(0 if result['statusCode'] == 200 and body.get('passed', True) else 1)
\ No newline at end of file
@@ -0,0 +1,405 @@
+"""
+Incremental, deterministic builder for system_tests.zip.
+
+Each stage is keyed by a hash of its inputs and skipped when the key matches
+the last build:
+
+- install: package.json and pnpm-lock.yaml -> pnpm install --frozen-lockfile
+- compile: the install key, tsconfig.json, src/ and wdio/ -> tsc into dist/
+- package: the compile key (which covers the install key), the test spec and
+  the package-lock.json derived from the shipped node_modules/ -> zip
+
+Only the runtime dependency closure of dist/ is shipped (see DependencyClosure):
+tooling such as typescript, ts-node and @types/*, and appium, which the Device
+Farm host provides, are left out of both node_modules/ and the packaged
+package.json, and a per-package size report is logged. --no-prune ships the
+full install as before.
+
+With --split-dependencies, node_modules/ goes into a separate archive
+(system_tests-dependencies.zip, described by system_tests-dependencies.json)
+that only changes with the dependencies, and system_tests.zip keeps just the
+compiled code and manifests. The runner stages the dependency archive once per
+content hash and the test spec unpacks it on the device host.
+
+The zip is byte-reproducible: entries are sorted, timestamps and permissions are
+normalized and compression settings are fixed, so identical inputs always give an
+identical file and an identical SHA-256 for the upload cache to key on.
+
+Files are read in place from dist/ and node_modules/ and compressed in parallel by
+StreamingZipWriter, which writes the zip to disk or streams it straight into a
+pre-signed PUT (--upload-url), so nothing is staged or copied first.
+
+Usage:
+    python3 packager.py [--suite-dir .] [--output system_tests.zip] [--force] [--install-only]
+                        [--no-prune] [--keep PACKAGE ...] [--report report.json]
+                        [--split-dependencies]
+    python3 packager.py --upload-url <pre-signed Device Farm upload URL>
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from dependency_closure import DependencyClosure, format_size_report
+from upload_cache import sha256_file
+from zip_stream import StreamingZipWriter
+
+logger = logging.getLogger(__name__)
+
+# Bump when the package layout or zip settings change, to invalidate earlier packages
+PACKAGE_FORMAT = '3'
+COMPRESS_LEVEL = 6
+STATE_FILE = '.package-state.json'
+INSTALL_MARKER = os.path.join('node_modules', '.install-hash')
+COMPILE_SOURCES = ['tsconfig.json', 'src', 'wdio']
+TEST_SPEC = 'appium-ios-test.yml'
+DEPENDENCIES_PREFIX = 'node_modules/'
+
+
+def dependencies_paths(package_path: str) -> Tuple[str, str]:
+    """(archive, description) paths of the split dependency archive that belongs to a package"""
+    base = os.path.splitext(package_path)[0]
+    return f"{base}-dependencies.zip", f"{base}-dependencies.json"
+
+
+def _walk_files(root: str, follow_symlinks: bool = True) -> Iterator[Tuple[str, str]]:
+    """Yield (relative path, absolute path) for every file under root in sorted order.
+
+    Dot-files and dot-directories are skipped like the old `zip -x "*/.*"`, and
+    symlinks are followed (pnpm links packages into node_modules) with a guard
+    against cycles.
+    """
+    def walk(directory: str, relative: str, ancestors: Tuple[str, ...]):
+        real = os.path.realpath(directory)
+        if real in ancestors:
+            return
+        for name in sorted(os.listdir(directory)):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            relative_path = f"{relative}/{name}" if relative else name
+            if os.path.islink(path) and not follow_symlinks:
+                continue
+            if os.path.isdir(path):
+                yield from walk(path, relative_path, ancestors + (real,))
+            elif os.path.isfile(path):
+                yield relative_path, path
+
+    if os.path.isdir(root):
+        yield from walk(root, '', ())
+
+
+def hash_inputs(base_dir: str, paths: Iterable[str], extra: Iterable[str] = ()) -> str:
+    """SHA-256 over the names and contents of the given files and directory trees"""
+    digest = hashlib.sha256()
+    for value in extra:
+        digest.update(f"extra:{value}\0".encode('utf-8'))
+
+    for path in sorted(paths):
+        absolute = os.path.join(base_dir, path)
+        if os.path.isdir(absolute):
+            files = [(f"{path}/{relative}", full) for relative, full in _walk_files(absolute)]
+        elif os.path.isfile(absolute):
+            files = [(path, absolute)]
+        else:
+            files = []
+            digest.update(f"missing:{path}\0".encode('utf-8'))
+
+        for relative, full in files:
+            digest.update(f"file:{relative}\0".encode('utf-8'))
+            with open(full, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TestPackageBuilder:
+    """Builds system_tests.zip, redoing only the stages whose inputs changed"""
+
+    def __init__(self, suite_dir: str, output_path: Optional[str] = None, force: bool = False,
+                 workers: Optional[int] = None, prune: bool = True, keep: Iterable[str] = (),
+                 split_dependencies: bool = False):
+        self.suite_dir = os.path.abspath(suite_dir)
+        self.output_path = os.path.abspath(output_path or os.path.join(self.suite_dir, 'system_tests.zip'))
+        self.force = force
+        self.prune = prune
+        self.keep = sorted(keep)
+        self.split_dependencies = split_dependencies
+        self.dependencies_path, self.dependencies_info_path = dependencies_paths(self.output_path)
+        self.dependency_report: Optional[Dict[str, Any]] = None
+        self.state_path = os.path.join(self.suite_dir, STATE_FILE)
+        self.zip_writer = StreamingZipWriter(workers=workers, level=COMPRESS_LEVEL)
+
+    def build(self) -> Dict[str, Any]:
+        """Run every stage and return the package path and hashes"""
+        package_hash, entries = self._prepare()
+        dependencies = self._split(entries)
+        state = self._load_state()
+
+        if (not self.force and state.get('package_hash') == package_hash
+                and os.path.exists(self.output_path) and sha256_file(self.output_path) == state.get('zip_sha256')):
+            logger.info("Test package inputs unchanged, reusing existing package")
+        else:
+            logger.info("Creating deterministic test package")
+            zip_sha256, _ = self.zip_writer.write_to(self.output_path, entries)
+            state = dict(state, package_hash=package_hash, zip_sha256=zip_sha256)
+            self._save_state(state)
+
+        size = os.path.getsize(self.output_path)
+        logger.info(f"Test package: {self.output_path} ({size / (1024*1024):.2f} MB, sha256 {state['zip_sha256']})")
+        result = {
+            'path': self.output_path,
+            'sha256': state['zip_sha256'],
+            'package_hash': package_hash,
+            'size': size
+        }
+        if dependencies is not None:
+            result['dependencies'] = self._build_dependencies(dependencies)
+        return result
+
+    def upload(self, upload_url: str) -> Dict[str, Any]:
+        """Build and stream the package straight into a pre-signed PUT without writing it to disk"""
+        from transfer import PresignedUploader, create_session
+
+        package_hash, entries = self._prepare()
+        dependencies = self._split(entries)
+        logger.info("Streaming deterministic test package to upload URL")
+        zip_sha256, size = self.zip_writer.upload_to(
+            upload_url,
+            entries,
+            PresignedUploader(create_session()),
+            headers={'Content-Disposition': 'attachment; filename="system_tests.zip"'}
+        )
+        logger.info(f"Test package streamed ({size / (1024*1024):.2f} MB, sha256 {zip_sha256})")
+        result = {
+            'sha256': zip_sha256,
+            'package_hash': package_hash,
+            'size': size
+        }
+        if dependencies is not None:
+            result['dependencies'] = self._build_dependencies(dependencies)
+        return result
+
+    def install(self) -> str:
+        """Install Node.js dependencies unless node_modules already matches the lock file"""
+        install_hash = hash_inputs(self.suite_dir, ['package.json', 'pnpm-lock.yaml'])
+        marker = os.path.join(self.suite_dir, INSTALL_MARKER)
+
+        if not self.force and os.path.exists(marker):
+            with open(marker, 'r') as f:
+                if f.read().strip() == install_hash:
+                    logger.info("Dependencies unchanged, skipping pnpm install")
+                    return install_hash
+
+        logger.info("Installing dependencies with pnpm")
+        self._run(['pnpm', 'install', '--frozen-lockfile'])
+        with open(marker, 'w') as f:
+            f.write(install_hash)
+        return install_hash
+
+    def compile(self, install_hash: str, state: Dict[str, Any]) -> str:
+        """Compile TypeScript into dist/ unless sources and dependencies are unchanged"""
+        compile_hash = hash_inputs(self.suite_dir, COMPILE_SOURCES, extra=[install_hash])
+        dist_dir = os.path.join(self.suite_dir, 'dist')
+
+        if not self.force and state.get('compile_hash') == compile_hash and os.path.isdir(dist_dir):
+            logger.info("Sources unchanged, skipping TypeScript compile")
+            return compile_hash
+
+        logger.info("Compiling TypeScript")
+        # Start from an empty dist/ so deleted sources do not leave stale specs behind
+        shutil.rmtree(dist_dir, ignore_errors=True)
+        self._run(['pnpm', 'run', 'build'])
+        self._save_state(dict(self._load_state(), compile_hash=compile_hash))
+        return compile_hash
+
+    def _prepare(self) -> Tuple[str, List[Tuple[str, str]]]:
+        """Bring dependencies and dist/ up to date and return (package hash, archive entries)"""
+        install_hash = self.install()
+        compile_hash = self.compile(install_hash, self._load_state())
+
+        closure = None
+        manifest = os.path.join(self.suite_dir, 'package.json')
+        if self.prune:
+            closure = DependencyClosure(self.suite_dir, keep=self.keep).compute(
+                os.path.join(self.suite_dir, 'dist'), os.path.join(self.suite_dir, 'dist', 'wdio', 'configs')
+            )
+            manifest = self._pruned_manifest(closure)
+            self.dependency_report = closure.size_report()
+            logger.info(f"Runtime dependencies:\n{format_size_report(self.dependency_report)}")
+
+        package_lock = self._package_lock(manifest, closure)
+        package_hash = hash_inputs(
+            self.suite_dir, [TEST_SPEC],
+            extra=[compile_hash, sha256_file(manifest), sha256_file(package_lock), PACKAGE_FORMAT,
+                   f"prune:{self.prune}", f"split:{self.split_dependencies}"]
+        )
+        return package_hash, self._package_entries(manifest, package_lock, closure)
+
+    def _split(self, entries: List[Tuple[str, str]]) -> Optional[List[Tuple[str, str]]]:
+        """Move node_modules/ entries out of `entries` when splitting, returning them"""
+        if not self.split_dependencies:
+            # A description left by an earlier split build would make the runner expect one
+            if os.path.exists(self.dependencies_info_path):
+                os.remove(self.dependencies_info_path)
+            return None
+        dependencies = [entry for entry in entries if entry[0].startswith(DEPENDENCIES_PREFIX)]
+        entries[:] = [entry for entry in entries if not entry[0].startswith(DEPENDENCIES_PREFIX)]
+        return dependencies
+
+    def _build_dependencies(self, dependencies: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """Write the dependency archive unless the installed dependencies are unchanged"""
+        install_hash = ''
+        marker = os.path.join(self.suite_dir, INSTALL_MARKER)
+        if os.path.exists(marker):
+            with open(marker, 'r') as f:
+                install_hash = f.read().strip()
+        key = hashlib.sha256(
+            json.dumps([install_hash, PACKAGE_FORMAT, sorted(name for name, _ in dependencies)]).encode('utf-8')
+        ).hexdigest()
+        state = self._load_state()
+
+        if (not self.force and state.get('dependencies_key') == key
+                and os.path.exists(self.dependencies_path)
+                and sha256_file(self.dependencies_path) == state.get('dependencies_sha256')):
+            logger.info("Dependencies unchanged, reusing existing dependency archive")
+        else:
+            logger.info(f"Creating dependency archive with {len(dependencies)} files")
+            sha256, _ = self.zip_writer.write_to(self.dependencies_path, dependencies)
+            state = dict(self._load_state(), dependencies_key=key, dependencies_sha256=sha256)
+            self._save_state(state)
+
+        info = {
+            'path': self.dependencies_path,
+            'sha256': state['dependencies_sha256'],
+            'size': os.path.getsize(self.dependencies_path)
+        }
+        with open(self.dependencies_info_path, 'w') as f:
+            json.dump({'archive': os.path.basename(self.dependencies_path), 'sha256': info['sha256'],
+                       'size': info['size']}, f, indent=2, sort_keys=True)
+        logger.info(f"Dependency archive: {self.dependencies_path} ({info['size'] / (1024*1024):.2f} MB)")
+        return info
+
+    def _pruned_manifest(self, closure: DependencyClosure) -> str:
+        """Write the runtime-only package.json into the packager cache and return its path"""
+        content = json.dumps(closure.pruned_manifest(), indent=2) + '\n'
+        cache_dir = os.path.join(self.suite_dir, 'node_modules', '.packager')
+        manifest_path = os.path.join(
+            cache_dir, f"package-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}.json"
+        )
+        if not os.path.exists(manifest_path):
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(manifest_path, 'w') as f:
+                f.write(content)
+        return manifest_path
+
+    def _package_lock(self, manifest: str, closure: Optional[DependencyClosure]) -> str:
+        """package-lock.json for Device Farm's npm, written into the packager cache.
+
+        It describes the installed tree (see DependencyClosure.package_lock) instead of
+        asking the registry, so identical sources and pnpm-lock.yaml give an identical
+        lock, zip and hash on every fresh build.
+        """
+        with open(manifest, 'r') as f:
+            package = json.load(f)
+        if closure is None:
+            # The full install ships as is; describe every declared dependency of it
+            closure = DependencyClosure(self.suite_dir, keep=package.get('dependencies', {})).compute(
+                os.path.join(self.suite_dir, 'dist'), os.path.join(self.suite_dir, 'dist', 'wdio', 'configs')
+            )
+        content = json.dumps(closure.package_lock(package), indent=2) + '\n'
+        cache_dir = os.path.join(self.suite_dir, 'node_modules', '.packager')
+        lock_path = os.path.join(
+            cache_dir, f"package-lock-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}.json"
+        )
+        if not os.path.exists(lock_path):
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(lock_path, 'w') as f:
+                f.write(content)
+        return lock_path
+
+    def _package_entries(self, manifest: str, package_lock: str,
+                         closure: Optional[DependencyClosure]) -> List[Tuple[str, str]]:
+        entries = [
+            ('package.json', manifest),
+            ('package-lock.json', package_lock)
+        ]
+        test_spec = os.path.join(self.suite_dir, TEST_SPEC)
+        if os.path.exists(test_spec):
+            entries.append((TEST_SPEC, test_spec))
+        entries.extend(
+            (f"dist/{relative}", path) for relative, path in _walk_files(os.path.join(self.suite_dir, 'dist'))
+        )
+        if closure is not None:
+            entries.extend(closure.entries())
+        else:
+            entries.extend(
+                (f"node_modules/{relative}", path)
+                for relative, path in _walk_files(os.path.join(self.suite_dir, 'node_modules'))
+            )
+        return entries
+
+    def _run(self, command: List[str]):
+        result = subprocess.run(command, cwd=self.suite_dir, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.error(f"STDOUT: {result.stdout}")
+            logger.error(f"STDERR: {result.stderr}")
+            raise RuntimeError(f"{' '.join(command)} failed with return code {result.returncode}")
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict[str, Any]):
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite-dir', default=os.path.dirname(os.path.abspath(__file__)),
+                        help='test suite directory (default: next to this script)')
+    parser.add_argument('--output', help='zip to write (default: <suite-dir>/system_tests.zip)')
+    parser.add_argument('--force', action='store_true', help='redo every stage regardless of hashes')
+    parser.add_argument('--install-only', action='store_true', help='only install dependencies')
+    parser.add_argument('--upload-url', help='stream the zip into this pre-signed PUT URL instead of writing it')
+    parser.add_argument('--workers', type=int, help='compression threads (default: one per CPU)')
+    parser.add_argument('--no-prune', dest='prune', action='store_false',
+                        help='ship every installed dependency instead of the runtime closure')
+    parser.add_argument('--keep', action='append', default=[],
+                        help='declared dependency to ship even if dist/ does not load it (repeatable)')
+    parser.add_argument('--report', help='write the per-package size report to this JSON file')
+    parser.add_argument('--split-dependencies', action='store_true',
+                        help='package node_modules/ as a separate archive next to the zip')
+    args = parser.parse_args()
+
+    builder = TestPackageBuilder(args.suite_dir, args.output, force=args.force, workers=args.workers,
+                                 prune=args.prune, keep=args.keep, split_dependencies=args.split_dependencies)
+    try:
+        if args.install_only:
+            builder.install()
+        elif args.upload_url:
+            print(json.dumps(builder.upload(args.upload_url), indent=2))
+        else:
+            print(json.dumps(builder.build(), indent=2))
+
+        if args.report and builder.dependency_report is not None:
+            with open(args.report, 'w') as f:
+                json.dump(builder.dependency_report, f, indent=2)
+    except Exception as e:
+        logger.error(f"Test package build failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
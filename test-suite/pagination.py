@@ -0,0 +1,11 @@
+from typing import Dict, Any, Iterator
+
+
+def paginate(client_method, result_key: str, **kwargs) -> Iterator[Dict[str, Any]]:
+    """Iterate over every item of a nextToken-paginated Device Farm list call"""
+    while True:
+        response = client_method(**kwargs)
+        yield from response.get(result_key, [])
+        if not response.get('nextToken'):
+            return
+        kwargs['nextToken'] = response['nextToken']
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from handler import (
+    configure_logging, dependency_archive_key, find_test_spec, get_aws_client, get_http_session, optional_settings
+)
+from packager import dependencies_paths
+from pagination import paginate
+from s3_routing import bucket_region
+from status_poller import StatusPoller
+from test_specs import dependency_archive_url, stage_dependency_archive
+from transfer import PresignedUploader
+from upload_cache import sha256_file
+
+logger = logging.getLogger(__name__)
+
+TEST_PACKAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'system_tests.zip')
+UPLOAD_PROCESSING_TIMEOUT = 600
+
+
+def on_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Custom resource handler that uploads the test package and spec once per deployment.
+
+    The resulting uploads are returned as the JSON `Uploads` attribute in the shape
+    the runner reads from PRESTAGED_UPLOADS. Each entry carries the SHA-256 of its
+    content, so a runner whose package or spec differs simply ignores it. The spec
+    is rendered by the runners' own code from the settings they are deployed with
+    (the `RunnerSettings` property), so the two match. Uploads are named after
+    their content hash and reused when a deployment finds them already processed.
+    They are not deleted with the resource, since runs may still reference them.
+    """
+    configure_logging()
+    request_type = event['RequestType']
+    properties = event['ResourceProperties']
+    logger.info(f"Pre-staging request: {request_type}")
+
+    if request_type == 'Delete':
+        return {'PhysicalResourceId': event['PhysicalResourceId']}
+
+    projects = json.loads(properties['Projects'])
+    settings = optional_settings(json.loads(properties.get('RunnerSettings') or '{}'))
+    install_free = settings['TEST_SPEC_VARIANT'] == 'install-free'
+    dependencies_url = _stage_dependencies(settings) if install_free else ''
+
+    files = {platform: {'APPIUM_NODE_TEST_PACKAGE': TEST_PACKAGE_PATH} for platform in projects}
+    if dependencies_url is not None:
+        for platform in projects:
+            files[platform]['APPIUM_NODE_TEST_SPEC'] = find_test_spec(settings, platform, dependencies_url or None)
+    uploads = prestage(projects, files)
+    return {
+        'PhysicalResourceId': _physical_id(uploads),
+        'Data': {'Uploads': json.dumps(uploads, separators=(',', ':'))}
+    }
+
+
+def _stage_dependencies(settings: Dict[str, str]) -> Optional[str]:
+    """Stage the split dependency archive as a runner would and return its URL.
+
+    Returns '' when the package carries its own node_modules/, and None when the
+    runners would pre-sign the archive, since their specs then never match.
+    """
+    info_path = dependencies_paths(TEST_PACKAGE_PATH)[1]
+    if not os.path.exists(info_path):
+        return ''
+
+    bucket = settings['DEPENDENCIES_BUCKET']
+    if not bucket or not settings['DEPENDENCIES_BASE_URL']:
+        logger.warning("Not pre-staging the test spec: runners pre-sign the dependency archive on every run")
+        return None
+
+    with open(info_path, 'r') as f:
+        info = json.load(f)
+    key = dependency_archive_key(settings, info)
+    s3_client = get_aws_client('s3', region_name=bucket_region(get_aws_client('s3'), bucket) or 'us-west-2')
+    stage_dependency_archive(s3_client, bucket, key, os.path.join(os.path.dirname(info_path), info['archive']))
+    return dependency_archive_url(settings['DEPENDENCIES_BASE_URL'], key)
+
+
+def prestage(projects: Dict[str, str], files: Dict[str, Dict[str, str]]) -> List[Dict[str, str]]:
+    """Upload every file to its platform's project in parallel and wait for processing"""
+    devicefarm = get_aws_client('devicefarm')
+    poller = StatusPoller(devicefarm)
+
+    jobs = [
+        (project_arn, upload_type, path)
+        for platform, project_arn in sorted(projects.items())
+        for upload_type, path in sorted(files[platform].items())
+    ]
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix='prestage') as executor:
+        uploads = list(executor.map(lambda job: _upload(devicefarm, poller, *job), jobs))
+
+    logger.info(f"Pre-staged {len(uploads)} upload(s)")
+    return uploads
+
+
+def _upload(devicefarm: Any, poller: StatusPoller, project_arn: str, upload_type: str, path: str) -> Dict[str, str]:
+    content_hash = sha256_file(path)
+    name = f"prestaged-{content_hash[:16]}-{os.path.basename(path)}"
+    entry = {'sha256': content_hash, 'project_arn': project_arn, 'type': upload_type}
+
+    for upload in paginate(devicefarm.list_uploads, 'uploads', arn=project_arn, type=upload_type):
+        if upload['name'] == name and upload['status'] == 'SUCCEEDED':
+            logger.info(f"Reusing pre-staged {upload_type} upload: {upload['arn']}")
+            return dict(entry, arn=upload['arn'])
+
+    response = devicefarm.create_upload(projectArn=project_arn, name=name, type=upload_type)
+    upload_arn = response['upload']['arn']
+    logger.info(f"Created pre-staged {upload_type} upload with ARN: {upload_arn}")
+
+    PresignedUploader(get_http_session()).put(
+        response['upload']['url'],
+        path,
+        headers={'Content-Disposition': f'attachment; filename="{os.path.basename(path)}"'},
+        label=name
+    )
+
+    poller.wait_for_upload(upload_arn, timeout=UPLOAD_PROCESSING_TIMEOUT, project_arn=project_arn,
+                           upload_type=upload_type)
+    return dict(entry, arn=upload_arn)
+
+
+def _physical_id(uploads: List[Dict[str, str]]) -> str:
+    digest = hashlib.sha256()
+    for upload in uploads:
+        digest.update(f"{upload['project_arn']}|{upload['type']}|{upload['sha256']}\0".encode('utf-8'))
+    return f"prestaged-{digest.hexdigest()[:32]}"
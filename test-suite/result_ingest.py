@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, IO, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from pagination import paginate
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_TYPES = ['FILE', 'LOG', 'SCREENSHOT']
+VIDEO_POLICIES = ('skip', 'link', 'download')
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'webm'}
+JUNIT_PATTERN = re.compile(r'(^|/)junit[^/]*\.xml$')
+UNSAFE_CHARACTERS = re.compile(r'[^A-Za-z0-9._-]+')
+CHUNK_SIZE = 1024 * 1024
+
+
+def _slug(value: str) -> str:
+    return UNSAFE_CHARACTERS.sub('-', value or '').strip('-') or 'unnamed'
+
+
+def _arn_id(arn: str) -> str:
+    """Trailing id of a Device Farm ARN ('.../run:project/run-id' -> 'run-id')"""
+    return arn.rsplit('/', 1)[-1]
+
+
+def _spec_path(file_path: Optional[str]) -> Optional[str]:
+    """Spec path relative to the suite ('/host/.../dist/src/tests/a.test.js' -> 'src/tests/a.test.js')"""
+    if not file_path:
+        return None
+    path = file_path.replace('\\', '/')
+    index = path.find('src/tests/')
+    return path[index:] if index >= 0 else path
+
+
+def parse_junit(source: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    """Yield one normalized record per <testcase>, parsing incrementally.
+
+    Elements are cleared as soon as they are consumed, so memory stays flat however
+    large the report is. The spec file comes from the testcase's own `file` attribute
+    or, as the WebdriverIO reporter writes it, a `file` property of its testsuite.
+    """
+    suite_name = None
+    suite_file = None
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'testsuite':
+                suite_name = element.get('name')
+                suite_file = element.get('file')
+            continue
+
+        if element.tag == 'property' and element.get('name') == 'file' and not suite_file:
+            suite_file = element.get('value')
+        elif element.tag == 'testcase':
+            status = 'passed'
+            message = None
+            for child in element:
+                if child.tag in ('failure', 'error', 'skipped'):
+                    status = {'failure': 'failed', 'error': 'errored', 'skipped': 'skipped'}[child.tag]
+                    message = child.get('message') or (child.text or '').strip()[:2000] or None
+                    break
+            try:
+                seconds = float(element.get('time') or 0)
+            except ValueError:
+                seconds = 0.0
+            yield {
+                'suite': suite_name,
+                'classname': element.get('classname'),
+                'name': element.get('name'),
+                'spec': _spec_path(element.get('file') or suite_file),
+                'status': status,
+                'seconds': round(seconds, 3),
+                'message': message
+            }
+            element.clear()
+        elif element.tag == 'testsuite':
+            element.clear()
+            suite_name = suite_file = None
+
+
+class ResultIngestor:
+    """Collects the artifacts of a finished run and stores normalized results in S3.
+
+    Artifacts are listed for every job, suite and test of the run and downloaded
+    concurrently over the shared HTTP session. Each one is spooled to a temporary
+    file, parsed if it holds JUnit reports (as an XML file or inside the customer
+    artifacts zip) and copied to s3://<bucket>/<prefix>. Videos follow the video
+    policy: 'skip' leaves them out, 'link' records their Device Farm URL in the
+    manifest so they can be fetched on demand, and 'download' stores them too.
+    Artifacts larger than max_bytes are linked rather than stored.
+    """
+
+    def __init__(self, devicefarm_client: Any, s3_client: Any, session: Any, bucket: str, prefix: str,
+                 workers: int = 8, video_policy: str = 'link', max_bytes: Optional[int] = None):
+        if video_policy not in VIDEO_POLICIES:
+            raise ValueError(f"Video policy must be one of {', '.join(VIDEO_POLICIES)}, got: {video_policy}")
+        self.devicefarm_client = devicefarm_client
+        self.s3_client = s3_client
+        self.session = session
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/') + '/'
+        self.workers = max(1, workers)
+        self.video_policy = video_policy
+        self.max_bytes = max_bytes
+
+    def ingest(self, summary: Dict[str, Any]) -> Dict[str, Any]:
+        """Ingest every artifact of the summarized run and return what was stored"""
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingest') as executor:
+            artifacts = self._list_artifacts(summary, executor)
+            logger.info(f"Ingesting {len(artifacts)} artifact(s) to s3://{self.bucket}/{self.prefix}")
+            outcomes = list(executor.map(self._ingest_artifact, artifacts))
+
+        manifest = [entry for entry, _ in outcomes]
+        tests = [test for _, records in outcomes for test in records]
+        totals: Dict[str, int] = {}
+        for test in tests:
+            totals[test['status']] = totals.get(test['status'], 0) + 1
+
+        results = {
+            'run_arn': summary['run_arn'],
+            'result': summary.get('result'),
+            'totals': dict(totals, total=len(tests)),
+            'spec_durations': self._spec_durations(tests),
+            'tests': tests
+        }
+        self._put_json('results.json', results)
+        self._put_json('artifacts.json', {'run_arn': summary['run_arn'], 'artifacts': manifest})
+
+        stored = [entry for entry in manifest if entry['state'] == 'stored']
+        report = {
+            'location': f"s3://{self.bucket}/{self.prefix}",
+            'artifacts': len(manifest),
+            'stored': len(stored),
+            'linked': sum(1 for entry in manifest if entry['state'] == 'linked'),
+            'failed': sum(1 for entry in manifest if entry['state'] == 'failed'),
+            'bytes': sum(entry['bytes'] for entry in stored),
+            'tests': results['totals'],
+            'spec_durations': results['spec_durations'],
+            'seconds': round(time.monotonic() - started, 1)
+        }
+        logger.info(
+            f"Ingested {report['stored']} artifact(s) ({report['bytes'] / (1024*1024):.2f} MB) "
+            f"and {len(tests)} test result(s) in {report['seconds']} s"
+        )
+        return report
+
+    def _list_artifacts(self, summary: Dict[str, Any], executor: ThreadPoolExecutor) -> List[Dict[str, Any]]:
+        """Artifacts of every job, suite and test, each tagged with where it came from"""
+        targets = []
+        for device in summary.get('devices', []):
+            job_dir = f"{_slug(device.get('device'))}-{_slug(device.get('os'))}-{_arn_id(device['job_arn'])[:8]}"
+            targets.append((device['job_arn'], job_dir))
+            for suite in device.get('suites', []):
+                suite_dir = f"{job_dir}/{_slug(suite.get('name'))}"
+                targets.append((suite['suite_arn'], suite_dir))
+                targets.extend(
+                    (test['test_arn'], f"{suite_dir}/{_slug(test.get('name'))}") for test in suite.get('tests', [])
+                )
+
+        listings = executor.map(
+            lambda call: [
+                dict(artifact, directory=call[1])
+                for artifact in paginate(self.devicefarm_client.list_artifacts, 'artifacts', arn=call[0], type=call[2])
+            ],
+            [(arn, directory, artifact_type) for arn, directory in targets for artifact_type in ARTIFACT_TYPES]
+        )
+        artifacts = {}
+        for listing in listings:
+            for artifact in listing:
+                artifacts.setdefault(artifact['arn'], artifact)
+        return list(artifacts.values())
+
+    def _ingest_artifact(self, artifact: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        extension = (artifact.get('extension') or '').lower()
+        filename = _slug(artifact.get('name')) + (f".{extension}" if extension else '')
+        key = f"{self.prefix}artifacts/{artifact['directory']}/{_arn_id(artifact['arn'])[-8:]}-{filename}"
+        entry = {
+            'name': artifact.get('name'),
+            'type': artifact.get('type'),
+            'source': artifact['directory'],
+            'key': None,
+            'url': None,
+            'bytes': 0,
+            'state': 'stored'
+        }
+
+        is_video = artifact.get('type') == 'VIDEO' or extension in VIDEO_EXTENSIONS
+        if is_video and self.video_policy != 'download':
+            if self.video_policy == 'skip':
+                return dict(entry, state='skipped'), []
+            return dict(entry, url=artifact.get('url'), state='linked'), []
+
+        fd, tmp_path = tempfile.mkstemp(prefix='artifact-', suffix=f".{extension or 'bin'}")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                size = self._download(artifact['url'], f)
+            if size is None:
+                return dict(entry, url=artifact.get('url'), state='linked'), []
+
+            records = self._parse(tmp_path, extension, artifact.get('name'), artifact['directory'])
+            self.s3_client.upload_file(tmp_path, self.bucket, key)
+            return dict(entry, key=key, bytes=size), records
+        except Exception as e:
+            logger.warning(f"Failed to ingest artifact {artifact.get('name')} from {artifact['directory']}: {str(e)}")
+            return dict(entry, url=artifact.get('url'), state='failed'), []
+        finally:
+            os.unlink(tmp_path)
+
+    def _download(self, url: str, output: IO[bytes]) -> Optional[int]:
+        """Stream url into output, or return None once it proves larger than max_bytes"""
+        with self.session.get(url, stream=True, timeout=(10, 120)) as response:
+            response.raise_for_status()
+            declared = int(response.headers.get('Content-Length') or 0)
+            if self.max_bytes and declared > self.max_bytes:
+                return None
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if self.max_bytes and size > self.max_bytes:
+                    return None
+                output.write(chunk)
+        return size
+
+    def _parse(self, path: str, extension: str, name: Optional[str], source: str) -> List[Dict[str, Any]]:
+        """Test records from a JUnit report, or from the reports inside a zip artifact"""
+        records = []
+        if extension == 'xml' and 'junit' in (name or '').lower():
+            with open(path, 'rb') as f:
+                records.extend(parse_junit(f))
+        elif extension == 'zip':
+            with zipfile.ZipFile(path) as archive:
+                for member in sorted(archive.namelist()):
+                    if JUNIT_PATTERN.search(member):
+                        with archive.open(member) as f:
+                            records.extend(parse_junit(f))
+        return [dict(record, source=source) for record in records]
+
+    @staticmethod
+    def _spec_durations(tests: List[Dict[str, Any]]) -> Dict[str, float]:
+        """Seconds per spec on its slowest device, from the testcase times"""
+        per_device: Dict[Tuple[str, str], float] = {}
+        for test in tests:
+            if test['spec']:
+                device = test['source'].split('/', 1)[0]
+                per_device[(test['spec'], device)] = per_device.get((test['spec'], device), 0.0) + test['seconds']
+
+        durations: Dict[str, float] = {}
+        for (spec, _), seconds in per_device.items():
+            durations[spec] = round(max(durations.get(spec, 0.0), seconds), 1)
+        return durations
+
+    def _put_json(self, name: str, document: Dict[str, Any]):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{name}",
+            Body=json.dumps(document, indent=2).encode('utf-8'),
+            ContentType='application/json'
+        )
@@ -0,0 +1,389 @@
+"""
+Append-only history of monitored Device Farm runs, in SQLite.
+
+Every monitored run adds its runner phase timings, Device Farm queue and
+execution times, per-device job durations, per-test durations and, when results
+were ingested, per-spec durations. Rows are keyed by Device Farm ARNs and never
+updated, so databases merge by taking the union. The runner appends the run to
+its local database and uploads a shard holding only that run to
+<prefix><run id>.sqlite3; no object is ever rewritten, so concurrent runners
+cannot lose each other's rows. --pull merges the shards the local database has
+not seen yet.
+
+The query CLI answers the usual questions from the local copy (--pull refreshes
+it from S3 first):
+
+Usage:
+    python3 run_history.py [--db PATH] [--pull --bucket BUCKET [--prefix PREFIX]] runs [--limit 20]
+    python3 run_history.py slower [--recent 5] [--baseline 20] [--min-change 0.2]
+    python3 run_history.py spec src/tests/login.test [--limit 20]
+    python3 run_history.py queue [--days 30]
+    python3 run_history.py phases [--days 30]
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from s3_routing import bucket_region
+from sharding import spec_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = '/tmp/devicefarm-cache/run-history.sqlite3'
+DEFAULT_S3_PREFIX = 'devicefarm-cache/run-history/'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_arn TEXT PRIMARY KEY,
+    run_name TEXT,
+    app_type TEXT,
+    app_file_path TEXT,
+    device_pool TEXT,
+    shard INTEGER,
+    result TEXT,
+    passed INTEGER,
+    created REAL,
+    started REAL,
+    stopped REAL,
+    queue_seconds REAL,
+    duration_seconds REAL,
+    total_seconds REAL,
+    device_minutes REAL
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_arn TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    seconds REAL,
+    PRIMARY KEY (run_arn, phase)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_arn TEXT PRIMARY KEY,
+    run_arn TEXT NOT NULL,
+    device TEXT,
+    os TEXT,
+    platform TEXT,
+    result TEXT,
+    created REAL,
+    queue_seconds REAL,
+    duration_seconds REAL,
+    device_minutes REAL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    test_arn TEXT PRIMARY KEY,
+    job_arn TEXT NOT NULL,
+    run_arn TEXT NOT NULL,
+    suite TEXT,
+    name TEXT,
+    result TEXT,
+    duration_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS specs (
+    run_arn TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    created REAL,
+    seconds REAL,
+    PRIMARY KEY (run_arn, spec)
+);
+CREATE TABLE IF NOT EXISTS shards (
+    s3_key TEXT PRIMARY KEY
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created, device, os, queue_seconds, duration_seconds);
+CREATE INDEX IF NOT EXISTS jobs_run ON jobs (run_arn);
+CREATE INDEX IF NOT EXISTS tests_run ON tests (run_arn);
+CREATE INDEX IF NOT EXISTS specs_spec ON specs (spec, created, seconds);
+"""
+TABLES = ['runs', 'phases', 'jobs', 'tests', 'specs']
+
+# Every runner in the process appends to the same local file
+_write_lock = threading.Lock()
+
+
+def _epoch(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+class RunHistory:
+    """SQLite run history kept at local_path and optionally sharded per run under an S3 prefix"""
+
+    def __init__(self, local_path: str = DEFAULT_PATH, s3_client: Any = None, s3_bucket: Optional[str] = None,
+                 s3_prefix: Optional[str] = None):
+        self.local_path = local_path
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix
+
+    @property
+    def uses_s3(self) -> bool:
+        return bool(self.s3_client and self.s3_bucket and self.s3_prefix)
+
+    def connect(self, path: Optional[str] = None) -> sqlite3.Connection:
+        path = path or self.local_path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.executescript(SCHEMA)
+        return connection
+
+    def shard_key(self, run_arn: str) -> str:
+        return f"{self.s3_prefix}{run_arn.rsplit('/', 1)[-1]}.sqlite3"
+
+    def record(self, run_result: Dict[str, Any]):
+        """Append a monitored run locally and upload it as its own shard.
+
+        Nothing is downloaded and no shared object is rewritten, so recording costs
+        one small PUT however long the history gets.
+        """
+        with _write_lock:
+            with closing(self.connect()) as connection, connection:
+                self._insert(connection, run_result)
+        if self.uses_s3:
+            self._push_shard(run_result)
+        logger.info(f"Recorded run {run_result.get('run_name')} in run history")
+
+    def _insert(self, connection: sqlite3.Connection, run_result: Dict[str, Any]):
+        summary = run_result['summary']
+        created = _epoch(summary.get('created'))
+        run_arn = summary['run_arn']
+        spec_durations = (run_result.get('results') or {}).get('spec_durations') or {}
+
+        connection.execute(
+            "INSERT OR IGNORE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_arn, run_result.get('run_name'), run_result.get('app_type'),
+             run_result.get('app_file_path'), run_result.get('device_pool_name'), run_result.get('shard'),
+             summary.get('result'), int(bool(summary.get('passed'))), created,
+             _epoch(summary.get('started')), _epoch(summary.get('stopped')), summary.get('queue_seconds'),
+             summary.get('duration_seconds'), summary.get('total_seconds'), summary.get('device_minutes'))
+        )
+        connection.executemany(
+            "INSERT OR IGNORE INTO phases VALUES (?, ?, ?)",
+            [(run_arn, phase, seconds) for phase, seconds in sorted(run_result.get('phases', {}).items())
+             if seconds is not None]
+        )
+        for device in summary.get('devices', []):
+            connection.execute(
+                "INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (device['job_arn'], run_arn, device.get('device'), device.get('os'), device.get('platform'),
+                 device.get('result'), created, device.get('queue_seconds'), device.get('duration_seconds'),
+                 device.get('device_minutes'))
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO tests VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(test['test_arn'], device['job_arn'], run_arn, suite.get('name'), test.get('name'),
+                  test.get('result'), test.get('duration_seconds'))
+                 for suite in device.get('suites', []) for test in suite.get('tests', [])]
+            )
+        connection.executemany(
+            "INSERT OR IGNORE INTO specs VALUES (?, ?, ?, ?)",
+            [(run_arn, spec_key(spec), created, seconds)
+             for spec, seconds in sorted(spec_durations.items())]
+        )
+
+    def _push_shard(self, run_result: Dict[str, Any]):
+        key = self.shard_key(run_result['summary']['run_arn'])
+        fd, shard_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        try:
+            with closing(self.connect(shard_path)) as connection, connection:
+                self._insert(connection, run_result)
+            with open(shard_path, 'rb') as f:
+                self.s3_client.put_object(Bucket=self.s3_bucket, Key=key, Body=f.read(),
+                                          ContentType='application/vnd.sqlite3')
+        except Exception as e:
+            logger.warning(f"Failed to write run history shard to s3://{self.s3_bucket}/{key}: {str(e)}")
+            return
+        finally:
+            os.unlink(shard_path)
+
+        # Our own shard holds nothing the local database lacks
+        with _write_lock, closing(self.connect()) as connection, connection:
+            connection.execute("INSERT OR IGNORE INTO shards VALUES (?)", (key,))
+
+    def pull(self):
+        """Merge the shards under the S3 prefix the local database has not merged yet"""
+        if not self.uses_s3:
+            return
+        try:
+            keys = [
+                item['Key']
+                for page in self.s3_client.get_paginator('list_objects_v2').paginate(
+                    Bucket=self.s3_bucket, Prefix=self.s3_prefix)
+                for item in page.get('Contents', [])
+                if item['Key'].endswith('.sqlite3')
+            ]
+        except Exception as e:
+            logger.warning(f"Failed to list run history at s3://{self.s3_bucket}/{self.s3_prefix}: {str(e)}")
+            return
+
+        with closing(self.connect()) as connection:
+            merged = {row['s3_key'] for row in connection.execute("SELECT s3_key FROM shards")}
+        pending = [key for key in keys if key not in merged]
+        logger.info(f"Merging {len(pending)} new run history shard(s) of {len(keys)}")
+
+        for key in pending:
+            try:
+                body = self.s3_client.get_object(Bucket=self.s3_bucket, Key=key)['Body'].read()
+            except Exception as e:
+                logger.warning(f"Failed to read run history shard s3://{self.s3_bucket}/{key}: {str(e)}")
+                continue
+            fd, shard_path = tempfile.mkstemp(suffix='.sqlite3')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(body)
+                with _write_lock, closing(self.connect()) as connection, connection:
+                    connection.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+                    for table in TABLES:
+                        connection.execute(f"INSERT OR IGNORE INTO main.{table} SELECT * FROM shard.{table}")
+                    connection.execute("INSERT OR IGNORE INTO shards VALUES (?)", (key,))
+            finally:
+                os.unlink(shard_path)
+
+    def query(self, sql: str, parameters: tuple = ()) -> List[Dict[str, Any]]:
+        with closing(self.connect()) as connection:
+            return [dict(row) for row in connection.execute(sql, parameters)]
+
+    def recent_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.query(
+            "SELECT run_name, result, device_pool, shard, queue_seconds, duration_seconds, total_seconds, "
+            "device_minutes FROM runs ORDER BY created DESC LIMIT ?", (limit,)
+        )
+
+    def slower_specs(self, recent: int = 5, baseline: int = 20, min_change: float = 0.2) -> List[Dict[str, Any]]:
+        """Specs whose average over their last `recent` runs exceeds the `baseline` runs before by min_change.
+
+        Each window is a short range scan of the (spec, created, seconds) index, so the
+        cost grows with the number of specs rather than the number of recorded runs.
+        """
+        return self.query(
+            """
+            WITH windows AS (
+                SELECT spec,
+                       (SELECT AVG(seconds) FROM (
+                           SELECT seconds FROM specs AS recent WHERE recent.spec = names.spec
+                           ORDER BY created DESC LIMIT :recent
+                       )) AS recent_seconds,
+                       (SELECT AVG(seconds) FROM (
+                           SELECT seconds FROM specs AS earlier WHERE earlier.spec = names.spec
+                           ORDER BY created DESC LIMIT :baseline OFFSET :recent
+                       )) AS baseline_seconds,
+                       (SELECT COUNT(*) FROM (
+                           SELECT 1 FROM specs AS earlier WHERE earlier.spec = names.spec
+                           ORDER BY created DESC LIMIT :baseline OFFSET :recent
+                       )) AS baseline_runs
+                FROM (SELECT DISTINCT spec FROM specs) AS names
+            )
+            SELECT spec, ROUND(recent_seconds, 1) AS recent_seconds, ROUND(baseline_seconds, 1) AS baseline_seconds,
+                   ROUND(recent_seconds / baseline_seconds - 1, 3) AS change, baseline_runs
+            FROM windows
+            WHERE baseline_seconds > 0 AND recent_seconds / baseline_seconds - 1 >= :min_change
+            ORDER BY change DESC
+            """,
+            {'recent': recent, 'baseline': baseline, 'min_change': min_change}
+        )
+
+    def spec_history(self, spec: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.query(
+            "SELECT runs.run_name, runs.result, specs.seconds FROM specs JOIN runs USING (run_arn) "
+            "WHERE specs.spec = ? ORDER BY specs.created DESC LIMIT ?", (spec_key(spec), limit)
+        )
+
+    def queue_times(self, days: float = 30) -> List[Dict[str, Any]]:
+        """Per-device queue and execution times over the last `days` days"""
+        return self.query(
+            "SELECT device, os, COUNT(*) AS jobs, ROUND(AVG(queue_seconds), 1) AS avg_queue_seconds, "
+            "ROUND(MAX(queue_seconds), 1) AS max_queue_seconds, "
+            "ROUND(AVG(duration_seconds), 1) AS avg_duration_seconds "
+            "FROM jobs WHERE created >= ? GROUP BY device, os ORDER BY avg_queue_seconds DESC",
+            (time.time() - days * 86400,)
+        )
+
+    def phase_times(self, days: float = 30) -> List[Dict[str, Any]]:
+        return self.query(
+            "SELECT phase, COUNT(*) AS runs, ROUND(AVG(seconds), 1) AS avg_seconds, "
+            "ROUND(MAX(seconds), 1) AS max_seconds "
+            "FROM phases JOIN runs USING (run_arn) WHERE runs.created >= ? GROUP BY phase ORDER BY avg_seconds DESC",
+            (time.time() - days * 86400,)
+        )
+
+
+def format_rows(rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return "(no rows)"
+    columns = list(rows[0])
+    widths = {
+        column: max(len(column), *(len('' if row[column] is None else str(row[column])) for row in rows))
+        for column in columns
+    }
+    lines = ['  '.join(column.ljust(widths[column]) for column in columns)]
+    for row in rows:
+        lines.append('  '.join(('' if row[column] is None else str(row[column])).ljust(widths[column])
+                               for column in columns))
+    return '\n'.join(lines)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.getenv('RUN_HISTORY_PATH', DEFAULT_PATH), help='local history database')
+    parser.add_argument('--pull', action='store_true', help='merge new S3 shards into the local database first')
+    parser.add_argument('--bucket', default=os.getenv('S3_BUCKET'), help='bucket holding the shards')
+    parser.add_argument('--prefix', default=os.getenv('RUN_HISTORY_S3_PREFIX', DEFAULT_S3_PREFIX),
+                        help='key prefix of the per-run shards')
+    parser.add_argument('--json', action='store_true', help='print rows as JSON')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runs = commands.add_parser('runs', help='most recent runs')
+    runs.add_argument('--limit', type=int, default=20)
+    slower = commands.add_parser('slower', help='specs that got slower recently')
+    slower.add_argument('--recent', type=int, default=5, help='runs in the recent window')
+    slower.add_argument('--baseline', type=int, default=20, help='runs before it to compare with')
+    slower.add_argument('--min-change', type=float, default=0.2, help='minimum relative slowdown')
+    spec = commands.add_parser('spec', help='durations of one spec over time')
+    spec.add_argument('spec')
+    spec.add_argument('--limit', type=int, default=20)
+    queue = commands.add_parser('queue', help='device queue and execution times')
+    queue.add_argument('--days', type=float, default=30)
+    phases = commands.add_parser('phases', help='runner and Device Farm phase timings')
+    phases.add_argument('--days', type=float, default=30)
+    args = parser.parse_args()
+
+    s3_client = None
+    if args.pull:
+        if not args.bucket:
+            parser.error('--pull needs --bucket or S3_BUCKET')
+        from handler import get_aws_client
+        # The bucket lives in the stack's region, not Device Farm's
+        s3_client = get_aws_client('s3', region_name=bucket_region(get_aws_client('s3'), args.bucket) or 'us-west-2')
+    history = RunHistory(args.db, s3_client=s3_client, s3_bucket=args.bucket, s3_prefix=args.prefix)
+    history.pull()
+
+    started = time.perf_counter()
+    if args.command == 'runs':
+        rows = history.recent_runs(args.limit)
+    elif args.command == 'slower':
+        rows = history.slower_specs(args.recent, args.baseline, args.min_change)
+    elif args.command == 'spec':
+        rows = history.spec_history(args.spec, args.limit)
+    elif args.command == 'queue':
+        rows = history.queue_times(args.days)
+    else:
+        rows = history.phase_times(args.days)
+    elapsed = (time.perf_counter() - started) * 1000
+
+    print(json.dumps(rows, indent=2) if args.json else format_rows(rows))
+    logger.info(f"Query returned {len(rows)} row(s) in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
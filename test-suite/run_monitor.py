@@ -0,0 +1,146 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from pagination import paginate
+from status_poller import StatusPoller
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ['total', 'passed', 'failed', 'warned', 'errored', 'stopped', 'skipped']
+
+
+def _seconds_between(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+    if not start or not end:
+        return None
+    return round((end - start).total_seconds(), 1)
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _counters(item: Dict[str, Any]) -> Dict[str, int]:
+    counters = item.get('counters', {})
+    return {field: counters.get(field, 0) for field in COUNTER_FIELDS}
+
+
+class RunMonitor:
+    """Tracks a scheduled Device Farm run to completion and summarizes its results"""
+
+    def __init__(self, devicefarm_client: Any, status_poller: StatusPoller,
+                 initial_interval: float = 10.0, max_interval: float = 60.0, workers: int = 8):
+        self.devicefarm_client = devicefarm_client
+        self.status_poller = status_poller
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.workers = max(1, workers)
+
+    def wait_and_summarize(self, run_arn: str, project_arn: str, timeout: float,
+                           passing_results: List[str]) -> Dict[str, Any]:
+        """Block until the run completes and return a structured summary"""
+        logger.info(f"Monitoring test run until completion (timeout {timeout:.0f} seconds)")
+
+        self.status_poller.wait_for_run(
+            run_arn,
+            timeout=timeout,
+            project_arn=project_arn,
+            initial_interval=self.initial_interval,
+            max_interval=self.max_interval
+        )
+
+        # The final get_run carries timings that list_runs does not always fill in
+        run = self.devicefarm_client.get_run(arn=run_arn)['run']
+        summary = self.summarize(run)
+        summary['passed'] = summary['result'] in passing_results
+
+        self._log_summary(summary)
+        return summary
+
+    def summarize(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the run summary with per-device job and suite counters and per-test durations.
+
+        Suites and tests are listed on a small pool: one call per job and one per suite,
+        which sequentially would add jobs x suites round trips to the end of every run.
+        """
+        jobs = list(paginate(self.devicefarm_client.list_jobs, 'jobs', arn=run['arn']))
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='df-summary') as executor:
+            suites_per_job = list(executor.map(
+                lambda job: list(paginate(self.devicefarm_client.list_suites, 'suites', arn=job['arn'])), jobs
+            ))
+            tests_per_suite = iter(list(executor.map(
+                lambda suite: list(paginate(self.devicefarm_client.list_tests, 'tests', arn=suite['arn'])),
+                [suite for suites in suites_per_job for suite in suites]
+            )))
+
+        devices = []
+        for job, job_suites in zip(jobs, suites_per_job):
+            suites = [
+                {
+                    'suite_arn': suite['arn'],
+                    'name': suite.get('name'),
+                    'result': suite.get('result'),
+                    'counters': _counters(suite),
+                    'duration_seconds': _seconds_between(suite.get('started'), suite.get('stopped')),
+                    'tests': [
+                        {
+                            'test_arn': test['arn'],
+                            'name': test.get('name'),
+                            'result': test.get('result'),
+                            'duration_seconds': _seconds_between(test.get('started'), test.get('stopped'))
+                        }
+                        for test in next(tests_per_suite)
+                    ]
+                }
+                for suite in job_suites
+            ]
+
+            device = job.get('device', {})
+            devices.append({
+                'job_arn': job['arn'],
+                'device': device.get('name'),
+                'platform': device.get('platform'),
+                'os': device.get('os'),
+                'result': job.get('result'),
+                'counters': _counters(job),
+                'queue_seconds': _seconds_between(job.get('created'), job.get('started')),
+                'duration_seconds': _seconds_between(job.get('started'), job.get('stopped')),
+                'device_minutes': job.get('deviceMinutes', {}).get('total'),
+                'suites': suites
+            })
+
+        return {
+            'run_arn': run['arn'],
+            'status': run.get('status'),
+            'result': run.get('result'),
+            'result_code': run.get('resultCode'),
+            'message': run.get('message'),
+            'counters': _counters(run),
+            'created': _isoformat(run.get('created')),
+            'started': _isoformat(run.get('started')),
+            'stopped': _isoformat(run.get('stopped')),
+            'queue_seconds': _seconds_between(run.get('created'), run.get('started')),
+            'duration_seconds': _seconds_between(run.get('started'), run.get('stopped')),
+            'total_seconds': _seconds_between(run.get('created'), run.get('stopped')),
+            'device_minutes': run.get('deviceMinutes', {}).get('total'),
+            'devices': devices
+        }
+
+    def _log_summary(self, summary: Dict[str, Any]):
+        counters = summary['counters']
+        logger.info(f"Test run finished with result: {summary['result']}")
+        logger.info(
+            f"  Tests: {counters['total']} total, {counters['passed']} passed, "
+            f"{counters['failed']} failed, {counters['errored']} errored, {counters['skipped']} skipped"
+        )
+        logger.info(
+            f"  Queue time: {summary['queue_seconds']} s, run duration: {summary['duration_seconds']} s"
+        )
+        for device in summary['devices']:
+            device_counters = device['counters']
+            logger.info(
+                f"  {device['device']} ({device['os']}): {device['result']} - "
+                f"{device_counters['passed']}/{device_counters['total']} passed "
+                f"in {device['duration_seconds']} s"
+            )
@@ -0,0 +1,188 @@
+import base64
+import hashlib
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+from s3_stream import s3_content_md5, s3_content_sha256
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+PART_ATTEMPTS = 3
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+def s3_multipart_etag(head: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+    """Return the digest and part count of a multipart upload ETag ('<md5 of part md5s>-<parts>')"""
+    etag = head.get('ETag', '').strip('"')
+    digest, separator, parts = etag.partition('-')
+    if not separator or len(digest) != 32 or not parts.isdigit() or head.get('ServerSideEncryption') == 'aws:kms':
+        return None
+    return digest, int(parts)
+
+
+class RangedDownloader:
+    """Downloads an S3 object with concurrent GETs and verifies it against S3's own checksums.
+
+    Objects uploaded in several parts are fetched part by part (GetObject with
+    PartNumber), so every worker hashes exactly one original part while streaming
+    it and the multipart ETag, or a composite SHA-256 checksum, can be rebuilt from
+    the part digests. Single-part objects are fetched as part_size byte ranges and
+    their full-object SHA-256 or MD5 ETag is computed in order, each range being
+    hashed from the page cache as soon as it and the ones before it have landed.
+    Workers write with pwrite into a preallocated file, so no part is buffered in
+    memory beyond one chunk.
+    """
+
+    def __init__(self, s3_client: Any, part_size: int = DEFAULT_PART_SIZE, workers: int = 8):
+        self.s3_client = s3_client
+        self.part_size = max(CHUNK_SIZE, part_size)
+        self.workers = max(1, workers)
+
+    def download(self, bucket: str, key: str, local_path: str) -> Dict[str, Any]:
+        """Download s3://bucket/key to local_path and return its size, verification and throughput"""
+        started = time.perf_counter()
+        head = self.s3_client.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+        size = head['ContentLength']
+
+        multipart = s3_multipart_etag(head)
+        part_count = multipart[1] if multipart else 1
+        composite = (head.get('ChecksumSHA256') or '').rpartition('-')[2]
+        if part_count == 1 and '-' in (head.get('ChecksumSHA256') or '') and composite.isdigit():
+            part_count = int(composite)
+
+        fd = os.open(local_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            if part_count > 1:
+                verified = self._download_parts(bucket, key, fd, size, part_count, head, multipart)
+            else:
+                verified = self._download_ranges(bucket, key, fd, size, head)
+        except BaseException:
+            os.close(fd)
+            os.unlink(local_path)
+            raise
+        os.close(fd)
+
+        seconds = time.perf_counter() - started
+        result = {
+            'path': local_path,
+            'bytes': size,
+            'parts': part_count if part_count > 1 else -(-size // self.part_size) or 1,
+            'verified': verified,
+            'seconds': round(seconds, 3),
+            'throughput_mbps': round(size / (1024 * 1024) / max(seconds, 0.001), 2)
+        }
+        logger.info(
+            f"Downloaded {size / (1024*1024):.2f} MB in {result['parts']} part(s) at {result['throughput_mbps']} MB/s"
+            + (f", verified by {verified}" if verified else ', no S3 checksum to verify against')
+        )
+        return result
+
+    def _download_parts(self, bucket: str, key: str, fd: int, size: int, part_count: int,
+                        head: Dict[str, Any], multipart: Optional[Tuple[str, int]]) -> Optional[str]:
+        """Fetch every original upload part in parallel and check the ETag or composite checksum"""
+        def fetch(part_number: int) -> Tuple[bytes, bytes, int]:
+            return self._with_retries(
+                f"part {part_number}",
+                lambda: self._fetch(fd, bucket, key, head['ETag'], True, PartNumber=part_number)
+            )
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, part_count), thread_name_prefix='s3-part') as executor:
+            parts = list(executor.map(fetch, range(1, part_count + 1)))
+
+        received = sum(length for _, _, length in parts)
+        if received != size:
+            raise ValueError(f"Size mismatch: downloaded {received} bytes, expected {size}")
+
+        checksum = head.get('ChecksumSHA256')
+        if checksum and '-' in checksum:
+            expected = checksum.rsplit('-', 1)[0]
+            actual = base64.b64encode(hashlib.sha256(b''.join(sha for _, sha, _ in parts)).digest()).decode()
+            if actual != expected:
+                raise ValueError(f"Composite SHA-256 mismatch: got {actual}-{part_count}, expected {checksum}")
+            return 'composite-sha256'
+        if multipart:
+            actual = hashlib.md5(b''.join(md5 for md5, _, _ in parts)).hexdigest()
+            if actual != multipart[0]:
+                raise ValueError(f"Multipart ETag mismatch: got {actual}-{part_count}, expected {head['ETag']}")
+            return 'multipart-etag'
+        return None
+
+    def _download_ranges(self, bucket: str, key: str, fd: int, size: int, head: Dict[str, Any]) -> Optional[str]:
+        """Fetch byte ranges in parallel while hashing the completed prefix of the file in order"""
+        expected_sha256 = s3_content_sha256(head)
+        expected_md5 = s3_content_md5(head)
+        if expected_sha256:
+            digest, verified, expected = hashlib.sha256(), 'sha256', expected_sha256
+            label = 'SHA-256'
+        elif expected_md5:
+            digest, verified, expected = hashlib.md5(), 'etag', expected_md5
+            label = 'MD5'
+        else:
+            digest, verified, expected = None, None, None
+
+        ranges = [(start, min(start + self.part_size, size) - 1) for start in range(0, size, self.part_size)]
+        if not ranges:
+            return verified if digest and digest.hexdigest() == expected else None
+
+        def fetch(byte_range: Tuple[int, int]) -> Tuple[bytes, bytes, int]:
+            return self._with_retries(
+                f"bytes {byte_range[0]}-{byte_range[1]}",
+                lambda: self._fetch(fd, bucket, key, head['ETag'], False,
+                                    Range=f"bytes={byte_range[0]}-{byte_range[1]}")
+            )
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(ranges)), thread_name_prefix='s3-range') as executor:
+            futures = [executor.submit(fetch, byte_range) for byte_range in ranges]
+            for (start, end), future in zip(ranges, futures):
+                _, _, length = future.result()
+                if length != end - start + 1:
+                    raise ValueError(f"Short range: got {length} bytes for {start}-{end}")
+                if digest:
+                    for offset in range(start, end + 1, CHUNK_SIZE):
+                        digest.update(os.pread(fd, min(CHUNK_SIZE, end + 1 - offset), offset))
+
+        if digest and digest.hexdigest() != expected:
+            raise ValueError(f"{label} mismatch: got {digest.hexdigest()}, expected {expected}")
+        return verified
+
+    def _fetch(self, fd: int, bucket: str, key: str, etag: str, hashed: bool,
+               **selector) -> Tuple[bytes, bytes, int]:
+        """GET one part or range into its place in the file, returning its length and, if hashed, digests"""
+        # IfMatch fails the GET instead of mixing in bytes of an object replaced mid-download
+        response = self.s3_client.get_object(Bucket=bucket, Key=key, IfMatch=etag, **selector)
+        match = CONTENT_RANGE.match(response.get('ContentRange') or '')
+        offset = int(match.group(1)) if match else 0
+
+        md5 = hashlib.md5() if hashed else None
+        sha256 = hashlib.sha256() if hashed else None
+        length = 0
+        body = response['Body']
+        try:
+            for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+                if hashed:
+                    md5.update(chunk)
+                    sha256.update(chunk)
+                os.pwrite(fd, chunk, offset + length)
+                length += len(chunk)
+        finally:
+            body.close()
+        return (md5.digest() if hashed else b''), (sha256.digest() if hashed else b''), length
+
+    @staticmethod
+    def _with_retries(label: str, fetch: Any) -> Tuple[bytes, bytes, int]:
+        for attempt in range(1, PART_ATTEMPTS + 1):
+            try:
+                return fetch()
+            except Exception as e:
+                if attempt == PART_ATTEMPTS:
+                    raise
+                logger.warning(f"Retrying {label} after attempt {attempt} failed: {str(e)}")
+                time.sleep(0.5 * 2 ** (attempt - 1))
+
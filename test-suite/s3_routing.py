@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+from typing import Dict, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+ACCELERATE_MODES = ('auto', 'true', 'false')
+
+# Bucket regions and acceleration settings do not change under a running process
+_lookup_lock = threading.Lock()
+_bucket_regions: Dict[str, str] = {}
+_acceleration: Dict[str, bool] = {}
+
+
+def local_region() -> Optional[str]:
+    """Region the runner itself executes in, as CodeBuild, ECS and Lambda report it"""
+    return os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION')
+
+
+def bucket_region(s3_client: Any, bucket: str) -> Optional[str]:
+    """Region of a bucket, looked up once per process; None if it cannot be read"""
+    with _lookup_lock:
+        if bucket in _bucket_regions:
+            return _bucket_regions[bucket]
+    try:
+        region = s3_client.get_bucket_location(Bucket=bucket).get('LocationConstraint') or 'us-east-1'
+    except Exception as e:
+        logger.warning(f"Could not look up the region of bucket {bucket}: {str(e)}")
+        return None
+    with _lookup_lock:
+        _bucket_regions[bucket] = region
+    return region
+
+
+def acceleration_enabled(s3_client: Any, bucket: str) -> bool:
+    """Whether Transfer Acceleration is enabled on a bucket, looked up once per process"""
+    with _lookup_lock:
+        if bucket in _acceleration:
+            return _acceleration[bucket]
+    try:
+        enabled = s3_client.get_bucket_accelerate_configuration(Bucket=bucket).get('Status') == 'Enabled'
+    except Exception as e:
+        logger.warning(f"Could not read the acceleration setting of bucket {bucket}: {str(e)}")
+        enabled = False
+    with _lookup_lock:
+        _acceleration[bucket] = enabled
+    return enabled
+
+
+class LazyClient:
+    """Stands in for a client that is only created, and its region looked up, on first use"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client: Any = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        with self._lock:
+            if self._client is None:
+                self._client = self._factory()
+        return getattr(self._client, name)
+
+
+class ArtifactRouter:
+    """Picks the S3 client a runner reads an artifact through.
+
+    Routes, in order of preference:
+    - 'accelerated': the bucket through its Transfer Acceleration endpoint, when
+      the bucket is in another region and acceleration is enabled on it
+      (accelerate='auto') or forced on (accelerate='true').
+    - 'regional': the bucket with a client for its own region, so requests are
+      not redirected from the runner's default region.
+
+    client_for(region_name, accelerate) returns the S3 client for a region.
+    """
+
+    def __init__(self, client_for: Callable[[str, bool], Any], bucket: str, accelerate: str = 'auto',
+                 default_region: str = 'us-west-2', runner_region: Optional[str] = None):
+        if accelerate not in ACCELERATE_MODES:
+            raise ValueError(f"S3 acceleration must be one of {', '.join(ACCELERATE_MODES)}, got: {accelerate}")
+        self.client_for = client_for
+        self.bucket = bucket
+        self.accelerate = accelerate
+        self.default_region = default_region
+        self.runner_region = runner_region or local_region()
+
+    def source_client(self) -> Any:
+        """Client for the bucket's own region"""
+        return self.client_for(self._region_of(self.bucket) or self.default_region, False)
+
+    def route(self, key: str) -> Dict[str, Any]:
+        """Bucket, client and route name to read `key` through"""
+        source_region = self._region_of(self.bucket)
+        cross_region = bool(source_region and self.runner_region and source_region != self.runner_region)
+        if self.accelerate == 'true' or (
+            self.accelerate == 'auto' and cross_region and acceleration_enabled(self.source_client(), self.bucket)
+        ):
+            return self._describe('accelerated', self.bucket, source_region or self.default_region, True)
+
+        return self._describe('regional', self.bucket, source_region or self.default_region, False)
+
+    def _region_of(self, bucket: str) -> Optional[str]:
+        return bucket_region(self.client_for(self.default_region, False), bucket)
+
+    def _describe(self, route: str, bucket: str, region: str, accelerate: bool) -> Dict[str, Any]:
+        logger.info(
+            f"Reading from s3://{bucket} ({region}{', accelerated' if accelerate else ''}) via the {route} route, "
+            f"runner in {self.runner_region or 'an unknown region'}"
+        )
+        return {
+            'route': route,
+            'bucket': bucket,
+            'region': region,
+            'client': self.client_for(region, accelerate)
+        }
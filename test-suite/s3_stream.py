@@ -0,0 +1,81 @@
+import base64
+import hashlib
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def s3_content_sha256(head: Dict[str, Any]) -> Optional[str]:
+    """Return the hex SHA-256 of an S3 object if S3 stored a full-object checksum"""
+    checksum = head.get('ChecksumSHA256')
+    if not checksum or '-' in checksum or head.get('ChecksumType') == 'COMPOSITE':
+        return None
+    return base64.b64decode(checksum).hex()
+
+
+def s3_content_md5(head: Dict[str, Any]) -> Optional[str]:
+    """Return the hex MD5 of an S3 object if its ETag is a plain MD5 digest"""
+    etag = head.get('ETag', '').strip('"')
+    # Multipart and SSE-KMS ETags are not content digests
+    if len(etag) != 32 or '-' in etag or head.get('ServerSideEncryption') == 'aws:kms':
+        return None
+    return etag
+
+
+class VerifyingStream:
+    """File-like wrapper that hashes and counts bytes as they are read.
+
+    Only one read-sized chunk is held at a time, so an S3 GetObject body can be
+    piped into an HTTP PUT with constant memory. The declared length lets the
+    HTTP client send a Content-Length header instead of chunked encoding, which
+    pre-signed S3 PUTs reject.
+    """
+
+    def __init__(self, source: Any, expected_size: int, expected_md5: Optional[str] = None,
+                 expected_sha256: Optional[str] = None):
+        self.source = source
+        self.expected_size = expected_size
+        self.expected_md5 = expected_md5
+        self.expected_sha256 = expected_sha256
+        self.bytes_read = 0
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+
+    def __len__(self) -> int:
+        return self.expected_size
+
+    def __iter__(self):
+        return iter(lambda: self.read(1024 * 1024), b'')
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.source.read(size if size and size > 0 else None)
+        if not chunk:
+            return b''
+
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.expected_size:
+            raise ValueError(
+                f"Stream exceeded expected size: read {self.bytes_read} of {self.expected_size} bytes"
+            )
+
+        self._md5.update(chunk)
+        self._sha256.update(chunk)
+        return chunk
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def verify(self):
+        """Check that the whole stream was read and matches the expected digests"""
+        if self.bytes_read != self.expected_size:
+            raise ValueError(
+                f"Size mismatch: streamed {self.bytes_read} bytes, expected {self.expected_size}"
+            )
+        if self.expected_md5 and self._md5.hexdigest() != self.expected_md5:
+            raise ValueError(f"MD5 mismatch: got {self._md5.hexdigest()}, expected {self.expected_md5}")
+        if self.expected_sha256 and self.sha256 != self.expected_sha256:
+            raise ValueError(f"SHA-256 mismatch: got {self.sha256}, expected {self.expected_sha256}")
+
+        logger.info(f"Verified {self.bytes_read} streamed bytes (sha256 {self.sha256[:12]})")
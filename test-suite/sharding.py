@@ -0,0 +1,95 @@
+import heapq
+import logging
+import os
+import re
+import zipfile
+from typing import Dict, List, Optional
+
+from cache_store import JsonCacheStore
+
+logger = logging.getLogger(__name__)
+
+# Compiled specs inside system_tests.zip; the Device Farm spec runs the suite from dist/
+SPEC_PREFIX = 'dist/src/tests/'
+RUNNER_COMMAND = re.compile(r'^(\s*-\s*.*wdio/runner\.js)(.*)$', re.MULTILINE)
+
+
+def spec_key(spec_path: str) -> str:
+    """Normalize a spec path so durations recorded for .ts sources or .js builds both match"""
+    path = spec_path.replace('\\', '/')
+    if path.startswith('dist/'):
+        path = path[len('dist/'):]
+    root, extension = os.path.splitext(path)
+    return root if extension in ('.js', '.ts') else path
+
+
+def list_spec_files(test_package_path: str) -> List[str]:
+    """Spec files in the test package, relative to dist/ where the test spec runs the suite"""
+    with zipfile.ZipFile(test_package_path) as package:
+        specs = [
+            name[len('dist/'):] for name in package.namelist()
+            if name.startswith(SPEC_PREFIX) and name.endswith('.js')
+        ]
+    return sorted(specs)
+
+
+def expected_durations(specs: List[str], durations: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Expected seconds per spec; specs without history take the average of the known ones"""
+    durations = {spec_key(spec): seconds for spec, seconds in (durations or {}).items()}
+    known = [durations[spec_key(spec)] for spec in specs if spec_key(spec) in durations]
+    default = sum(known) / len(known) if known else 1.0
+    return {spec: durations.get(spec_key(spec), default) for spec in specs}
+
+
+def split_shards(specs: List[str], shard_count: int,
+                 durations: Optional[Dict[str, float]] = None) -> List[List[str]]:
+    """Split specs into at most shard_count shards with balanced expected durations.
+
+    Longest-processing-time first: each spec, slowest first, goes to the currently
+    lightest shard, so without any history the split is simply by count.
+    """
+    expected = expected_durations(specs, durations)
+
+    shard_count = max(1, min(shard_count, len(specs)))
+    shards: List[List[str]] = [[] for _ in range(shard_count)]
+    loads = [(0.0, index) for index in range(shard_count)]
+
+    for spec in sorted(specs, key=lambda spec: (-expected[spec], spec)):
+        load, index = heapq.heappop(loads)
+        shards[index].append(spec)
+        heapq.heappush(loads, (load + expected[spec], index))
+
+    for index, shard in enumerate(shards):
+        shard.sort()
+        logger.info(
+            f"Shard {index + 1}/{shard_count}: {len(shard)} spec(s), "
+            f"~{sum(expected[spec] for spec in shard):.0f} seconds expected"
+        )
+    return shards
+
+
+def render_shard_test_spec(test_spec: str, specs: List[str]) -> str:
+    """Restrict the test spec's runner command to the given spec files"""
+    spec_args = ''.join(f" --spec {spec}" for spec in specs)
+    rendered, count = RUNNER_COMMAND.subn(lambda match: f"{match.group(1)}{spec_args}{match.group(2)}", test_spec)
+    if count != 1:
+        raise ValueError(f"Expected one wdio/runner.js command in the test spec, found {count}")
+    return rendered
+
+
+class SpecDurations:
+    """Recorded per-spec durations, kept in a JsonCacheStore next to the other caches"""
+
+    ENTRIES_KEY = 'durations'
+
+    def __init__(self, store: JsonCacheStore):
+        self.store = store
+
+    def load(self) -> Dict[str, float]:
+        return dict(self.store.load().get(self.ENTRIES_KEY, {}))
+
+    def record(self, durations: Dict[str, float]):
+        """Merge newly measured durations into the recorded ones"""
+        entries = dict(self.load(), **{spec_key(spec): round(seconds, 1) for spec, seconds in durations.items()})
+        self.store.save({self.ENTRIES_KEY: entries}, merge_key=self.ENTRIES_KEY)
+        logger.info(f"Recorded durations for {len(durations)} spec(s)")
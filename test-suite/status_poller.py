@@ -0,0 +1,261 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+UPLOAD = 'upload'
+RUN = 'run'
+
+TERMINAL_STATUSES = {
+    UPLOAD: {'SUCCEEDED', 'FAILED'},
+    RUN: {'COMPLETED'},
+}
+
+
+class PollTarget:
+    """A single upload or run being watched by the poller"""
+
+    def __init__(self, arn: str, kind: str, project_arn: Optional[str], upload_type: Optional[str],
+                 timeout: float, interval: float, max_interval: float):
+        self.arn = arn
+        self.kind = kind
+        self.project_arn = project_arn
+        self.upload_type = upload_type
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout
+        self.interval = interval
+        self.max_interval = max_interval
+        self.next_poll_at = self.started_at + interval
+        self.status: Optional[str] = None
+        self.info: Dict[str, Any] = {}
+        self.error: Optional[BaseException] = None
+        # Failed status checks in a row
+        self.errors = 0
+        self.done = threading.Event()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def group(self):
+        return (self.kind, self.project_arn)
+
+
+class StatusPoller:
+    """Adaptive, multiplexed status poller for Device Farm uploads and runs.
+
+    Callers block in wait_for_upload / wait_for_run while a single background
+    thread polls every pending target. Intervals start short and back off
+    exponentially with jitter up to a cap, and every call carries its own deadline.
+    When several targets of the same kind share a project they are refreshed
+    together through list_uploads / list_runs instead of one get call per ARN.
+    A failed check backs the affected targets off; a target only fails once
+    max_errors checks in a row have failed or its deadline passes.
+    """
+
+    def __init__(self, devicefarm_client: Any, initial_interval: float = 1.0, max_interval: float = 15.0,
+                 backoff: float = 1.5, jitter: float = 0.2, batch_threshold: int = 2,
+                 batch_page_limit: int = 2, max_errors: int = 5):
+        self.devicefarm_client = devicefarm_client
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.batch_threshold = batch_threshold
+        self.batch_page_limit = batch_page_limit
+        self.max_errors = max(1, max_errors)
+        self.api_calls = 0
+        self._pending: Dict[str, PollTarget] = {}
+        self._unbatchable = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def wait_for_upload(self, upload_arn: str, timeout: float, project_arn: Optional[str] = None,
+                        upload_type: Optional[str] = None) -> Dict[str, Any]:
+        """Block until an upload is processed, raising if it fails or the deadline passes"""
+        target = self._wait(upload_arn, UPLOAD, project_arn, upload_type, timeout,
+                            self.initial_interval, self.max_interval)
+        if target.status == 'FAILED':
+            error_msg = f"Upload processing failed. Status: {target.status}"
+            if 'message' in target.info:
+                error_msg += f". Message: {target.info['message']}"
+            raise RuntimeError(error_msg)
+
+        logger.info(f"Upload processed successfully in {target.elapsed:.1f} seconds")
+        return target.info
+
+    def wait_for_run(self, run_arn: str, timeout: float, project_arn: Optional[str] = None,
+                     initial_interval: Optional[float] = None,
+                     max_interval: Optional[float] = None) -> Dict[str, Any]:
+        """Block until a run completes, raising if the deadline passes"""
+        target = self._wait(run_arn, RUN, project_arn, None, timeout,
+                            initial_interval or self.initial_interval, max_interval or self.max_interval)
+        logger.info(f"Run completed in {target.elapsed:.1f} seconds with result {target.info.get('result')}")
+        return target.info
+
+    def _wait(self, arn: str, kind: str, project_arn: Optional[str], upload_type: Optional[str],
+              timeout: float, initial_interval: float, max_interval: float) -> PollTarget:
+        with self._lock:
+            # Concurrent waiters on the same ARN share one target
+            target = self._pending.get(arn)
+            if target is None:
+                target = PollTarget(arn, kind, project_arn, upload_type, timeout,
+                                    initial_interval, max_interval)
+                self._pending[arn] = target
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='df-status-poller', daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+        target.done.wait()
+        if target.error:
+            raise target.error
+        return target
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+
+                now = time.monotonic()
+                next_due = min(min(t.next_poll_at, t.deadline) for t in self._pending.values())
+                if next_due > now:
+                    # Newly registered targets wake us up early
+                    self._wakeup.wait(timeout=next_due - now)
+                    continue
+
+                due = [t for t in self._pending.values() if t.next_poll_at <= now or t.deadline <= now]
+
+            self._poll(due)
+
+    def _poll(self, due: List[PollTarget]):
+        now = time.monotonic()
+        to_refresh: Dict[Any, List[PollTarget]] = {}
+
+        for target in due:
+            if target.deadline <= now:
+                timeout = target.deadline - target.started_at
+                if target.kind == UPLOAD:
+                    message = f"Upload processing timed out after {timeout:.0f} seconds"
+                else:
+                    message = f"Run did not complete within {timeout:.0f} seconds (last status: {target.status})"
+                self._finish(target, error=TimeoutError(message))
+                continue
+            to_refresh.setdefault(target.group, []).append(target)
+
+        for group, targets in to_refresh.items():
+            kind, project_arn = group
+            with self._lock:
+                # Piggyback every other pending target of the same group on this batch
+                siblings = [t for t in self._pending.values() if t.group == group and t not in targets]
+            targets = targets + siblings
+
+            if project_arn and len(targets) >= self.batch_threshold and group not in self._unbatchable:
+                try:
+                    self._refresh_batch(group, targets)
+                except Exception as e:
+                    self._failed(kind, targets, e)
+                    continue
+                refreshed = targets
+            else:
+                # One target's failed lookup does not hold back the others
+                refreshed = []
+                for target in targets:
+                    try:
+                        self._refresh_single(target)
+                    except Exception as e:
+                        self._failed(kind, [target], e)
+                        continue
+                    refreshed.append(target)
+
+            for target in refreshed:
+                target.errors = 0
+                if target.status in TERMINAL_STATUSES[kind]:
+                    self._finish(target)
+                else:
+                    self._reschedule(target)
+
+    def _refresh_single(self, target: PollTarget):
+        self.api_calls += 1
+        if target.kind == UPLOAD:
+            info = self.devicefarm_client.get_upload(arn=target.arn)['upload']
+        else:
+            info = self.devicefarm_client.get_run(arn=target.arn)['run']
+        self._update(target, info)
+
+    def _refresh_batch(self, group, targets: List[PollTarget]):
+        kind, project_arn = group
+        remaining = {t.arn: t for t in targets}
+        kwargs = {'arn': project_arn}
+        upload_types = {t.upload_type for t in targets}
+        if kind == UPLOAD and len(upload_types) == 1 and None not in upload_types:
+            kwargs['type'] = upload_types.pop()
+
+        for _ in range(self.batch_page_limit):
+            self.api_calls += 1
+            if kind == UPLOAD:
+                response = self.devicefarm_client.list_uploads(**kwargs)
+                items = response.get('uploads', [])
+            else:
+                response = self.devicefarm_client.list_runs(**kwargs)
+                items = response.get('runs', [])
+
+            for info in items:
+                target = remaining.pop(info.get('arn'), None)
+                if target:
+                    self._update(target, info)
+
+            if not remaining or not response.get('nextToken'):
+                break
+            kwargs['nextToken'] = response['nextToken']
+
+        # Anything not found in the first pages falls back to individual lookups, and a
+        # project whose listing is too long to scan cheaply stops being batched
+        if remaining:
+            logger.info(f"Batch status check missed {len(remaining)} {kind}(s), polling them individually")
+            self._unbatchable.add(group)
+        for target in remaining.values():
+            self._refresh_single(target)
+
+    def _update(self, target: PollTarget, info: Dict[str, Any]):
+        target.info = info
+        if info.get('status') != target.status:
+            logger.info(
+                f"{target.kind.capitalize()} {target.arn.split(':')[-1]} status: "
+                f"{info.get('status')} after {target.elapsed:.1f} seconds"
+            )
+            if 'message' in info:
+                logger.info(f"{target.kind.capitalize()} message: {info['message']}")
+        target.status = info.get('status')
+
+    def _failed(self, kind: str, targets: List[PollTarget], error: Exception):
+        """Back off after a failed status check, failing only targets out of retries"""
+        for target in targets:
+            target.errors += 1
+            if target.errors >= self.max_errors:
+                logger.error(f"Error checking {kind} status {target.errors} times in a row: {str(error)}")
+                self._finish(target, error=error)
+            else:
+                logger.warning(
+                    f"Error checking {kind} status (attempt {target.errors} of {self.max_errors}), "
+                    f"retrying: {str(error)}"
+                )
+                self._reschedule(target)
+
+    def _reschedule(self, target: PollTarget):
+        target.interval = min(target.interval * self.backoff, target.max_interval)
+        delay = target.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        target.next_poll_at = time.monotonic() + delay
+
+    def _finish(self, target: PollTarget, error: Optional[BaseException] = None):
+        target.error = error
+        with self._lock:
+            self._pending.pop(target.arn, None)
+        target.done.set()
@@ -0,0 +1,187 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE = 'SystemTests/DeviceFarmRunner'
+
+# Span lines from every thread go to stdout whole
+_emit_lock = threading.Lock()
+
+
+class Span:
+    """One timed phase of a run, with free-form attributes such as a byte count"""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.started_at = time.time()
+        self.seconds: Optional[float] = None
+        self.status = 'ok'
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.seconds = time.perf_counter() - self._started
+        if error is not None:
+            self.status = 'error'
+            self.attributes['error'] = type(error).__name__
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """MB/s for spans that moved a known number of bytes"""
+        size = self.attributes.get('bytes')
+        if not size or not self.seconds:
+            return None
+        return size / (1024 * 1024) / max(self.seconds, 0.001)
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {
+            'span': self.name,
+            'status': self.status,
+            'start': round(self.started_at, 3),
+            'seconds': round(self.seconds or 0.0, 3)
+        }
+        if self.throughput is not None:
+            record['throughput_mbps'] = round(self.throughput, 2)
+        record.update(self.attributes)
+        return record
+
+
+class Tracer:
+    """Records a span per runner phase and emits each one as a single JSON line.
+
+    The line is a structured record of the span (name, duration, status, bytes,
+    throughput and attributes) and at the same time a CloudWatch Embedded Metric
+    Format document, so log groups with EMF extraction turn Duration, Bytes and
+    Throughput into metrics per Phase without a PutMetricData call. Lines are
+    written to stdout without the logging prefix, which EMF requires.
+    """
+
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, enabled: bool = True,
+                 dimensions: Optional[Dict[str, str]] = None, stream: Any = None):
+        self.namespace = namespace
+        self.enabled = enabled
+        self.dimensions = dict(dimensions or {})
+        self.stream = stream
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        span = Span(name, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(error=e)
+            raise
+        else:
+            span.finish()
+        finally:
+            self._record(span)
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """Total time, bytes and count per span name, slowest first"""
+        totals: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            total = totals.setdefault(span.name, {'span': span.name, 'count': 0, 'seconds': 0.0, 'bytes': 0})
+            total['count'] += 1
+            total['seconds'] += span.seconds or 0.0
+            total['bytes'] += span.attributes.get('bytes') or 0
+        for total in totals.values():
+            total['seconds'] = round(total['seconds'], 1)
+        return sorted(totals.values(), key=lambda total: -total['seconds'])
+
+    def log_breakdown(self):
+        for total in self.breakdown():
+            size = f", {total['bytes'] / (1024*1024):.2f} MB" if total['bytes'] else ''
+            logger.info(f"  {total['span']}: {total['seconds']} s over {total['count']} span(s){size}")
+
+    def _record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+        if not self.enabled:
+            return
+
+        record = span.to_dict()
+        metrics = [{'Name': 'Duration', 'Unit': 'Seconds'}]
+        record['Duration'] = record['seconds']
+        if 'throughput_mbps' in record:
+            metrics += [{'Name': 'Bytes', 'Unit': 'Bytes'}, {'Name': 'Throughput', 'Unit': 'Megabytes/Second'}]
+            record['Bytes'] = record['bytes']
+            record['Throughput'] = record['throughput_mbps']
+        record.update(self.dimensions, Phase=span.name)
+        record['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': self.namespace,
+                'Dimensions': [sorted(self.dimensions) + ['Phase']],
+                'Metrics': metrics
+            }]
+        }
+
+        line = json.dumps(record, default=str, separators=(',', ':'))
+        with _emit_lock:
+            stream = self.stream or sys.stdout
+            stream.write(line + '\n')
+            stream.flush()
+
+
+class ProcessProfiler:
+    """cProfile of the main thread and every thread started while it runs.
+
+    cProfile only sees the thread that enabled it, so a threading profile hook
+    starts one profiler per new thread and the results are merged on stop.
+    """
+
+    def __init__(self, output_path: str, top: int = 30):
+        self.output_path = output_path
+        self.top = top
+        self._main = cProfile.Profile()
+        self._threads: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _profile_thread(self, frame: Any, event: str, arg: Any):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from the main profiler already
+            return
+        with self._lock:
+            self._threads.append(profile)
+
+    @contextmanager
+    def profiling(self) -> Iterator['ProcessProfiler']:
+        threading.setprofile(self._profile_thread)
+        self._main.enable()
+        try:
+            yield self
+        finally:
+            self._main.disable()
+            threading.setprofile(None)
+            self._dump()
+
+    def _dump(self):
+        stats = pstats.Stats(self._main)
+        with self._lock:
+            for profile in self._threads:
+                stats.add(profile)
+        stats.dump_stats(self.output_path)
+
+        report = io.StringIO()
+        stats.stream = report
+        stats.sort_stats('cumulative').print_stats(self.top)
+        logger.info(f"Profile of {len(self._threads) + 1} thread(s) written to {self.output_path}\n{report.getvalue()}")
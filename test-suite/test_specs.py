@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# 'install-free' is generated for the uploaded package; 'legacy' is appium-ios-test.yml as shipped
+TEST_SPEC_VARIANTS = ('install-free', 'legacy')
+APPIUM_VERSION = '2.11.5'
+
+# Default capabilities the Appium server starts with, per platform
+APPIUM_CAPABILITIES = {
+    'ios': (
+        '"{\\"appium:deviceName\\": \\"$DEVICEFARM_DEVICE_NAME\\", '
+        '\\"platformName\\": \\"$DEVICEFARM_DEVICE_PLATFORM_NAME\\", '
+        '\\"appium:app\\": \\"$DEVICEFARM_APP_PATH\\", '
+        '\\"appium:udid\\":\\"$DEVICEFARM_DEVICE_UDID_FOR_APPIUM\\", '
+        '\\"appium:platformVersion\\": \\"$DEVICEFARM_DEVICE_OS_VERSION\\", '
+        '\\"appium:derivedDataPath\\": \\"$DEVICEFARM_WDA_DERIVED_DATA_PATH\\", '
+        '\\"appium:usePrebuiltWDA\\": true, '
+        '\\"appium:automationName\\": \\"XCUITest\\"}"'
+    ),
+    'android': (
+        '"{\\"appium:deviceName\\": \\"$DEVICEFARM_DEVICE_NAME\\", '
+        '\\"platformName\\": \\"$DEVICEFARM_DEVICE_PLATFORM_NAME\\", '
+        '\\"appium:app\\": \\"$DEVICEFARM_APP_PATH\\", '
+        '\\"appium:udid\\":\\"$DEVICEFARM_DEVICE_UDID\\", '
+        '\\"appium:platformVersion\\": \\"$DEVICEFARM_DEVICE_OS_VERSION\\", '
+        '\\"appium:chromedriverExecutableDir\\": \\"$DEVICEFARM_CHROMEDRIVER_EXECUTABLE_DIR\\", '
+        '\\"appium:automationName\\": \\"UiAutomator2\\"}"'
+    )
+}
+
+# iOS needs the WebDriverAgent build matching the host's Appium and, before iOS 17, a dashless UDID
+IOS_DEVICE_SETUP = """      - |-
+        if [ $(echo $APPIUM_VERSION | cut -d "." -f2) -ge 11 ];
+        then
+          DEVICEFARM_WDA_DERIVED_DATA_PATH=$DEVICEFARM_WDA_DERIVED_DATA_PATH_V9;
+        else
+          DEVICEFARM_WDA_DERIVED_DATA_PATH=$DEVICEFARM_WDA_DERIVED_DATA_PATH_V8;
+        fi;
+        if [ $(echo $DEVICEFARM_DEVICE_OS_VERSION | cut -d "." -f 1) -le 16 ];
+        then
+          DEVICEFARM_DEVICE_UDID_FOR_APPIUM=$(echo $DEVICEFARM_DEVICE_UDID | tr -d "-");
+        else
+          DEVICEFARM_DEVICE_UDID_FOR_APPIUM=$DEVICEFARM_DEVICE_UDID;
+        fi;
+"""
+
+# Split packages carry only compiled code; their node_modules/ archive is fetched from S3
+DEPENDENCIES_SETUP = """      - |-
+        curl --silent --show-error --fail --retry 3 --output /tmp/system_tests-dependencies.zip "{url}";
+        unzip -q -o /tmp/system_tests-dependencies.zip -d $DEVICEFARM_TEST_PACKAGE_PATH;
+        rm -f /tmp/system_tests-dependencies.zip
+"""
+
+INSTALL_FREE_TEMPLATE = """version: 0.1
+
+# Install-free {platform} test spec generated by the runner (test_specs.py).
+# The uploaded package already contains dist/ and its runtime node_modules, so
+# nothing is installed on the device host: select the preinstalled Node.js and
+# Appium, start Appium, poll it until ready and run the compiled runner directly.
+
+phases:
+  install:
+    commands:
+      - export NVM_DIR=$HOME/.nvm
+      - . $NVM_DIR/nvm.sh
+      - nvm use 20 >/dev/null 2>&1 || nvm install 20
+      - avm {appium_version}
+      - export APPIUM_VERSION={appium_version}
+      - export APPIUM_BASE_PATH=/wd/hub
+{dependencies_setup}
+  pre_test:
+    commands:
+{device_setup}      - |-
+        appium --base-path=$APPIUM_BASE_PATH --log-timestamp \\
+          --log-no-colors --relaxed-security --default-capabilities \\
+          {capabilities} \\
+          >> $DEVICEFARM_LOG_DIR/appium.log 2>&1 &
+      - |-
+        appium_deadline=$((SECONDS + {ready_timeout}));
+        until curl --silent --fail --max-time 1 "http://127.0.0.1:4723${{APPIUM_BASE_PATH}}/status" > /dev/null; do
+          if [ $SECONDS -ge $appium_deadline ]; then
+            echo "Appium did not start within {ready_timeout} seconds. Exiting...";
+            exit 1;
+          fi;
+          sleep {ready_interval};
+        done;
+        echo "Appium ready after $((SECONDS + {ready_timeout} - appium_deadline)) seconds";
+
+  test:
+    commands:
+      - cd $DEVICEFARM_TEST_PACKAGE_PATH/dist
+      - TARGET={target} node wdio/runner.js
+
+  post_test:
+    commands:
+      - cp -R test-results $DEVICEFARM_LOG_DIR/ || echo "No test-results directory found"
+
+artifacts:
+  - $DEVICEFARM_LOG_DIR
+"""
+
+
+def render_install_free_test_spec(platform: str, ready_interval: float = 0.25, ready_timeout: int = 30,
+                                  dependencies_url: Optional[str] = None) -> str:
+    """Test spec for a package that ships its node_modules, for 'ios' or 'android' devices.
+
+    With dependencies_url, node_modules/ comes from that split dependency archive instead.
+    """
+    platform = platform.lower()
+    if platform not in APPIUM_CAPABILITIES:
+        raise ValueError(f"Unsupported platform for test spec: {platform}")
+
+    return INSTALL_FREE_TEMPLATE.format(
+        platform='iOS' if platform == 'ios' else 'Android',
+        appium_version=APPIUM_VERSION,
+        dependencies_setup=DEPENDENCIES_SETUP.format(url=dependencies_url) if dependencies_url else '',
+        device_setup=IOS_DEVICE_SETUP if platform == 'ios' else '',
+        capabilities=APPIUM_CAPABILITIES[platform],
+        ready_interval=f"{ready_interval:g}",
+        ready_timeout=int(ready_timeout),
+        target=f"df.{platform}"
+    )
+
+
+def write_install_free_test_spec(platform: str, ready_interval: float = 0.25, ready_timeout: int = 30,
+                                 dependencies_url: Optional[str] = None) -> str:
+    """Write the install-free spec for a platform and return its path.
+
+    The content only depends on the arguments, so the upload cache keeps reusing a
+    single Device Farm upload per project, and the path is named after the content
+    so concurrent runners never overwrite each other's spec.
+    """
+    content = render_install_free_test_spec(platform, ready_interval, ready_timeout, dependencies_url)
+    spec_dir = os.path.join(tempfile.gettempdir(), 'devicefarm-test-specs')
+    os.makedirs(spec_dir, exist_ok=True)
+
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+    spec_path = os.path.join(spec_dir, f"appium-{platform.lower()}-install-free-{content_hash}.yml")
+    fd, tmp_path = tempfile.mkstemp(dir=spec_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, spec_path)
+
+    logger.info(f"Generated install-free {platform} test spec at: {spec_path}")
+    return spec_path
+
+
+def dependency_archive_url(base_url: str, key: str) -> str:
+    """Unsigned URL of a staged dependency archive.
+
+    It only depends on the archive's key, which is named after its content hash,
+    so every runner and the deploy-time pre-staging render the same spec for the
+    same dependencies, and the URL outlives the credentials of whoever staged it.
+    """
+    return f"{base_url.rstrip('/')}/{key}"
+
+
+def stage_dependency_archive(s3_client: Any, bucket: str, key: str, archive_path: str) -> bool:
+    """Upload a dependency archive unless it is already staged; True if it was uploaded"""
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+        logger.info(f"Dependency archive already staged at s3://{bucket}/{key}")
+        return False
+    except Exception:
+        pass
+
+    size = os.path.getsize(archive_path)
+    logger.info(f"Staging dependency archive ({size / (1024*1024):.2f} MB) at s3://{bucket}/{key}")
+    s3_client.upload_file(archive_path, bucket, key)
+    return True
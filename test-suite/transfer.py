@@ -0,0 +1,128 @@
+import logging
+import os
+import random
+import socket
+import time
+from typing import Dict, Any, Callable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Pre-signed S3 PUTs that are worth repeating: throttling and server-side errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+SOCKET_BUFFER = 4 * 1024 * 1024
+BLOCK_SIZE = 1024 * 1024
+
+Body = Union[str, Any, Callable[[], Any]]
+
+
+def create_session(pool_size: int = 32, socket_buffer: int = SOCKET_BUFFER, block_size: int = BLOCK_SIZE) -> Any:
+    """A requests session with a larger keep-alive pool and tuned sockets.
+
+    Connections keep TCP keep-alive on and Nagle off, and ask for socket_buffer-sized
+    send and receive buffers so one connection can fill a long, fat pipe such as
+    the path to Device Farm's us-west-2 bucket. File bodies are written in
+    block_size pieces rather than http.client's 8 KB.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection
+    from urllib3.poolmanager import PoolKey
+
+    socket_options = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        (socket.SOL_SOCKET, socket.SO_SNDBUF, socket_buffer),
+        (socket.SOL_SOCKET, socket.SO_RCVBUF, socket_buffer),
+    ]
+    # urllib3 1.x cannot pass a block size through to its connections
+    connection_kwargs = {'blocksize': block_size} if 'key_blocksize' in PoolKey._fields else {}
+
+    class TunedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs['socket_options'] = socket_options
+            kwargs.update(connection_kwargs)
+            super().init_poolmanager(*args, **kwargs)
+
+    session = requests.Session()
+    adapter = TunedAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class PresignedUploader:
+    """PUTs bodies to pre-signed URLs, retrying transient failures with backoff.
+
+    The body is a file path, a seekable file object, or a callable that returns a
+    fresh body (such as a new S3 stream) for every attempt; files are reopened or
+    rewound so a retried PUT always sends the whole object. Connection resets,
+    timeouts and 429/5xx responses are retried up to `attempts` times with
+    jittered exponential backoff; other 4xx responses fail straight away.
+    """
+
+    def __init__(self, session: Any, attempts: int = 4, backoff: float = 1.0, max_backoff: float = 20.0,
+                 timeout: Any = (10, 300)):
+        self.session = session
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+    def put(self, url: str, body: Body, size: Optional[int] = None,
+            headers: Optional[Dict[str, str]] = None, label: str = 'upload') -> Dict[str, Any]:
+        """PUT body to url and return the transfer's bytes, attempts, seconds and throughput"""
+        import requests
+
+        if isinstance(body, str) and size is None:
+            size = os.path.getsize(body)
+        start_position = body.tell() if hasattr(body, 'seek') and not callable(body) else None
+        if start_position is not None and size is None:
+            size = body.seek(0, os.SEEK_END) - start_position
+        # A plain stream cannot be sent twice, so it gets a single attempt
+        attempts = self.attempts if isinstance(body, str) or callable(body) or start_position is not None else 1
+
+        started = time.perf_counter()
+        for attempt in range(1, attempts + 1):
+            attempt_started = time.perf_counter()
+            try:
+                if isinstance(body, str):
+                    with open(body, 'rb') as f:
+                        response = self.session.put(url, data=f, headers=headers or {}, timeout=self.timeout)
+                else:
+                    if start_position is not None:
+                        body.seek(start_position)
+                    data = body() if callable(body) else body
+                    response = self.session.put(url, data=data, headers=headers or {}, timeout=self.timeout)
+
+                if response.status_code in RETRYABLE_STATUS and attempt < attempts:
+                    raise _RetryableStatus(response)
+                response.raise_for_status()
+                break
+            except (requests.ConnectionError, requests.Timeout, _RetryableStatus) as e:
+                if attempt == attempts:
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"PUT of {label} failed after {time.perf_counter() - attempt_started:.1f} s "
+                    f"(attempt {attempt}/{attempts}): {str(e)}; retrying in {delay:.1f} s"
+                )
+                time.sleep(delay)
+
+        seconds = time.perf_counter() - started
+        metrics = {
+            'bytes': size,
+            'attempts': attempt,
+            'seconds': round(seconds, 3),
+            'throughput_mbps': round(size / (1024 * 1024) / max(seconds, 0.001), 2) if size else None
+        }
+        logger.info(
+            f"PUT {label}: {(size or 0) / (1024*1024):.2f} MB in {metrics['seconds']} s"
+            + (f" ({metrics['throughput_mbps']} MB/s)" if size else '')
+            + (f" after {attempt} attempts" if attempt > 1 else '')
+        )
+        return metrics
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, response: Any):
+        super().__init__(f"HTTP {response.status_code} {response.reason}")
+        self.response = response
@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from cache_store import JsonCacheStore
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(file_path: str) -> str:
+    """Compute the SHA-256 hex digest of a file without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """Content-addressed cache of Device Farm upload ARNs.
+
+    Entries are keyed by content SHA-256, project ARN and Device Farm upload type.
+    A cached ARN is only handed out while Device Farm still reports the upload as
+    SUCCEEDED; anything else evicts the entry.
+    """
+
+    ENTRIES_KEY = 'uploads'
+
+    def __init__(self, devicefarm_client: Any, store: JsonCacheStore):
+        self.devicefarm_client = devicefarm_client
+        self.store = store
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        # Concurrent workflow steps share one cache instance
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def cache_key(content_hash: str, project_arn: str, upload_type: str) -> str:
+        return f"{project_arn}|{upload_type}|{content_hash}"
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            if self._entries is None:
+                self._entries = dict(self.store.load().get(self.ENTRIES_KEY, {}))
+                logger.info(f"Loaded {len(self._entries)} cached Device Farm uploads")
+            return self._entries
+
+    def lookup(self, content_hash: str, project_arn: str, upload_type: str) -> Optional[str]:
+        """Return a reusable upload ARN for this content, or None on a cache miss"""
+        key = self.cache_key(content_hash, project_arn, upload_type)
+        entry = self.entries.get(key)
+        if not entry:
+            logger.info(f"Upload cache miss for {upload_type} ({content_hash[:12]})")
+            return None
+
+        upload_arn = entry['arn']
+        try:
+            status = self.devicefarm_client.get_upload(arn=upload_arn)['upload']['status']
+        except Exception as e:
+            logger.info(f"Cached upload {upload_arn} is no longer available: {str(e)}")
+            status = None
+
+        if status != 'SUCCEEDED':
+            logger.info(f"Evicting cached upload {upload_arn} (status: {status})")
+            with self._lock:
+                self.entries.pop(key, None)
+                self._save(deleted_keys=[key])
+            return None
+
+        logger.info(f"Upload cache hit for {upload_type} ({content_hash[:12]}): {upload_arn}")
+        return upload_arn
+
+    def store_upload(self, content_hash: str, project_arn: str, upload_type: str, upload_arn: str):
+        """Remember a processed upload so later runs can reuse it"""
+        key = self.cache_key(content_hash, project_arn, upload_type)
+        with self._lock:
+            self.entries[key] = {
+                'arn': upload_arn,
+                'sha256': content_hash,
+                'project_arn': project_arn,
+                'type': upload_type,
+                'stored_at': int(time.time())
+            }
+            self._save()
+
+    def _save(self, deleted_keys=()):
+        document = self.store.save(
+            {self.ENTRIES_KEY: self.entries},
+            merge_key=self.ENTRIES_KEY,
+            deleted_keys=deleted_keys
+        )
+        self._entries = dict(document.get(self.ENTRIES_KEY, {}))
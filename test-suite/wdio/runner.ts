@@ -1,5 +1,6 @@
 import { Launcher } from '@wdio/cli';
 import * as fs from 'fs';
+import * as path from 'path';
 
 /**
  * Dynamic WebdriverIO Configuration Runner
@@ -8,6 +9,9 @@ import * as fs from 'fs';
  * Usage:
  * TARGET=ios ts-node wdio/runner.ts
  * TARGET=df.ios node dist/wdio/runner.js
+ * TARGET=df.android node dist/wdio/runner.js
+ *
+ * Configs are resolved next to this file, so the runner works from any directory.
  */
 
 async function runTests() {
@@ -22,6 +26,7 @@ async function runTests() {
       console.log('📋 Available targets:');
       console.log('   TARGET=ios - Local iOS simulator testing');
       console.log('   TARGET=df.ios - AWS Device Farm iOS testing');
+      console.log('   TARGET=df.android - AWS Device Farm Android testing');
       console.log('');
       console.log('💡 Example usage:');
       console.log('   TARGET=ios ts-node wdio/runner.ts');
@@ -34,19 +39,10 @@ async function runTests() {
     const isCompiledMode = __filename.endsWith('.js');
     const isDeviceFarm = target.startsWith('df.') || process.env.DEVICEFARM_DEVICE_POOL_ARN;
     
-    let configPath: string;
-    
-    if (isDeviceFarm) {
-      // Device Farm specific path handling
-      configPath = `./wdio/configs/${target}.config.js`;
-      console.log(`📁 Looking for config at: ${process.cwd()}/${configPath}`);
-    } else {
-      // Local development
-      const configDir = isCompiledMode ? './wdio/configs' : './wdio/configs';
-      const configExtension = isCompiledMode ? '.js' : '.ts';
-      configPath = `${configDir}/${target}.config${configExtension}`;
-      console.log(`📁 Looking for config at: ${process.cwd()}/${configPath}`);
-    }
+    const configDir = path.join(__dirname, 'configs');
+    const configExtension = isCompiledMode ? '.js' : '.ts';
+    const configPath = path.join(configDir, `${target}.config${configExtension}`);
+    console.log(`📁 Looking for config at: ${configPath}`);
 
     // Check if config file exists
     if (!fs.existsSync(configPath)) {
@@ -55,7 +51,6 @@ async function runTests() {
       
       // List available config files
       try {
-        const configDir = './wdio/configs';
         const files = fs.readdirSync(configDir);
         const configFiles = files
           .filter(file => file.endsWith('.config.ts') || file.endsWith('.config.js'))
@@ -80,9 +75,6 @@ async function runTests() {
       console.log(`📋 Working directory: ${process.cwd()}`);
     }
     
-    // Create WebdriverIO launcher with the config file path
-    const launcher = new Launcher(configPath);
-    
     // Handle command line arguments (e.g., --spec)
     const args = process.argv.slice(2);
     
@@ -90,6 +82,15 @@ async function runTests() {
       console.log(`🎯 Running with arguments: ${args.join(' ')}`);
     }
 
+    // Sharded Device Farm runs pass their subset of spec files with --spec
+    const specs = parseSpecArgs(args);
+    if (specs.length > 0) {
+      console.log(`🧩 Running ${specs.length} spec file(s) of this shard`);
+    }
+    
+    // Create WebdriverIO launcher with the config file path
+    const launcher = new Launcher(configPath, specs.length > 0 ? { spec: specs } : {});
+
     // Run the tests
     const exitCode = await launcher.run();
     
@@ -104,6 +105,23 @@ async function runTests() {
   }
 }
 
+/**
+ * Collect spec files from `--spec <file>` and `--spec=<file>` arguments
+ */
+function parseSpecArgs(args: string[]): string[] {
+  const specs: string[] = [];
+
+  for (let i = 0; i < args.length; i++) {
+    if (args[i] === '--spec' && i + 1 < args.length) {
+      specs.push(args[++i]);
+    } else if (args[i].startsWith('--spec=')) {
+      specs.push(args[i].slice('--spec='.length));
+    }
+  }
+
+  return specs;
+}
+
 // Execute if this file is run directly
 if (require.main === module) {
   runTests().catch((error) => {
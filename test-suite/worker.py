@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from handler import DeviceFarmTestRunner, configure_logging, execute_app_group, fanout_enabled, get_aws_client
+from status_poller import StatusPoller
+
+logger = logging.getLogger(__name__)
+
+
+def delivery_settings(message_id: str, sent_at: float, receive_count: int) -> Dict[str, str]:
+    """Runner settings that name a request's runs after its message, and resume them on redelivery"""
+    return {
+        'RUN_REQUEST_ID': f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(sent_at))}-{message_id[:8]}",
+        'RUN_RESUME': 'true' if receive_count > 1 else 'false'
+    }
+
+
+class LocalQueue:
+    """In-memory stand-in for the run request queue, for tests and local runs"""
+
+    def __init__(self, max_receive_count: int = 3):
+        self.max_receive_count = max_receive_count
+        self.dead_letters: List[Dict[str, Any]] = []
+        self._messages: queue.Queue = queue.Queue()
+        self._in_flight: Dict[str, Tuple[str, int, Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def send(self, body: Dict[str, Any]):
+        self._messages.put((json.dumps(body), 0, {'message_id': str(uuid.uuid4()), 'sent_at': time.time()}))
+
+    def receive(self, max_messages: int, wait_seconds: float) -> List[Tuple[str, Dict[str, Any]]]:
+        messages = []
+        try:
+            messages.append(self._messages.get(timeout=wait_seconds))
+            while len(messages) < max_messages:
+                messages.append(self._messages.get_nowait())
+        except queue.Empty:
+            pass
+
+        received = []
+        with self._lock:
+            for body, receive_count, message in messages:
+                receipt = str(uuid.uuid4())
+                self._in_flight[receipt] = (body, receive_count + 1, message)
+                received.append((receipt, dict(
+                    json.loads(body), **delivery_settings(message['message_id'], message['sent_at'], receive_count + 1)
+                )))
+        return received
+
+    def delete(self, receipt: str):
+        with self._lock:
+            self._in_flight.pop(receipt, None)
+
+    def release(self, receipt: str):
+        """Make a failed message visible again, or dead-letter it like an SQS redrive policy"""
+        with self._lock:
+            message = self._in_flight.pop(receipt, None)
+            if message is None:
+                return
+            body, receive_count, _ = message
+            if receive_count >= self.max_receive_count:
+                self.dead_letters.append(json.loads(body))
+            else:
+                self._messages.put(message)
+
+    def extend(self, receipt: str, seconds: int):
+        pass
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return self._messages.qsize() + len(self._in_flight)
+
+
+class SqsQueue:
+    """Run request queue backed by SQS long polling"""
+
+    def __init__(self, queue_url: str, visibility_timeout: int = 300):
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.sqs_client = get_aws_client('sqs', region_name=os.getenv('AWS_REGION', 'us-west-2'))
+
+    def send(self, body: Dict[str, Any]):
+        self.sqs_client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(body))
+
+    def receive(self, max_messages: int, wait_seconds: float) -> List[Tuple[str, Dict[str, Any]]]:
+        response = self.sqs_client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=max(1, min(max_messages, 10)),
+            WaitTimeSeconds=int(min(wait_seconds, 20)),
+            VisibilityTimeout=self.visibility_timeout,
+            AttributeNames=['ApproximateReceiveCount', 'SentTimestamp']
+        )
+        return [
+            (message['ReceiptHandle'], dict(json.loads(message['Body']), **delivery_settings(
+                message['MessageId'],
+                int(message['Attributes']['SentTimestamp']) / 1000,
+                int(message['Attributes']['ApproximateReceiveCount'])
+            )))
+            for message in response.get('Messages', [])
+        ]
+
+    def delete(self, receipt: str):
+        self.sqs_client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+    def release(self, receipt: str):
+        # Left for SQS to redeliver, and eventually move to the dead-letter queue
+        pass
+
+    def extend(self, receipt: str, seconds: int):
+        self.sqs_client.change_message_visibility(
+            QueueUrl=self.queue_url, ReceiptHandle=receipt, VisibilityTimeout=seconds
+        )
+
+
+class RunWorker:
+    """Long-lived worker that executes run requests from a queue.
+
+    Each message carries the same settings the trigger passes to CodeBuild
+    (S3_BUCKET, APP_FILE_PATH, APP_TYPE and optionally APP_FILES). AWS clients,
+    the HTTP session, the status poller and the per-bucket upload cache and device
+    catalog stay warm across runs, and up to `concurrency` workflows run at once.
+    Only the outcomes of the last `keep_results` requests are kept, so a worker
+    that runs for weeks does not grow without bound.
+
+    Runs are named after the message that requested them. A worker stopped
+    before its runs finish leaves them running on Device Farm, and the worker
+    that receives the redelivered message monitors those runs instead of
+    scheduling them again.
+    """
+
+    def __init__(self, run_queue: Any, concurrency: int = 4, runner_factory: Any = DeviceFarmTestRunner,
+                 keep_results: int = 100):
+        self.run_queue = run_queue
+        self.concurrency = concurrency
+        self.runner_factory = runner_factory
+        self.status_poller = StatusPoller(
+            get_aws_client('devicefarm'),
+            initial_interval=float(os.getenv('POLL_INITIAL_INTERVAL', '1')),
+            max_interval=float(os.getenv('POLL_MAX_INTERVAL', '15'))
+        )
+        self.results: deque = deque(maxlen=keep_results)
+        self._stop = threading.Event()
+        self._drained = threading.Event()
+        self._slots = threading.Semaphore(concurrency)
+        self._shared_by_bucket: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """Stop taking requests; in-flight ones keep their messages until they finish or the task is killed"""
+        logger.info("Worker no longer taking run requests")
+        self._stop.set()
+
+    def run(self, idle_exit_seconds: Optional[float] = None):
+        """Consume messages until stopped, or until the queue stays empty for idle_exit_seconds"""
+        logger.info(f"Worker started with concurrency {self.concurrency}")
+        heartbeat = threading.Thread(target=self._heartbeat, name='worker-heartbeat', daemon=True)
+        heartbeat.start()
+        idle_since = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='worker') as executor:
+            while not self._stop.is_set():
+                # Only take messages we have a free slot for
+                self._slots.acquire()
+                if self._stop.is_set():
+                    self._slots.release()
+                    break
+                available = 1
+                while available < self.concurrency and self._slots.acquire(blocking=False):
+                    available += 1
+
+                messages = self.run_queue.receive(available, wait_seconds=5 if idle_exit_seconds else 20)
+                for _ in range(available - len(messages)):
+                    self._slots.release()
+
+                if messages:
+                    idle_since = time.monotonic()
+                elif idle_exit_seconds and time.monotonic() - idle_since >= idle_exit_seconds and not self._in_flight:
+                    logger.info("Queue idle, worker exiting")
+                    break
+
+                for receipt, body in messages:
+                    with self._lock:
+                        self._in_flight[receipt] = time.monotonic()
+                    executor.submit(self._process, receipt, body)
+
+        self._stop.set()
+        self._drained.set()
+        return list(self.results)
+
+    def _process(self, receipt: str, body: Dict[str, Any]):
+        start_time = time.monotonic()
+        label = body.get('APP_FILE_PATH', 'unknown app')
+        try:
+            logger.info(f"Processing run request for {label}")
+            app_files = body.get('APP_FILES') or []
+            if isinstance(app_files, str):
+                app_files = json.loads(app_files)
+            if body.get('RUN_REQUEST_ID'):
+                # Every app of a group needs run names of its own
+                app_files = [
+                    dict(app, RUN_REQUEST_ID=f"{body['RUN_REQUEST_ID']}-{index}")
+                    for index, app in enumerate(app_files, 1)
+                ]
+
+            if len(app_files) > 1 and not fanout_enabled():
+                settings = {key: value for key, value in body.items() if key != 'APP_FILES'}
+                result = execute_app_group(
+                    app_files,
+                    runner_factory=lambda app: self._create_runner(dict(settings, **app))
+                )
+            else:
+                result = self._create_runner(body).execute()
+
+            self.run_queue.delete(receipt)
+            logger.info(f"Run request for {label} finished in {time.monotonic() - start_time:.1f} seconds")
+            self.results.append({'request': body, 'result': result})
+        except Exception as e:
+            logger.error(f"Run request for {label} failed: {str(e)}")
+            self.run_queue.release(receipt)
+            self.results.append({'request': body, 'error': str(e)})
+        finally:
+            with self._lock:
+                self._in_flight.pop(receipt, None)
+            self._slots.release()
+
+    def _create_runner(self, overrides: Dict[str, str]) -> Any:
+        """Build a runner that reuses the warm state of earlier runs for the same bucket"""
+        bucket = overrides.get('S3_BUCKET') or os.getenv('S3_BUCKET', '')
+        with self._lock:
+            shared = self._shared_by_bucket.get(bucket, {})
+            runner = self.runner_factory(overrides, status_poller=self.status_poller, **shared)
+            self._shared_by_bucket.setdefault(bucket, {
+                'upload_cache': runner.upload_cache,
+                'device_catalog': runner.device_catalog
+            })
+        return runner
+
+    def _heartbeat(self, interval: float = 60, visibility: int = 300):
+        """Keep in-flight messages invisible while their (possibly hour-long) runs continue.
+
+        This carries on after stop() until the last request is done. Once stopping,
+        messages are only extended to the next beat, so if the task is killed first
+        they come back soon and another worker resumes their runs.
+        """
+        while not self._drained.wait(interval):
+            seconds = int(interval * 2) if self._stop.is_set() else visibility
+            with self._lock:
+                receipts = list(self._in_flight)
+            for receipt in receipts:
+                try:
+                    self.run_queue.extend(receipt, seconds)
+                except Exception as e:
+                    logger.warning(f"Failed to extend message visibility: {str(e)}")
+
+
+def main():
+    configure_logging()
+
+    queue_url = os.getenv('WORKER_QUEUE_URL')
+    if not queue_url:
+        raise ValueError("Required environment variable not set: WORKER_QUEUE_URL")
+
+    worker = RunWorker(SqsQueue(queue_url), concurrency=int(os.getenv('WORKER_CONCURRENCY', '4')))
+
+    # ECS sends SIGTERM on scale-in and deployments, and kills the task two minutes later
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import hashlib
+import logging
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 1980-01-01 00:00:00 in MS-DOS date/time format
+DOS_TIME = 0
+DOS_DATE = (1 << 5) | 1
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+
+# Small files are compressed in batches so per-task overhead does not dominate
+BATCH_BYTES = 1024 * 1024
+BATCH_FILES = 64
+
+# (name, source, mode, crc32, size, compressed size, compressed data or None if not kept)
+CompressedEntry = Tuple[str, str, int, int, int, int, Optional[bytes]]
+
+
+def _compress_file(source: str, level: int) -> Tuple[int, int, bytes]:
+    """Raw-deflate a whole file, returning (crc32, uncompressed size, compressed data)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = 0
+    size = 0
+    chunks = []
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            chunks.append(compressor.compress(chunk))
+    chunks.append(compressor.flush())
+    return crc, size, b''.join(chunks)
+
+
+def _compress_batch(batch: List[Tuple[str, str]], level: int) -> List[Tuple[str, str, int, int, bytes]]:
+    return [(name, source) + _compress_file(source, level) for name, source in batch]
+
+
+def _batches(entries: Iterable[Tuple[str, str]]) -> Iterator[List[Tuple[str, str]]]:
+    batch: List[Tuple[str, str]] = []
+    batch_bytes = 0
+    for name, source in entries:
+        batch.append((name, source))
+        batch_bytes += os.path.getsize(source)
+        if batch_bytes >= BATCH_BYTES or len(batch) >= BATCH_FILES:
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
+
+
+def _file_mode(source: str) -> int:
+    return 0o755 if os.access(source, os.X_OK) else 0o644
+
+
+class SizedBody:
+    """Iterable request body with a known length, so requests sends Content-Length instead of chunks"""
+
+    def __init__(self, chunks: Iterable[bytes], length: int):
+        self._chunks = chunks
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self._chunks)
+
+
+class StreamingZipWriter:
+    """Deterministic zip writer that compresses entries on a thread pool and streams the result.
+
+    Entries are (archive name, source path) pairs and are read in place, so no staging
+    copy is needed. zlib releases the GIL, so a thread per core compresses in parallel;
+    completed entries are emitted strictly in order from a bounded window. The output
+    is a plain stream of bytes that can go to a file or an HTTP body, with ZIP64
+    records only where the archive outgrows the classic format.
+    """
+
+    def __init__(self, workers: Optional[int] = None, level: int = 6, window: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 2
+        self.level = level
+        self.window = window or self.workers * 4
+
+    def write_to(self, output_path: str, entries: List[Tuple[str, str]]) -> Tuple[str, int]:
+        """Write the archive to a file atomically, returning (sha256, size)"""
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            digest, size = self._drain(self.iter_archive(self._compressed(sorted(entries))), f.write)
+        os.replace(tmp_path, output_path)
+        return digest, size
+
+    def upload_to(self, url: str, entries: List[Tuple[str, str]], uploader: Any,
+                  headers: Optional[dict] = None, memory_budget: int = 256 * 1024 * 1024) -> Tuple[str, int]:
+        """Stream the archive into a pre-signed PUT through a transfer.PresignedUploader, returning (sha256, size).
+
+        Pre-signed S3 PUTs need a Content-Length up front, so a first pass compresses
+        every entry to learn the compressed sizes. Compressed data is kept for the
+        second pass up to memory_budget; anything beyond that is compressed again,
+        which zlib does byte-for-byte identically. That also lets a retried PUT
+        regenerate the archive from the start.
+        """
+        entries = sorted(entries)
+        planned: List[CompressedEntry] = []
+        kept = 0
+        for name, source, mode, crc, size, compressed_size, data in self._compressed(entries):
+            if kept + compressed_size > memory_budget:
+                data = None
+            else:
+                kept += compressed_size
+            planned.append((name, source, mode, crc, size, compressed_size, data))
+
+        length = self.archive_length(planned)
+        logger.info(f"Streaming {len(planned)} entries ({length / (1024*1024):.2f} MB) to pre-signed URL")
+
+        digests = []
+
+        def body() -> SizedBody:
+            digest = hashlib.sha256()
+            digests.append(digest)
+
+            def chunks() -> Iterator[bytes]:
+                for chunk in self.iter_archive(self._refill(planned)):
+                    digest.update(chunk)
+                    yield chunk
+            return SizedBody(chunks(), length)
+
+        uploader.put(url, body, size=length, headers=headers, label='test package')
+        return digests[-1].hexdigest(), length
+
+    def iter_archive(self, compressed: Iterable[CompressedEntry]) -> Iterator[bytes]:
+        """Yield the archive bytes for already-compressed entries, in order"""
+        offset = 0
+        central = []
+        for name, source, mode, crc, size, compressed_size, data in compressed:
+            header = self._local_header(name, crc, size, compressed_size)
+            central.append(self._central_header(name, mode, crc, size, compressed_size, offset))
+            yield header
+            yield data
+            offset += len(header) + compressed_size
+
+        directory = b''.join(central)
+        yield directory
+        yield self._end_records(len(central), len(directory), offset)
+
+    def archive_length(self, planned: List[CompressedEntry]) -> int:
+        """Total archive size for planned entries, without producing any bytes"""
+        offset = 0
+        directory_size = 0
+        for name, source, mode, crc, size, compressed_size, data in planned:
+            directory_size += len(self._central_header(name, mode, crc, size, compressed_size, offset))
+            offset += len(self._local_header(name, crc, size, compressed_size)) + compressed_size
+        return offset + directory_size + len(self._end_records(len(planned), directory_size, offset))
+
+    def _compressed(self, entries: List[Tuple[str, str]]) -> Iterator[CompressedEntry]:
+        """Compress entries on the pool, yielding them in input order from a bounded window"""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='zip') as pool:
+            pending: Deque[Any] = deque()
+            remaining = _batches(entries)
+
+            def submit_next():
+                for batch in remaining:
+                    pending.append(pool.submit(_compress_batch, batch, self.level))
+                    return
+
+            for _ in range(self.window):
+                submit_next()
+            while pending:
+                results = pending.popleft().result()
+                submit_next()
+                for name, source, crc, size, data in results:
+                    yield name, source, _file_mode(source), crc, size, len(data), data
+
+    def _refill(self, planned: List[CompressedEntry]) -> Iterator[CompressedEntry]:
+        """Planned entries with the data that did not fit in memory compressed again"""
+        missing = [(entry[0], entry[1]) for entry in planned if entry[6] is None]
+        recompressed = self._compressed(missing) if missing else iter(())
+        for entry in planned:
+            if entry[6] is None:
+                again = next(recompressed)
+                if again[3:6] != entry[3:6]:
+                    raise RuntimeError(f"{entry[0]} changed while it was being packaged")
+                entry = again
+            yield entry
+
+    def _local_header(self, name: str, crc: int, size: int, compressed_size: int) -> bytes:
+        encoded, flags = self._encode_name(name)
+        extra = b''
+        version = ZIP_VERSION
+        if size >= ZIP32_LIMIT or compressed_size >= ZIP32_LIMIT:
+            extra = struct.pack('<HHQQ', 0x0001, 16, size, compressed_size)
+            size = compressed_size = ZIP32_LIMIT
+            version = ZIP64_VERSION
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, version, flags, zlib.DEFLATED, DOS_TIME, DOS_DATE,
+            crc, compressed_size, size, len(encoded), len(extra)
+        ) + encoded + extra
+
+    def _central_header(self, name: str, mode: int, crc: int, size: int, compressed_size: int,
+                        offset: int) -> bytes:
+        encoded, flags = self._encode_name(name)
+        zip64_fields = []
+        if size >= ZIP32_LIMIT:
+            zip64_fields.append(size)
+            size = ZIP32_LIMIT
+        if compressed_size >= ZIP32_LIMIT:
+            zip64_fields.append(compressed_size)
+            compressed_size = ZIP32_LIMIT
+        if offset >= ZIP32_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP32_LIMIT
+        extra = b''
+        version = ZIP_VERSION
+        if zip64_fields:
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', 0x0001, 8 * len(zip64_fields), *zip64_fields)
+            version = ZIP64_VERSION
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, flags, zlib.DEFLATED,
+            DOS_TIME, DOS_DATE, crc, compressed_size, size, len(encoded), len(extra), 0, 0, 0,
+            (0o100000 | mode) << 16, offset
+        ) + encoded + extra
+
+    def _end_records(self, count: int, directory_size: int, directory_offset: int) -> bytes:
+        records = b''
+        if count >= 0xFFFF or directory_size >= ZIP32_LIMIT or directory_offset >= ZIP32_LIMIT:
+            zip64_end_offset = directory_offset + directory_size
+            records += struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, (3 << 8) | ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                count, count, directory_size, directory_offset
+            )
+            records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+            count = min(count, 0xFFFF)
+            directory_size = min(directory_size, ZIP32_LIMIT)
+            directory_offset = min(directory_offset, ZIP32_LIMIT)
+        return records + struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, count, count, directory_size, directory_offset, 0
+        )
+
+    @staticmethod
+    def _encode_name(name: str) -> Tuple[bytes, int]:
+        try:
+            return name.encode('ascii'), 0
+        except UnicodeEncodeError:
+            # General purpose flag bit 11: the name is UTF-8
+            return name.encode('utf-8'), 0x800
+
+    @staticmethod
+    def _drain(chunks: Iterable[bytes], write: Callable[[bytes], Any]) -> Tuple[str, int]:
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in chunks:
+            digest.update(chunk)
+            size += len(chunk)
+            write(chunk)
+        return digest.hexdigest(), size